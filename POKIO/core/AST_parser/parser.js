@@ -1,16 +1,15 @@
 // parser.js
+//
+// Usage:
+//   node parser.js <file>      one-shot mode, prints a single JSON result
+//   node parser.js --worker    worker mode, reads JSON lines {"id", "file"} from stdin
+//                              and answers each with {"id", "imports", "exports", "error"}
 const fs = require('fs');
+const readline = require('readline');
 const parser = require('@babel/parser');
 const traverse = require('@babel/traverse').default;
 
-const filePath = process.argv[2];
-
-if (!filePath) {
-    console.error(JSON.stringify({ error: "No file path provided." }));
-    process.exit(1);
-}
-
-try {
+function parseFile(filePath) {
     const content = fs.readFileSync(filePath, 'utf-8');
     const ast = parser.parse(content, {
         sourceType: 'module',
@@ -53,13 +52,49 @@ try {
         }
     });
 
-    console.log(JSON.stringify({
-        imports: [...imports],
-        exports: [...exports],
-        error: null
-    }));
+    return { imports: [...imports], exports: [...exports], error: null };
+}
+
+function runWorker() {
+    const rl = readline.createInterface({ input: process.stdin, terminal: false });
 
-} catch (e) {
-    console.error(JSON.stringify({ error: e.message, imports: [], exports: [] }));
-    process.exit(1);
-}
\ No newline at end of file
+    rl.on('line', (line) => {
+        if (!line.trim()) {
+            return;
+        }
+        let request;
+        try {
+            request = JSON.parse(line);
+        } catch (e) {
+            process.stdout.write(JSON.stringify({ id: null, error: `Invalid request: ${e.message}`, imports: [], exports: [] }) + '\n');
+            return;
+        }
+        let response;
+        try {
+            response = { id: request.id, ...parseFile(request.file) };
+        } catch (e) {
+            response = { id: request.id, error: e.message, imports: [], exports: [] };
+        }
+        process.stdout.write(JSON.stringify(response) + '\n');
+    });
+
+    rl.on('close', () => process.exit(0));
+}
+
+const arg = process.argv[2];
+
+if (arg === '--worker') {
+    runWorker();
+} else {
+    if (!arg) {
+        console.error(JSON.stringify({ error: "No file path provided." }));
+        process.exit(1);
+    }
+
+    try {
+        console.log(JSON.stringify(parseFile(arg)));
+    } catch (e) {
+        console.error(JSON.stringify({ error: e.message, imports: [], exports: [] }));
+        process.exit(1);
+    }
+}
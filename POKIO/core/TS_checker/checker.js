@@ -0,0 +1,300 @@
+// checker.js
+//
+// Persistent incremental TypeScript checker, the warm equivalent of `tsc -b --noEmit`.
+//
+// Usage:
+//   node checker.js <project_root>
+//
+// Uses the project's own `typescript` package. Speaks JSON lines over stdin/stdout:
+//   startup:  {"ready": true, "version": "5.7.2"}   or   {"ready": false, "error": "..."}
+//   request:  {"id": 1, "cmd": "check", "changed": ["/abs/path/to/File.tsx", ...],
+//              "overlay": {"/abs/path/to/File.tsx": "<content>", "/abs/path/to/Old.tsx": null}}
+//   response: {"id": 1, "diagnostics": [{file, line, column, code, category, message, related}], "error": null}
+//             where `related` lists {file, line, column, message} spans (e.g. "The expected type comes from ...")
+//
+// `changed` is a hint that forces re-reading those files; every other project file is
+// still validated by mtime, so edits made outside POKIO are picked up as well.
+//
+// `overlay` (optional) type-checks proposed contents without writing them: a string
+// replaces the file's content on disk (or creates it), null hides the file. Overlay
+// files only apply to that one request; the next request reads them from disk again.
+const fs = require('fs');
+const path = require('path');
+const readline = require('readline');
+
+const projectRoot = path.resolve(process.argv[2] || '.');
+
+function send(message) {
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+let ts;
+try {
+    ts = require(require.resolve('typescript', { paths: [projectRoot] }));
+} catch (e) {
+    send({ ready: false, error: `Could not load the project's typescript package: ${e.message}` });
+    process.exit(1);
+}
+
+// Files that never change during a session are cached without mtime checks
+const immutableDirs = [path.dirname(ts.getDefaultLibFilePath({})), path.join(projectRoot, 'node_modules')];
+
+function isImmutable(fileName) {
+    const resolved = path.resolve(fileName);
+    return immutableDirs.some(dir => resolved.startsWith(dir + path.sep));
+}
+
+function mtimeOf(fileName) {
+    try {
+        return fs.statSync(fileName).mtimeMs;
+    } catch (e) {
+        return -1;
+    }
+}
+
+// Collects the root config and every referenced config, depth first, like `tsc -b`
+function collectConfigs(configPath, seen = new Set()) {
+    const resolved = path.resolve(configPath);
+    if (seen.has(resolved)) {
+        return [];
+    }
+    seen.add(resolved);
+
+    const parsed = ts.getParsedCommandLineOfConfigFile(resolved, { noEmit: true }, {
+        ...ts.sys,
+        onUnRecoverableConfigFileDiagnostic: () => {},
+    });
+    if (!parsed) {
+        return [];
+    }
+
+    const configs = [];
+    for (const ref of parsed.projectReferences || []) {
+        configs.push(...collectConfigs(ts.resolveProjectReferencePath(ref), seen));
+    }
+    configs.push(resolved);
+    return configs;
+}
+
+class ProjectChecker {
+    constructor(configPath) {
+        this.configPath = configPath;
+        this.sourceFiles = new Map(); // fileName -> { sourceFile, mtime }
+        this.versions = new Map();    // fileName -> version counter
+        this.builder = undefined;
+    }
+
+    invalidate(fileName) {
+        this.sourceFiles.delete(path.resolve(fileName));
+    }
+
+    createHost(options, overlay) {
+        const host = ts.createCompilerHost(options);
+        const originalGetSourceFile = host.getSourceFile;
+        const originalFileExists = host.fileExists;
+        const originalReadFile = host.readFile;
+
+        host.fileExists = (fileName) => {
+            const key = path.resolve(fileName);
+            return overlay.has(key) ? overlay.get(key) !== null : originalFileExists.call(host, fileName);
+        };
+        host.readFile = (fileName) => {
+            const key = path.resolve(fileName);
+            return overlay.has(key) ? (overlay.get(key) ?? undefined) : originalReadFile.call(host, fileName);
+        };
+
+        // Directories of new overlay files may not exist on disk yet; module resolution
+        // checks the directory before the file, so report them (and list them) as well
+        const overlayDirs = new Map(); // directory -> names of its overlay subdirectories
+        for (const [key, text] of overlay) {
+            if (text === null) {
+                continue;
+            }
+            let child = key;
+            let dir = path.dirname(key);
+            while (dir !== child) {
+                if (!overlayDirs.has(dir)) {
+                    overlayDirs.set(dir, new Set());
+                }
+                if (child !== key) {
+                    overlayDirs.get(dir).add(path.basename(child));
+                }
+                child = dir;
+                dir = path.dirname(dir);
+            }
+        }
+        const originalDirectoryExists = host.directoryExists || ts.sys.directoryExists;
+        const originalGetDirectories = host.getDirectories || ts.sys.getDirectories;
+        host.directoryExists = (directoryName) => {
+            return overlayDirs.has(path.resolve(directoryName)) || originalDirectoryExists.call(host, directoryName);
+        };
+        host.getDirectories = (directoryName) => {
+            const names = new Set(originalDirectoryExists.call(host, directoryName) ? originalGetDirectories.call(host, directoryName) : []);
+            for (const name of overlayDirs.get(path.resolve(directoryName)) || []) {
+                names.add(name);
+            }
+            return [...names];
+        };
+
+        host.getSourceFile = (fileName, languageVersion, onError, shouldCreateNewSourceFile) => {
+            const key = path.resolve(fileName);
+            const cached = this.sourceFiles.get(key);
+
+            if (overlay.has(key)) {
+                const text = overlay.get(key);
+                if (text === null) {
+                    return undefined;
+                }
+                if (cached && !shouldCreateNewSourceFile && cached.overlayText === text) {
+                    return cached.sourceFile;
+                }
+                const sourceFile = ts.createSourceFile(fileName, text, languageVersion);
+                // NaN never equals a disk mtime, so the next request without overlay re-reads the file
+                return this.remember(key, sourceFile, { mtime: NaN, overlayText: text });
+            }
+
+            const mtime = cached && cached.immutable ? cached.mtime : mtimeOf(key);
+
+            if (cached && !shouldCreateNewSourceFile && cached.mtime === mtime) {
+                return cached.sourceFile;
+            }
+
+            const sourceFile = originalGetSourceFile.call(host, fileName, languageVersion, onError, shouldCreateNewSourceFile);
+            return this.remember(key, sourceFile, { mtime, immutable: isImmutable(key) });
+        };
+        return host;
+    }
+
+    remember(key, sourceFile, entry) {
+        if (sourceFile) {
+            const version = (this.versions.get(key) || 0) + 1;
+            this.versions.set(key, version);
+            // Builder programs require versioned source files
+            sourceFile.version = String(version);
+            this.sourceFiles.set(key, { sourceFile, ...entry });
+        }
+        return sourceFile;
+    }
+
+    // Root files with the overlay applied: hidden files removed, new files added to the
+    // project that already has files in the same top-level directory (e.g. src/)
+    rootFileNames(fileNames, overlay) {
+        const roots = fileNames.filter(fileName => overlay.get(path.resolve(fileName)) !== null);
+        const known = new Set(roots.map(fileName => path.resolve(fileName)));
+        const topLevelDirs = new Set(roots.map(fileName => path.relative(projectRoot, fileName).split(path.sep)[0]));
+
+        for (const [key, text] of overlay) {
+            const topLevelDir = path.relative(projectRoot, key).split(path.sep)[0];
+            if (text !== null && !known.has(key) && /\.(tsx?|mts|cts)$/.test(key) && topLevelDirs.has(topLevelDir)) {
+                roots.push(key);
+            }
+        }
+        return roots;
+    }
+
+    check(overlay = new Map()) {
+        // Re-read the config each time so created/deleted files are picked up
+        const parsed = ts.getParsedCommandLineOfConfigFile(this.configPath, { noEmit: true }, {
+            ...ts.sys,
+            onUnRecoverableConfigFileDiagnostic: () => {},
+        });
+        if (!parsed) {
+            return [];
+        }
+        if (parsed.fileNames.length === 0 && (parsed.projectReferences || []).length > 0) {
+            // Solution-style config (e.g. the root tsconfig.json): nothing to check itself
+            return parsed.errors;
+        }
+
+        // `tsc -b` treats every project as incremental (this also keeps tsBuildInfoFile legal)
+        const options = { ...parsed.options, noEmit: true, incremental: true };
+        const host = this.createHost(options, overlay);
+        this.builder = ts.createSemanticDiagnosticsBuilderProgram(
+            this.rootFileNames(parsed.fileNames, overlay),
+            options,
+            host,
+            this.builder,
+            ts.getConfigFileParsingDiagnostics(parsed),
+            parsed.projectReferences
+        );
+
+        return [
+            ...this.builder.getConfigFileParsingDiagnostics(),
+            ...this.builder.getOptionsDiagnostics(),
+            ...this.builder.getGlobalDiagnostics(),
+            ...this.builder.getSyntacticDiagnostics(),
+            ...this.builder.getSemanticDiagnostics(),
+        ];
+    }
+}
+
+// Position of a diagnostic (or related information) as 1-based line/column, relative file path
+function toSpan(diagnostic) {
+    const span = {
+        file: null,
+        line: null,
+        column: null,
+        message: ts.flattenDiagnosticMessageText(diagnostic.messageText, '\n'),
+    };
+    if (diagnostic.file && diagnostic.start !== undefined) {
+        const { line, character } = diagnostic.file.getLineAndCharacterOfPosition(diagnostic.start);
+        span.file = path.relative(projectRoot, diagnostic.file.fileName).split(path.sep).join('/');
+        span.line = line + 1;
+        span.column = character + 1;
+    }
+    return span;
+}
+
+function toRecord(diagnostic) {
+    return {
+        ...toSpan(diagnostic),
+        code: diagnostic.code,
+        category: ts.DiagnosticCategory[diagnostic.category].toLowerCase(),
+        related: (diagnostic.relatedInformation || []).map(toSpan),
+    };
+}
+
+const checkers = new Map();
+
+function runCheck(changed, overlayFiles) {
+    const configs = collectConfigs(path.join(projectRoot, 'tsconfig.json'));
+    const overlay = new Map(Object.entries(overlayFiles || {}).map(([fileName, text]) => [path.resolve(fileName), text]));
+    const diagnostics = [];
+
+    for (const configPath of configs) {
+        if (!checkers.has(configPath)) {
+            checkers.set(configPath, new ProjectChecker(configPath));
+        }
+        const checker = checkers.get(configPath);
+        (changed || []).forEach(fileName => checker.invalidate(fileName));
+        diagnostics.push(...checker.check(overlay).map(toRecord));
+    }
+    return diagnostics;
+}
+
+send({ ready: true, version: ts.version });
+
+const rl = readline.createInterface({ input: process.stdin, terminal: false });
+
+rl.on('line', (line) => {
+    if (!line.trim()) {
+        return;
+    }
+    let request;
+    try {
+        request = JSON.parse(line);
+    } catch (e) {
+        send({ id: null, diagnostics: [], error: `Invalid request: ${e.message}` });
+        return;
+    }
+    try {
+        if (request.cmd !== 'check') {
+            throw new Error(`Unknown command: ${request.cmd}`);
+        }
+        send({ id: request.id, diagnostics: runCheck(request.changed, request.overlay), error: null });
+    } catch (e) {
+        send({ id: request.id, diagnostics: [], error: e.message });
+    }
+});
+
+rl.on('close', () => process.exit(0));
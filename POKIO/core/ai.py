@@ -1,11 +1,23 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import os
 from dotenv import load_dotenv
 import time
 import logging
-from typing import List, Dict, Generator, Any
+import asyncio
+import queue
+import threading
+from typing import List, Dict, Generator, AsyncGenerator, Any, Optional
+import httpx
 import requests
 
+from llm_cassette import LLMCassette, CassetteRecorder, get_cassette
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
 load_dotenv()
 
 # Set up logger
@@ -19,19 +31,61 @@ if not logger.handlers:
 
 # Constants
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+# Point at a local stand-in (see mock_openrouter.py) for offline, reproducible runs
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Set AI_ASYNC_CLIENT=1 to let create_ai() hand out the pooled asyncio client
+AI_ASYNC_CLIENT = os.getenv("AI_ASYNC_CLIENT", "0") == "1"
+# Upper bound on model calls in flight at once across all AsyncAI instances
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 4))
+AI_MAX_CONNECTIONS = int(os.getenv("AI_MAX_CONNECTIONS", 20))
+AI_STALL_TIMEOUT = 120  # seconds
+
+# Set PROMPT_CACHE_CONTROL=1 to add cache_control breakpoints to requests for models whose providers
+# only cache marked prefixes (Anthropic, Gemini); OpenAI-style providers cache prefixes on their own
+PROMPT_CACHE_CONTROL = os.getenv("PROMPT_CACHE_CONTROL", "0") == "1"
+PROMPT_CACHE_MODEL_PREFIXES = tuple(
+    p.strip() for p in os.getenv("PROMPT_CACHE_MODEL_PREFIXES", "anthropic/,google/gemini").split(",") if p.strip()
+)
 
 try:
     INPUT_COST = float(os.getenv("INPUT_COST", "0.0"))
     OUTPUT_COST = float(os.getenv("OUTPUT_COST", "0.0"))
+    # Price of input tokens read from the provider's prompt cache (defaults to INPUT_COST)
+    CACHED_INPUT_COST = float(os.getenv("CACHED_INPUT_COST", INPUT_COST))
 except ValueError as e:
-    logger.error(f"Invalid INPUT_COST or OUTPUT_COST env values: {e}")
+    logger.error(f"Invalid INPUT_COST, OUTPUT_COST or CACHED_INPUT_COST env values: {e}")
     INPUT_COST = 0.0
     OUTPUT_COST = 0.0
+    CACHED_INPUT_COST = 0.0
+
+
+def add_cache_control(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Copy of `messages` with cache_control breakpoints at the end of the leading system
+    messages (the stable prefix) and on the last message, so the next call of a growing
+    conversation reads everything before it from the cache. Content becomes a list of parts.
+    """
+    if not messages:
+        return messages
+    prefix_end = 0
+    while prefix_end < len(messages) and messages[prefix_end].get("role") == "system":
+        prefix_end += 1
+    breakpoints = {prefix_end - 1, len(messages) - 1} - {-1}
+
+    marked = []
+    for index, message in enumerate(messages):
+        content = message.get("content")
+        if index in breakpoints and isinstance(content, str) and content:
+            message = {**message, "content": [{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}]}
+        marked.append(message)
+    return marked
 
 
 class AI:
-    def __init__(self, model: str, temperature=0.1, stream=True, tools: List[Dict[str, Any]] = None, reasoning: bool = False):
+    def __init__(self, model: str, temperature=0.1, stream=True, tools: List[Dict[str, Any]] = None, reasoning: bool = False, base_url: str = None):
         self.init_env()
+        self.base_url = base_url or OPENROUTER_BASE_URL
         self.model = model
         self.temperature = temperature
         self.stream = stream
@@ -41,19 +95,23 @@ class AI:
         self.total_tokens_used = 0
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self.total_cached_tokens = 0
 
         self.last_call_tokens = 0
         self.last_input_tokens = 0
         self.last_output_tokens = 0
+        self.last_cached_tokens = 0
         self.last_call_duration = 0.0
         self.last_stop_reason = None
 
         self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=self.base_url,
             api_key=os.getenv("OPENROUTER_API_KEY")
         )
+        # Record/replay layer (None unless LLM_CASSETTE_MODE is set)
+        self.cassette = get_cassette()
 
-        logger.info(f"AI initialized with model: {model}, temperature: {temperature}")
+        logger.info(f"AI initialized with model: {model}, temperature: {temperature}, base_url: {self.base_url}")
 
     @classmethod
     def init_env(cls):
@@ -62,7 +120,7 @@ class AI:
             raise EnvironmentError("Missing required environment variable OPENROUTER_API_KEY")
 
     def supports_tools(self) -> bool:
-        url = "https://openrouter.ai/api/v1/models"
+        url = f"{self.base_url}/models"
         headers = {"Authorization": f"Bearer {OPENROUTER_API_KEY}"}
 
         response = requests.get(url, headers=headers)
@@ -81,31 +139,64 @@ class AI:
         self.tools = tools
 
     def call_model(self, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
-        logger.info(f"Calling model: {self.model}")
+        if self.cassette is None:
+            yield from self._stream_model(messages)
+            return
+
+        key = LLMCassette.request_key(self.model, self.temperature, messages, self.reasoning)
+        if self.cassette.replays:
+            entry = self.cassette.load(key)
+            if entry is not None:
+                yield from self._replay_cassette(entry)
+                return
+            if not self.cassette.records:
+                logger.error(f"No cassette recorded for request {key[:12]} (replay mode).")
+                yield f"\n[Error: No recorded response for this request (cassette {key[:12]})]"
+                return
+
+        recorder = CassetteRecorder(key, self.model)
+        for content in self._stream_model(messages):
+            recorder.add(content)
+            yield content
+
+        # Only complete responses are worth replaying
+        if self.last_stop_reason:
+            usage = {
+                "prompt_tokens": self.last_input_tokens,
+                "completion_tokens": self.last_output_tokens,
+                "total_tokens": self.last_call_tokens,
+                "cached_tokens": self.last_cached_tokens,
+            }
+            self.cassette.save(recorder.entry(usage, self.last_stop_reason))
+
+    def _replay_cassette(self, entry: Dict[str, Any]) -> Generator[str, None, None]:
+        logger.info(f"Replaying cassette {entry['key'][:12]} for model: {self.model}")
+        self._reset_call_stats()
+        start_time = time.time()
 
-        # Reset stats
-        self.last_call_tokens = 0
-        self.last_input_tokens = 0
-        self.last_output_tokens = 0
-        self.last_call_duration = 0.0
-        self.last_stop_reason = None
+        yield from self.cassette.replay(entry)
+
+        # Recorded usage keeps token and cost accounting identical to the live call
+        usage = entry.get("usage") or {}
+        self.last_input_tokens = usage.get("prompt_tokens", 0)
+        self.last_output_tokens = usage.get("completion_tokens", 0)
+        self.last_call_tokens = usage.get("total_tokens", 0)
+        self.last_cached_tokens = usage.get("cached_tokens", 0)
+        self.last_stop_reason = entry.get("stop_reason")
+        self.last_call_duration = time.time() - start_time
+        self.total_tokens_used += self.last_call_tokens
+        self.total_cached_tokens += self.last_cached_tokens
+
+    def _stream_model(self, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+        logger.info(f"Calling model: {self.model}")
+        self._reset_call_stats()
 
         start_time = time.time()
-        stall_timeout = 120  # seconds
         chunk_count = 0
         last_received = time.time()
 
         try:
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                stream=self.stream,
-                extra_body={
-                    "provider": {"sort": 'throughput'},
-                    "reasoning": {"enabled": True} if self.reasoning else None
-                }
-            )
+            stream = self.client.chat.completions.create(**self._request_kwargs(messages))
 
             logger.info("Stream opened, awaiting response chunks...")
 
@@ -113,43 +204,83 @@ class AI:
                 now = time.time()
                 chunk_count += 1
 
-                if now - last_received > stall_timeout:
-                    logger.warning(f"No data received for {stall_timeout}s, aborting.")
+                if now - last_received > AI_STALL_TIMEOUT:
+                    logger.warning(f"No data received for {AI_STALL_TIMEOUT}s, aborting.")
                     yield "\n[Error: No response received for too long]"
                     break
 
-                # Log finish reason if present (non-null)
-                if chunk.choices and chunk.choices[0].finish_reason:
-                    self.last_stop_reason = chunk.choices[0].finish_reason
-                    logger.info(f"⚙️ Stop reason: {self.last_stop_reason}")
-
-                # Handle streamed text
-                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                content = self._handle_chunk(chunk)
+                if content:
                     last_received = now
-                    yield chunk.choices[0].delta.content
-
-                # Capture usage stats (if available)
-                if hasattr(chunk, "usage") and chunk.usage:
-                    self.last_input_tokens = getattr(chunk.usage, "prompt_tokens", 0)
-                    self.last_output_tokens = getattr(chunk.usage, "completion_tokens", 0)
-                    self.last_call_tokens = getattr(chunk.usage, "total_tokens", 0)
-
-            total_time = time.time() - start_time
-            self.last_call_duration = total_time
+                    yield content
 
-            logger.info(f"Response complete: {chunk_count} chunks in {total_time:.2f}s")
-            if self.last_stop_reason:
-                logger.info(f"Final stop reason: {self.last_stop_reason}")
-            else:
-                logger.warning("No explicit stop reason received — possibly incomplete output.")
-
-            self.total_tokens_used += self.last_call_tokens
+            self._finish_call(start_time, chunk_count)
 
         except Exception as e:
             self.last_call_duration = time.time() - start_time
             logger.exception(f"Error during model call: {e}")
             yield f"\n[Error: {str(e)}]"
 
+    # --- Shared by the sync and async clients ---
+
+    def _reset_call_stats(self):
+        self.last_call_tokens = 0
+        self.last_input_tokens = 0
+        self.last_output_tokens = 0
+        self.last_cached_tokens = 0
+        self.last_call_duration = 0.0
+        self.last_stop_reason = None
+
+    def uses_cache_control(self) -> bool:
+        return PROMPT_CACHE_CONTROL and self.model.startswith(PROMPT_CACHE_MODEL_PREFIXES)
+
+    def _request_kwargs(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": add_cache_control(messages) if self.uses_cache_control() else messages,
+            "temperature": self.temperature,
+            "stream": self.stream,
+            "extra_body": {
+                "provider": {"sort": 'throughput'},
+                "reasoning": {"enabled": True} if self.reasoning else None
+            },
+        }
+
+    def _handle_chunk(self, chunk) -> Optional[str]:
+        """Records finish reason and usage from a streamed chunk and returns its text, if any."""
+        # Log finish reason if present (non-null)
+        if chunk.choices and chunk.choices[0].finish_reason:
+            self.last_stop_reason = chunk.choices[0].finish_reason
+            logger.info(f"⚙️ Stop reason: {self.last_stop_reason}")
+
+        # Capture usage stats (if available)
+        if hasattr(chunk, "usage") and chunk.usage:
+            self.last_input_tokens = getattr(chunk.usage, "prompt_tokens", 0)
+            self.last_output_tokens = getattr(chunk.usage, "completion_tokens", 0)
+            self.last_call_tokens = getattr(chunk.usage, "total_tokens", 0)
+            details = getattr(chunk.usage, "prompt_tokens_details", None)
+            self.last_cached_tokens = (getattr(details, "cached_tokens", 0) if details else 0) or 0
+
+        # Handle streamed text
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content
+        return None
+
+    def _finish_call(self, start_time: float, chunk_count: int):
+        total_time = time.time() - start_time
+        self.last_call_duration = total_time
+
+        logger.info(f"Response complete: {chunk_count} chunks in {total_time:.2f}s")
+        if self.last_stop_reason:
+            logger.info(f"Final stop reason: {self.last_stop_reason}")
+        else:
+            logger.warning("No explicit stop reason received — possibly incomplete output.")
+        if self.last_cached_tokens:
+            logger.info(f"Prompt cache: {self.last_cached_tokens}/{self.last_input_tokens} input tokens cached")
+
+        self.total_tokens_used += self.last_call_tokens
+        self.total_cached_tokens += self.last_cached_tokens
+
     def get_total_token_usage(self):
         return self.total_tokens_used
 
@@ -159,11 +290,141 @@ class AI:
     def get_call_duration(self):
         return self.last_call_duration
 
+    def get_call_cached_tokens(self):
+        return self.last_cached_tokens
+
     def get_stop_reason(self):
         return self.last_stop_reason
 
     def calculate_token_cost(self) -> float:
         """Calculate the cost of token usage in USD."""
-        input_cost = (self.last_input_tokens / 1_000_000) * INPUT_COST
+        uncached_tokens = self.last_input_tokens - self.last_cached_tokens
+        input_cost = (uncached_tokens / 1_000_000) * INPUT_COST + (self.last_cached_tokens / 1_000_000) * CACHED_INPUT_COST
         output_cost = (self.last_output_tokens / 1_000_000) * OUTPUT_COST
         return input_cost + output_cost
+
+
+class _AsyncRuntime:
+    """
+    One event loop thread owning the pooled httpx.AsyncClient and the concurrency
+    semaphore. Every AsyncAI instance shares it, so keep-alive connections are reused
+    across planner, coder and reviewer calls.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="ai-event-loop", daemon=True)
+        self._thread.start()
+        self.http_client: httpx.AsyncClient = self.run(self._create_http_client())
+        self.semaphore: asyncio.Semaphore = self.run(self._create_semaphore())
+
+    async def _create_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=AI_MAX_CONNECTIONS, max_keepalive_connections=AI_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(600.0, connect=10.0),
+        )
+
+    async def _create_semaphore(self) -> asyncio.Semaphore:
+        return asyncio.Semaphore(AI_MAX_CONCURRENCY)
+
+    def submit(self, coro) -> "asyncio.Future":
+        """Schedules a coroutine on the runtime loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+
+_runtime: Optional[_AsyncRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime() -> _AsyncRuntime:
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = _AsyncRuntime()
+            logger.info(f"Async AI runtime started (http2={HTTP2_AVAILABLE}, max concurrency={AI_MAX_CONCURRENCY})")
+        return _runtime
+
+
+class AsyncAI(AI):
+    """
+    asyncio-native variant of AI with the same token and cost accounting.
+
+    `acall_model` must run on the shared runtime loop (use `submit`); `call_model`
+    keeps the exact generator interface of AI.call_model (including cassettes) on
+    top of a blocking shim, so existing callers can switch without changes and
+    still overlap calls from several threads.
+    """
+
+    def __init__(self, model: str, temperature=0.1, stream=True, tools: List[Dict[str, Any]] = None, reasoning: bool = False, base_url: str = None):
+        super().__init__(model, temperature=temperature, stream=stream, tools=tools, reasoning=reasoning, base_url=base_url)
+        self.runtime = get_async_runtime()
+        self.async_client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            http_client=self.runtime.http_client,
+        )
+
+    def submit(self, coro) -> "asyncio.Future":
+        return self.runtime.submit(coro)
+
+    async def acall_model(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+        logger.info(f"Calling model (async): {self.model}")
+
+        async with self.runtime.semaphore:
+            self._reset_call_stats()
+            start_time = time.time()
+            chunk_count = 0
+
+            try:
+                stream = await self.async_client.chat.completions.create(**self._request_kwargs(messages))
+                logger.info("Stream opened, awaiting response chunks...")
+
+                iterator = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout=AI_STALL_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        logger.warning(f"No data received for {AI_STALL_TIMEOUT}s, aborting.")
+                        yield "\n[Error: No response received for too long]"
+                        break
+
+                    chunk_count += 1
+                    content = self._handle_chunk(chunk)
+                    if content:
+                        yield content
+
+                self._finish_call(start_time, chunk_count)
+
+            except Exception as e:
+                self.last_call_duration = time.time() - start_time
+                logger.exception(f"Error during model call: {e}")
+                yield f"\n[Error: {str(e)}]"
+
+    def _stream_model(self, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+        chunks: "queue.Queue[Optional[str]]" = queue.Queue()
+
+        async def pump():
+            try:
+                async for content in self.acall_model(messages):
+                    chunks.put(content)
+            finally:
+                chunks.put(None)
+
+        self.submit(pump())
+        while True:
+            content = chunks.get()
+            if content is None:
+                return
+            yield content
+
+
+def create_ai(model: str, temperature=0.1, **kwargs) -> AI:
+    """Returns an AsyncAI when AI_ASYNC_CLIENT=1, otherwise the plain synchronous AI."""
+    cls = AsyncAI if AI_ASYNC_CLIENT else AI
+    return cls(model=model, temperature=temperature, **kwargs)
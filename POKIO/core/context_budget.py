@@ -0,0 +1,295 @@
+"""
+Context budget for POKIO system.
+Keeps the project context pasted into prompts (file tree, dependency graph,
+installed dependencies, change history, file contents) inside a token budget.
+
+Tokens are counted locally, with tiktoken when installed and a characters-per-token
+estimate otherwise. When the sections exceed the budget, each one gets a share of it
+(by weight; sections smaller than their share pass theirs on) and is degraded to fit:
+the tree is folded from its deepest directories up, the dependency graph is compacted
+to one line per file, history keeps its most recent entries and file contents are
+replaced by a fetch_files hint from the last file backwards. A section whose share is
+below its minimum is dropped, lowest priority first.
+
+Configuration: CONTEXT_TOKEN_BUDGET (tokens, 0 disables), CONTEXT_TOKENIZER (tiktoken encoding).
+"""
+import logging
+import math
+import os
+import re
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 16000))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+# Estimate used without tiktoken; code and markdown average slightly below 4 characters per token
+CHARS_PER_TOKEN = 3.5
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in `text` (estimated when tiktoken is not installed)."""
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# One block of prompt context. `fit(max_tokens)` returns a version of `text` of at most max_tokens
+# tokens; sections with a higher priority are dropped last, and never get less than min_tokens.
+ContextSection = namedtuple('ContextSection', ['name', 'text', 'weight', 'priority', 'min_tokens', 'fit'])
+
+
+def omitted_placeholder(name: str) -> str:
+    return f"({name} omitted to fit the context budget)"
+
+
+def truncate_text(text: str, max_tokens: int, keep: str = "head") -> str:
+    """Whole lines of `text` within max_tokens, from the start (keep="head") or the end (keep="tail")."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], count_tokens("(... 0000 lines omitted)")
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    marker = f"(... {len(lines) - len(kept)} lines omitted)"
+    if keep == "tail":
+        kept.reverse()
+        return "\n".join([marker] + kept)
+    return "\n".join(kept + [marker])
+
+
+def fold_tree(tree_markdown: str, max_tokens: int) -> str:
+    """
+    Folds the tree markdown of ProjectAnalyzerService (two spaces per level, directories
+    end with "/") from the deepest level up: a folded directory shows its file count.
+    """
+    if count_tokens(tree_markdown) <= max_tokens:
+        return tree_markdown
+    entries = []
+    for line in tree_markdown.splitlines():
+        stripped = line.lstrip(" ")
+        entries.append(((len(line) - len(stripped)) // 2, stripped))
+    if not entries:
+        return tree_markdown
+
+    # Number of files below each directory entry
+    file_counts = [0] * len(entries)
+    open_dirs: List[int] = []
+    for i, (depth, name) in enumerate(entries):
+        while open_dirs and entries[open_dirs[-1]][0] >= depth:
+            open_dirs.pop()
+        if name.endswith("/"):
+            open_dirs.append(i)
+        else:
+            for d in open_dirs:
+                file_counts[d] += 1
+
+    for max_depth in range(max(depth for depth, _ in entries) - 1, -1, -1):
+        lines = []
+        for i, (depth, name) in enumerate(entries):
+            if depth > max_depth:
+                continue
+            folded = name.endswith("/") and depth == max_depth and i + 1 < len(entries) and entries[i + 1][0] > depth
+            lines.append(" " * (2 * depth) + (f"{name} ({file_counts[i]} files)" if folded else name))
+        folded_tree = "\n".join(lines)
+        if count_tokens(folded_tree) <= max_tokens:
+            return folded_tree
+    return truncate_text(folded_tree, max_tokens)
+
+
+_GRAPH_FILE_PATTERN = re.compile(r"^## `(.+)`$")
+_GRAPH_ITEM_PATTERN = re.compile(r"^  - `(.+)`$")
+
+
+def _is_local_import(module: str) -> bool:
+    return module.startswith((".", "/", "@/", "src/"))
+
+
+def summarize_graph(graph_markdown: str, max_tokens: int, focus: Optional[List[str]] = None) -> str:
+    """
+    Compacts the dependency graph markdown of ProjectAnalyzerService to fit max_tokens:
+    first one line per file, then only project-local imports, then only as many files
+    as fit, the `focus` files first.
+    """
+    if count_tokens(graph_markdown) <= max_tokens:
+        return graph_markdown
+
+    files: Dict[str, Dict[str, List[str]]] = {}
+    current, kind = None, None
+    for line in graph_markdown.splitlines():
+        file_match = _GRAPH_FILE_PATTERN.match(line)
+        if file_match:
+            current = files.setdefault(file_match.group(1), {"imports": [], "exports": []})
+            continue
+        if current is None:
+            continue
+        if line.startswith("- **Imports**"):
+            kind = "imports"
+        elif line.startswith("- **Exports**"):
+            kind = "exports"
+        else:
+            item_match = _GRAPH_ITEM_PATTERN.match(line)
+            if item_match and kind:
+                current[kind].append(item_match.group(1))
+
+    focus_set = set(focus or [])
+    ordered = sorted(files, key=lambda path: (not any(path.endswith(f) or f.endswith(path) for f in focus_set), path))
+
+    def compact_line(path: str, local_only: bool) -> str:
+        imports = [m for m in files[path]["imports"] if not local_only or _is_local_import(m)]
+        parts = [f"- `{path}`"]
+        if imports:
+            parts.append(f"imports: {', '.join(imports)}")
+        if files[path]["exports"]:
+            parts.append(f"exports: {', '.join(files[path]['exports'])}")
+        return " | ".join(parts)
+
+    header = "# Dependency Graph (compacted)"
+    for local_only in (False, True):
+        compact = "\n".join([header] + [compact_line(path, local_only) for path in ordered])
+        if count_tokens(compact) <= max_tokens:
+            return compact
+
+    lines, used = [header], count_tokens(header) + count_tokens("- ... 0000 more files (see the file tree)")
+    for path in ordered:
+        line = compact_line(path, local_only=True)
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    lines.append(f"- ... {len(ordered) - (len(lines) - 1)} more files (see the file tree)")
+    return "\n".join(lines)
+
+
+def fit_file_blobs(blobs: List[Dict[str, str]], max_tokens: int, format_blobs: Callable[[List[Dict[str, str]]], str]) -> str:
+    """
+    `format_blobs(blobs)` within max_tokens: from the last blob backwards, contents are
+    replaced by a note to fetch the file. Callers pass the most relevant files first.
+    """
+    text = format_blobs(blobs)
+    if count_tokens(text) <= max_tokens:
+        return text
+    blobs = list(blobs)
+    for i in range(len(blobs) - 1, -1, -1):
+        blob = blobs[i]
+        blobs[i] = {**blob, "content": f"(content omitted to fit the context budget, {count_tokens(blob.get('content', ''))} tokens; use fetch_files to read it)"}
+        text = format_blobs(blobs)
+        if count_tokens(text) <= max_tokens:
+            return text
+    return truncate_text(text, max_tokens)
+
+
+def allocate_budget(sections: List[ContextSection], budget: int) -> Dict[str, int]:
+    """
+    Token allocation per section: shares of `budget` by weight, where sections needing
+    less than their share keep only what they need and pass the rest on. Sections whose
+    allocation falls below their min_tokens are dropped (allocation 0), lowest priority first.
+    """
+    sizes = {s.name: count_tokens(s.text) for s in sections}
+    active = list(sections)
+    while True:
+        allocation: Dict[str, int] = {}
+        remaining = budget
+        pending = list(active)
+        while pending:
+            total_weight = sum(s.weight for s in pending) or 1
+            fitting = [s for s in pending if sizes[s.name] <= remaining * s.weight / total_weight]
+            if not fitting:
+                for s in pending:
+                    allocation[s.name] = int(remaining * s.weight / total_weight)
+                break
+            for s in fitting:
+                allocation[s.name] = sizes[s.name]
+                remaining -= sizes[s.name]
+                pending.remove(s)
+
+        starved = [s for s in active if allocation[s.name] < min(s.min_tokens, sizes[s.name])]
+        if not starved:
+            break
+        active.remove(min(starved, key=lambda s: s.priority))
+
+    return {s.name: allocation.get(s.name, 0) for s in sections}
+
+
+def assemble_context(sections: List[ContextSection], budget: int = CONTEXT_TOKEN_BUDGET) -> Dict[str, str]:
+    """Text per section name, degraded or dropped so that together they stay within `budget` tokens."""
+    texts = {s.name: s.text for s in sections}
+    if budget <= 0:
+        return texts
+    total = sum(count_tokens(s.text) for s in sections)
+    if total <= budget:
+        return texts
+
+    allocation = allocate_budget(sections, budget)
+    degraded = []
+    for s in sections:
+        if allocation[s.name] == 0:
+            texts[s.name] = omitted_placeholder(s.name)
+        elif count_tokens(s.text) > allocation[s.name]:
+            texts[s.name] = s.fit(allocation[s.name])
+            degraded.append(s)
+
+    # Degrading is coarse (a whole tree level, a whole file), so give what is left over to
+    # the degraded sections again, most important first
+    for s in sorted(degraded, key=lambda s: -s.priority):
+        spare = budget - sum(count_tokens(text) for text in texts.values())
+        if spare <= 0:
+            break
+        texts[s.name] = s.fit(count_tokens(texts[s.name]) + spare)
+
+    changes = [f"{s.name} dropped" if allocation[s.name] == 0 else f"{s.name} {count_tokens(s.text)}->{count_tokens(texts[s.name])}"
+               for s in sections if texts[s.name] != s.text]
+    logger.info(f"Context of {total} tokens exceeds the budget of {budget}: {', '.join(changes)}.")
+    return texts
+
+
+if __name__ == "__main__":
+    logging.disable(logging.CRITICAL)
+    print(f"Tokenizer: {'tiktoken ' + CONTEXT_TOKENIZER if tiktoken is not None else f'estimate ({CHARS_PER_TOKEN} chars/token)'}")
+
+    # A large synthetic project: 30 feature folders with 25 components each
+    tree_lines, graph_lines = ["src/"], ["# Dependency Graph", ""]
+    for feature in range(30):
+        tree_lines.append(f"  features/feature{feature}/")
+        for component in range(25):
+            path = f"src/features/feature{feature}/Component{component}.tsx"
+            tree_lines.append(f"    Component{component}.tsx")
+            graph_lines += [f"## `{path}`", "", "- **Imports**", "  - `react`", f"  - `./Component{(component + 1) % 25}`",
+                            "  - `@heroicons/react/24/solid`", "", "- **Exports**", f"  - `Component{component}`", "", ""]
+    tree, graph = "\n".join(tree_lines), "\n".join(graph_lines)
+    history = "\n".join(f"{i}. Step {i}\n   - summary of step {i}\n   - implemented files of step {i}" for i in range(1, 60))
+    blobs = [{"path": f"src/features/feature0/Component{i}.tsx", "content": "export default function C() { return <div />; }\n" * 80} for i in range(10)]
+    from utils import format_file_blobs
+
+    sections = [
+        ContextSection("tree", tree, 2, 2, 200, lambda n: fold_tree(tree, n)),
+        ContextSection("graph", graph, 3, 1, 300, lambda n: summarize_graph(graph, n, focus=[b["path"] for b in blobs])),
+        ContextSection("history", history, 1, 0, 100, lambda n: truncate_text(history, n, keep="tail")),
+        ContextSection("files", format_file_blobs(blobs), 6, 3, 500, lambda n: fit_file_blobs(blobs, n, format_file_blobs)),
+    ]
+    for budget in (0, 16000, 6000, 2000):
+        texts = assemble_context(sections, budget)
+        sizes = ", ".join(f"{name}={count_tokens(text)}" for name, text in texts.items())
+        print(f"budget {budget or 'off'}: {sum(count_tokens(t) for t in texts.values())} tokens ({sizes})")
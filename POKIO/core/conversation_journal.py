@@ -0,0 +1,223 @@
+"""
+Conversation journal for POKIO system.
+Append-only JSONL log of an agent's message memory. The orchestrators record
+the whole memory after every model call; the journal writes each distinct
+message once and a small turn record listing the message ids the memory
+consisted of, so log I/O grows with the new messages instead of the memory.
+
+Records, one JSON object per line:
+    {"type": "message", "id": "<sha256[:16]>", "message": {...}}
+    {"type": "turn", "turn": n, "messages": [id, ...], "tokens": ..., "duration": ..., "time": "..."}
+
+render_markdown() rebuilds the Markdown view save_conversation used to write
+(one "# New turn:" section with every message per turn), e.g.:
+    python conversation_journal.py EXPERIMENT/VERSION_task.jsonl -o VERSION_task.md
+"""
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import json_codec
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Set CONVERSATION_JOURNAL=0 to append the full Markdown memory every turn instead
+CONVERSATION_JOURNAL = os.getenv("CONVERSATION_JOURNAL", "1") == "1"
+
+
+def message_id(message: Dict[str, Any]) -> str:
+    """Content id of a message: equal messages share one journal entry."""
+    return hashlib.sha256(json_codec.dumps(message).encode("utf-8")).hexdigest()[:16]
+
+
+def journal_path_for(filename: str) -> str:
+    """The journal that replaces a Markdown conversation log (same name, .jsonl)."""
+    return str(Path(filename).with_suffix(".jsonl"))
+
+
+class ConversationJournal:
+    """Append-only journal of one conversation log, see the module docstring."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # message id -> byte offset of its record, for read_message
+        self.index: Dict[str, int] = {}
+        self.turns = 0
+        # id(message dict) -> (message, its content, its id): skips re-hashing messages seen in earlier turns
+        self._ids: Dict[int, Tuple[Dict[str, Any], Any, str]] = {}
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        for offset, record in self._records():
+            if record.get("type") == "message":
+                self.index[record["id"]] = offset
+            elif record.get("type") == "turn":
+                self.turns = max(self.turns, record.get("turn", 0))
+
+    def _records(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    try:
+                        yield offset, json_codec.loads(line)
+                    except ValueError:
+                        # Torn last line of an interrupted write
+                        logger.warning(f"Skipping unreadable journal line at byte {offset} of {self.path}.")
+                offset += len(line)
+
+    def _message_ids(self, messages: List[Dict[str, Any]]) -> List[str]:
+        ids = {}
+        for message in messages:
+            cached = self._ids.get(id(message))
+            if cached is None or cached[0] is not message or cached[1] is not message.get("content"):
+                cached = (message, message.get("content"), message_id(message))
+            ids[id(message)] = cached
+        # Only the latest memory is kept, so dropped messages are not held on to
+        self._ids = ids
+        return [ids[id(message)][2] for message in messages]
+
+    def record_turn(self, messages: List[Dict[str, Any]], token_usage: Any = 0, duration: float = 0.0) -> int:
+        """Appends the messages not journaled yet and a turn record for `messages`. Returns the turn number."""
+        with self._lock:
+            ids = self._message_ids(messages)
+            lines = []
+            new_ids = []
+            for message, msg_id in zip(messages, ids):
+                if msg_id not in self.index and msg_id not in new_ids:
+                    new_ids.append(msg_id)
+                    lines.append(json_codec.dumps({"type": "message", "id": msg_id, "message": message}, ensure_ascii=False))
+            self.turns += 1
+            lines.append(json_codec.dumps({
+                "type": "turn", "turn": self.turns, "messages": ids,
+                "tokens": token_usage, "duration": duration, "time": datetime.now().isoformat()
+            }, ensure_ascii=False))
+
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                for msg_id, line in zip(new_ids + [None], lines):
+                    data = (line + "\n").encode("utf-8")
+                    if msg_id is not None:
+                        self.index[msg_id] = offset
+                    f.write(data)
+                    offset += len(data)
+            return self.turns
+
+    def read_message(self, msg_id: str) -> Optional[Dict[str, Any]]:
+        """The message with id `msg_id`, read from its offset in the journal."""
+        offset = self.index.get(msg_id)
+        if offset is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json_codec.loads(f.readline())["message"]
+
+
+_journals: Dict[str, ConversationJournal] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(path: str) -> ConversationJournal:
+    """Returns the shared journal for `path`, so its index is only built once per process."""
+    key = os.path.abspath(path)
+    with _journals_lock:
+        if key not in _journals:
+            _journals[key] = ConversationJournal(key)
+        return _journals[key]
+
+
+def render_markdown(path: str, last_turn_only: bool = False) -> str:
+    """
+    Markdown view of a journal in the format save_conversation wrote: every turn
+    with the full memory at that point. With last_turn_only, just the latest memory.
+    """
+    messages: Dict[str, Dict[str, Any]] = {}
+    turns: List[Dict[str, Any]] = []
+    for _, record in ConversationJournal(path)._records():
+        if record.get("type") == "message":
+            messages[record["id"]] = record["message"]
+        elif record.get("type") == "turn":
+            turns.append(record)
+    if last_turn_only:
+        turns = turns[-1:]
+
+    parts = []
+    for turn in turns:
+        parts.append("\n# New turn:\n")
+        for msg_id in turn["messages"]:
+            parts.append(f"\n```json\n{json_codec.dumps(messages[msg_id], indent=2, ensure_ascii=False)}\n```\n")
+        parts.append(f"Tokens used: {turn.get('tokens', 0)}" + "\n")
+        parts.append(f"Time taken {turn.get('duration', 0.0):.2f}" + "\n")
+    return "".join(parts)
+
+
+def load_markdown_turns(path: str) -> List[List[Dict[str, Any]]]:
+    """Messages of each turn of a Markdown conversation log written by save_conversation."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    turns = []
+    for section in text.split("\n# New turn:\n")[1:]:
+        blocks = section.split("\n```json\n")[1:]
+        turns.append([json_codec.loads(block.split("\n```\n")[0]) for block in blocks])
+    return turns
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    import tempfile
+    import time
+    from utils import save_conversation
+
+    parser = argparse.ArgumentParser(description="Render a conversation journal as Markdown, or benchmark it against the Markdown log.")
+    parser.add_argument("journal", nargs="?", help="Journal (.jsonl) to render. Without it, runs the benchmark.")
+    parser.add_argument("-o", "--output", help="Write the Markdown here instead of printing it.")
+    parser.add_argument("--last", action="store_true", help="Only render the latest memory.")
+    args = parser.parse_args()
+
+    if args.journal:
+        markdown = render_markdown(args.journal, last_turn_only=args.last)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(markdown)
+        else:
+            print(markdown)
+    else:
+        logging.disable(logging.CRITICAL)
+        log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs", "logs")
+        for log_path in sorted(glob.glob(os.path.join(log_dir, "*", "*_logs", "*_task.md"))):
+            final_memory = max(load_markdown_turns(log_path), key=len)
+            # Replay a 40-turn repair loop: every turn adds a tool result and a response of the recorded sizes
+            memory, memories = final_memory[:2], []
+            for turn in range(40):
+                for message in final_memory[2:4]:
+                    memory = memory + [{**message, "content": f"[turn {turn}] {message['content']}"}]
+                memories.append(memory)
+            with tempfile.TemporaryDirectory() as tmp:
+                markdown_path = os.path.join(tmp, "task.md")
+                start = time.perf_counter()
+                for memory in memories:
+                    save_conversation(memory, markdown_path, token_usage=1, duration=1.0, journal=False)
+                markdown_time = time.perf_counter() - start
+
+                journal_path = os.path.join(tmp, "task.jsonl")
+                start = time.perf_counter()
+                for memory in memories:
+                    get_journal(journal_path).record_turn(memory, token_usage=1, duration=1.0)
+                journal_time = time.perf_counter() - start
+
+                with open(markdown_path, "r", encoding="utf-8") as f:
+                    assert render_markdown(journal_path) == f.read()
+                print(f"{os.path.relpath(log_path, log_dir)}: {len(memories)} turns, "
+                      f"markdown {os.path.getsize(markdown_path) / 1024:.0f}KB in {markdown_time * 1000:.1f}ms, "
+                      f"journal {os.path.getsize(journal_path) / 1024:.0f}KB in {journal_time * 1000:.1f}ms")
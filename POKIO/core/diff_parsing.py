@@ -1,11 +1,91 @@
+import heapq
 import logging
+import os
 import re
-from typing import List, Tuple, Union, Dict
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from itertools import accumulate
+from typing import List, Optional, Tuple, Union, Dict
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Minimum similarity (0-1) for the approximate SEARCH match tier; values above 1 disable it
+DIFF_SIMILARITY_THRESHOLD = float(os.getenv("DIFF_SIMILARITY_THRESHOLD", 0.9))
+# Regions per size kept by the token prefilter and scored with SequenceMatcher
+DIFF_SIMILARITY_CANDIDATES = 4
+# Region sizes tried around the SEARCH block's line count (lines added/removed by the model)
+DIFF_SIMILARITY_SIZE_SLACK = 2
+# Two regions closer than this in similarity make the match ambiguous
+DIFF_SIMILARITY_AMBIGUITY = 0.01
+# Shorter SEARCH blocks (non-blank lines) are too easily similar to the wrong line to match approximately
+DIFF_SIMILARITY_MIN_LINES = 3
+# Tokens of the SEARCH block found on at most this many file lines must appear in the matched region
+DIFF_SIMILARITY_RARE_LINES = 3
+
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def _normalize_lines(lines: List[str]) -> str:
+    """Whitespace-insensitive form of a block: blank lines dropped, inner whitespace runs collapsed."""
+    return "\n".join(" ".join(line.split()) for line in lines if line)
+
+
+class LineIndex:
+    """
+    Line index of one original file, built once and shared by all SEARCH blocks
+    applied to it:
+        lines     - the lines of the file
+        stripped  - every line with surrounding whitespace removed
+        offsets   - offsets[i] is the character index where line i starts;
+                    offsets[len(lines)] is one past the end (as if the file ended with a newline)
+        positions - stripped line -> ascending line numbers where it occurs
+    """
+
+    def __init__(self, content: str):
+        self.lines = content.split("\n")
+        self.stripped = [line.strip() for line in self.lines]
+
+        self.offsets = [0]
+        self.offsets.extend(accumulate(len(line) + 1 for line in self.lines))
+
+        self.positions: Dict[str, List[int]] = {}
+        for i, line in enumerate(self.stripped):
+            self.positions.setdefault(line, []).append(i)
+
+        self._token_lines: Optional[Dict[str, List[int]]] = None
+
+    @property
+    def token_lines(self) -> Dict[str, List[int]]:
+        """Word token -> lines containing it; only the similarity matcher needs it, so built lazily."""
+        if self._token_lines is None:
+            self._token_lines = {}
+            for i, line in enumerate(self.stripped):
+                for token in set(_WORD_PATTERN.findall(line)):
+                    self._token_lines.setdefault(token, []).append(i)
+        return self._token_lines
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def line_at(self, char_index: int) -> int:
+        """First line starting at or after `char_index`."""
+        return bisect_left(self.offsets, char_index, 0, len(self.lines))
+
+    def span(self, first_line: int, line_count: int) -> Tuple[int, int]:
+        """Character span of `line_count` lines starting at `first_line`, including their newlines."""
+        return self.offsets[first_line], self.offsets[first_line + line_count]
+
+    def candidates(self, stripped_line: str, first_line: int, last_line: int) -> List[int]:
+        """Lines in [first_line, last_line] whose stripped text is `stripped_line`."""
+        found = self.positions.get(stripped_line)
+        if not found:
+            return []
+        return found[bisect_left(found, first_line):bisect_left(found, last_line + 1)]
+
+
 class DiffParsingService:
     """Service to parse and apply diffs from SEARCH/REPLACE blocks."""
 
@@ -94,32 +174,25 @@ class DiffParsingService:
         self,
         original_content: str,
         search_content: str,
-        start_index: int
+        start_index: int,
+        line_index: Optional[LineIndex] = None
     ) -> Union[Tuple[int, int], bool]:
-        original_lines = original_content.split("\n")
+        index = line_index or LineIndex(original_content)
         search_lines = search_content.split("\n")
 
+        # Only the empty line after a trailing newline is dropped; whitespace-only lines still count
         if search_lines and search_lines[-1] == "":
             search_lines.pop()
+        search_lines = [line.strip() for line in search_lines]
+        if not search_lines:
+            return index.span(index.line_at(start_index), 0)
 
-        # Determine starting line based on character index
-        start_line = 0
-        cur_index = 0
-        while cur_index < start_index and start_line < len(original_lines):
-            cur_index += len(original_lines[start_line]) + 1
-            start_line += 1
-
-        # Try matching at each line
-        for i in range(start_line, len(original_lines) - len(search_lines) + 1):
-            matches = True
-            for j, sline in enumerate(search_lines):
-                if original_lines[i + j].strip() != sline.strip():
-                    matches = False
-                    break
-            if matches:
-                match_start = sum(len(l) + 1 for l in original_lines[:i])
-                match_end = match_start + sum(len(l) + 1 for l in original_lines[i:i+len(search_lines)])
-                return (match_start, match_end)
+        # Try matching at each line where the first search line occurs
+        block_size = len(search_lines)
+        stripped = index.stripped
+        for i in index.candidates(search_lines[0], index.line_at(start_index), len(index) - block_size):
+            if stripped[i:i + block_size] == search_lines:
+                return index.span(i, block_size)
 
         return False
 
@@ -127,9 +200,9 @@ class DiffParsingService:
         self,
         original_content: str,
         search_content: str,
-        start_index: int
+        start_index: int,
+        line_index: Optional[LineIndex] = None
     ) -> Union[Tuple[int, int], bool]:
-        original_lines = original_content.split("\n")
         search_lines = search_content.split("\n")
 
         if len(search_lines) < 3:
@@ -137,27 +210,103 @@ class DiffParsingService:
         if search_lines and search_lines[-1] == "":
             search_lines.pop()
 
+        index = line_index or LineIndex(original_content)
         first_anchor = search_lines[0].strip()
         last_anchor = search_lines[-1].strip()
         block_size = len(search_lines)
 
-        # Determine starting line
-        start_line = 0
-        cur_index = 0
-        while cur_index < start_index and start_line < len(original_lines):
-            cur_index += len(original_lines[start_line]) + 1
-            start_line += 1
+        for i in index.candidates(first_anchor, index.line_at(start_index), len(index) - block_size):
+            if index.stripped[i + block_size - 1] == last_anchor:
+                return index.span(i, block_size)
 
-        for i in range(start_line, len(original_lines) - block_size + 1):
-            if original_lines[i].strip() != first_anchor:
-                continue
-            if original_lines[i + block_size - 1].strip() != last_anchor:
+        return False
+
+    def similarity_fallback_match(
+        self,
+        original_content: str,
+        search_content: str,
+        start_index: int,
+        line_index: Optional[LineIndex] = None,
+        threshold: float = DIFF_SIMILARITY_THRESHOLD
+    ) -> Union[Tuple[int, int, float], bool]:
+        """
+        Approximate match for a SEARCH block the exact and line-based matchers missed,
+        e.g. because the model changed indentation, spacing or a few characters.
+
+        Candidate regions come from a rolling window over per-line scores: every word
+        token of the SEARCH block adds 1/occurrences to the lines containing it, so rare
+        identifiers outweigh keywords. The best windows of each size are then compared
+        to the block with SequenceMatcher on their whitespace-normalized text.
+
+        A region only qualifies if it contains every rare token of the block (one on at
+        most DIFF_SIMILARITY_RARE_LINES file lines, e.g. a misspelled identifier) and no
+        non-blank line without a counterpart in the block, which the REPLACE would
+        silently delete. Blocks under DIFF_SIMILARITY_MIN_LINES non-blank lines are not
+        matched at all.
+        Returns (start, end, similarity) of the most similar region at or above
+        `threshold`, or False when there is none or when two separate regions are
+        equally similar.
+        """
+        if threshold > 1:
+            return False
+        index = line_index or LineIndex(original_content)
+        search_lines = search_content.split("\n")
+        if search_lines and search_lines[-1] == "":
+            search_lines.pop()
+        search_lines = [line.strip() for line in search_lines]
+        if sum(1 for line in search_lines if line) < DIFF_SIMILARITY_MIN_LINES:
+            return False
+        search_tokens = {token for line in search_lines for token in _WORD_PATTERN.findall(line)}
+        rare_tokens = {token for token in search_tokens if len(index.token_lines.get(token, ())) <= DIFF_SIMILARITY_RARE_LINES}
+
+        line_scores = [0.0] * len(index)
+        for token in search_tokens:
+            lines = index.token_lines.get(token, ())
+            for i in lines:
+                line_scores[i] += 1.0 / len(lines)
+        # Prefix sums give every window's score in O(1)
+        prefix = [0.0]
+        prefix.extend(accumulate(line_scores))
+
+        first_line = index.line_at(start_index)
+        block_size = len(search_lines)
+        candidates: List[Tuple[int, int]] = []
+        for size in range(max(1, block_size - DIFF_SIMILARITY_SIZE_SLACK), block_size + DIFF_SIMILARITY_SIZE_SLACK + 1):
+            starts = range(first_line, len(index) - size + 1)
+            scores = [prefix[i + size] - prefix[i] for i in starts]
+            best = heapq.nlargest(DIFF_SIMILARITY_CANDIDATES, range(len(scores)), key=scores.__getitem__)
+            candidates.extend((starts[j], size) for j in best if scores[j] > 0)
+
+        target = _normalize_lines(search_lines)
+        scored: List[Tuple[float, int, int]] = []
+        for i, size in candidates:
+            region = _normalize_lines(index.stripped[i:i + size])
+            matcher = SequenceMatcher(None, region, target, autojunk=False)
+            if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
                 continue
-            match_start = sum(len(l) + 1 for l in original_lines[:i])
-            match_end = match_start + sum(len(l) + 1 for l in original_lines[i:i+block_size])
-            return (match_start, match_end)
+            ratio = matcher.ratio()
+            if ratio >= threshold and rare_tokens <= set(_WORD_PATTERN.findall(region)) and self._region_covered(region, target):
+                scored.append((ratio, i, size))
+        if not scored:
+            return False
 
-        return False
+        scored.sort(key=lambda s: (-s[0], s[2]))
+        best_ratio, best_line, best_size = scored[0]
+        for ratio, i, size in scored[1:]:
+            if best_ratio - ratio > DIFF_SIMILARITY_AMBIGUITY:
+                break
+            if i >= best_line + best_size or best_line >= i + size:
+                logger.warning(f"Approximate SEARCH match is ambiguous (lines {best_line + 1} and {i + 1}, similarity {best_ratio:.2f}).")
+                return False
+
+        start, end = index.span(best_line, best_size)
+        return start, end, best_ratio
+
+    @staticmethod
+    def _region_covered(region: str, target: str) -> bool:
+        """Whether every non-blank line of the (normalized) region has a counterpart line in the target."""
+        matcher = SequenceMatcher(None, region.split("\n"), target.split("\n"), autojunk=False)
+        return all(i2 - i1 <= j2 - j1 for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag in ("delete", "replace"))
 
     def apply_diff_to_content(
         self,
@@ -168,6 +317,8 @@ class DiffParsingService:
         """
         Apply SEARCH/REPLACE diffs to original_content.
         Returns {'success': True, 'content': new_content} or {'success': False, 'error_message': msg}.
+        When a SEARCH block was only matched approximately, the success result also has
+        'approximate_matches': [{'block': n, 'line': first_line, 'similarity': ratio}, ...].
         """
         try:
             # Normalize markers before processing
@@ -190,6 +341,11 @@ class DiffParsingService:
             replacements: List[Dict[str, Union[int, str]]] = []
             out_of_order = False
 
+            # Built on the first fallback match and reused by all later blocks
+            line_index: Optional[LineIndex] = None
+            block_number = 0
+            approximate_matches: List[Dict[str, Union[int, float]]] = []
+
             lines = diff_content.split("\n")
             # drop incomplete marker
             if lines and lines[-1].startswith((self.SEARCH_BLOCK_CHAR,
@@ -209,6 +365,7 @@ class DiffParsingService:
                         # nested/overlapping blocks are malformed
                         raise ValueError("Malformed diff: found SEARCH block start while previous block not closed. Ensure '<<<<<<< SEARCH' and '=======' / '>>>>>>> REPLACE' markers are used correctly.")
                     is_valid_diff = True
+                    block_number += 1
                     in_search = True
                     in_replace = False
                     current_search = []
@@ -235,11 +392,13 @@ class DiffParsingService:
                         if idx != -1:
                             search_start, search_end = idx, idx + len(search_text)
                         else:
-                            fallback = self.line_trimmed_fallback_match(original_content, search_text, last_index)
+                            if line_index is None:
+                                line_index = LineIndex(original_content)
+                            fallback = self.line_trimmed_fallback_match(original_content, search_text, last_index, line_index)
                             if fallback:
                                 search_start, search_end = fallback  # type: ignore
                             else:
-                                anchor = self.block_anchor_fallback_match(original_content, search_text, last_index)
+                                anchor = self.block_anchor_fallback_match(original_content, search_text, last_index, line_index)
                                 if anchor:
                                     search_start, search_end = anchor  # type: ignore
                                 else:
@@ -248,9 +407,15 @@ class DiffParsingService:
                                         search_start, search_end = full_idx, full_idx + len(search_text)
                                         out_of_order = (search_start < last_index)
                                     else:
-                                        # Provide a short excerpt to help debugging
-                                        excerpt = (search_text[:200] + '...') if len(search_text) > 200 else search_text
-                                        raise ValueError(f"SEARCH block not found in original content. Excerpt: {excerpt}")
+                                        similar = self.similarity_fallback_match(original_content, search_text, last_index, line_index)
+                                        if not similar:
+                                            # Provide a short excerpt to help debugging
+                                            excerpt = (search_text[:200] + '...') if len(search_text) > 200 else search_text
+                                            raise ValueError(f"SEARCH block not found in original content. Excerpt: {excerpt}")
+                                        search_start, search_end, similarity = similar
+                                        line = line_index.line_at(search_start) + 1
+                                        logger.warning(f"SEARCH block #{block_number} matched approximately at line {line} (similarity {similarity:.2f}).")
+                                        approximate_matches.append({"block": block_number, "line": line, "similarity": round(similarity, 3)})
 
                     if search_start < last_index:
                         out_of_order = True
@@ -326,9 +491,13 @@ class DiffParsingService:
                     pos = rep["end"]
                 new_parts.append(original_content[pos:])
                 new_content = "".join(new_parts)
-                return {"success": True, "content": new_content}
+                result = {"success": True, "content": new_content}
+            else:
+                result = {"success": True, "content": "".join(result_parts)}
 
-            return {"success": True, "content": "".join(result_parts)}
+            if approximate_matches:
+                result["approximate_matches"] = approximate_matches
+            return result
 
         except Exception as e:
             logger.exception("Error applying diff")
@@ -379,4 +548,62 @@ export default function SecondPage() {
 >>>>>>>REPLACE
 """
     result = service.apply_diff_to_content(diff_content=diff_content, original_content=original_content, is_final=True)
-    print(result)
\ No newline at end of file
+    print(result)
+
+    print("\n--- Approximate SEARCH match ---")
+    # The model misremembered quotes, spacing and punctuation; exact, line-trimmed and anchor matching all fail
+    fuzzy_diff = """<<<<<<< SEARCH
+    <div className='flex flex-col items-center justify-center min-h-screen bg-gray-100'>
+      <h1 className="mb-8 text-4xl font-bold text-gray-800">Second  Page</h1>
+      <p className="text-gray-600">You have successfully navigated to the second page</p>
+=======
+    <div className="flex flex-col items-center justify-center min-h-screen bg-white">
+      <h1 className="mb-8 text-4xl font-bold text-gray-800">Second Page</h1>
+      <p className="text-gray-600">You have successfully navigated to the second page!</p>
+>>>>>>> REPLACE"""
+    result = service.apply_diff_to_content(diff_content=fuzzy_diff, original_content=original_content, is_final=True)
+    print(result.get("approximate_matches"), "bg-white" in result.get("content", ""))
+
+    print("\n--- Benchmark: fallback matching on a large TSX file ---")
+    import random
+    import time
+
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+    components = []
+    for i in range(400):
+        components.append(
+            f"export function Component{i}({{ value }}: Props) {{\n"
+            f"  const [state{i}, setState{i}] = useState(value);\n"
+            f"  useEffect(() => {{\n"
+            f"    setState{i}(value * {i});\n"
+            f"  }}, [value]);\n"
+            f"  return (\n"
+            f"    <div className=\"component-{i}\">\n"
+            f"      <span>{{state{i}}}</span>\n"
+            f"    </div>\n"
+            f"  );\n"
+            f"}}\n"
+        )
+    large_file = "import React, { useEffect, useState } from 'react';\n\n" + "\n".join(components)
+
+    # Re-indented SEARCH blocks miss the exact match and go through line_trimmed_fallback_match
+    blocks = []
+    for i in sorted(random.sample(range(400), 40)):
+        search = f"    const [state{i}, setState{i}] = useState(value);\n      useEffect(() => {{\n        setState{i}(value * {i});"
+        replace = f"  const [state{i}, setState{i}] = useState(value + 1);\n  useEffect(() => {{\n    setState{i}(value * {i});"
+        blocks.append(f"<<<<<<< SEARCH\n{search}\n=======\n{replace}\n>>>>>>> REPLACE")
+    large_diff = "\n".join(blocks)
+
+    start = time.perf_counter()
+    result = service.apply_diff_to_content(diff_content=large_diff, original_content=large_file, is_final=True)
+    elapsed = time.perf_counter() - start
+    print(f"{large_file.count(chr(10)) + 1} lines, {len(blocks)} blocks: success={result['success']} in {elapsed * 1000:.2f}ms")
+
+    # Same blocks without semicolons: only the similarity tier finds them
+    fuzzy_large_diff = large_diff.replace("(value);", "(value)")
+    start = time.perf_counter()
+    result = service.apply_diff_to_content(diff_content=fuzzy_large_diff, original_content=large_file, is_final=True)
+    elapsed = time.perf_counter() - start
+    print(f"{len(blocks)} approximate blocks: success={result['success']}, "
+          f"{len(result.get('approximate_matches', []))} approximate matches in {elapsed * 1000:.2f}ms")
@@ -3,20 +3,38 @@
 import os
 import logging
 import difflib
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Tuple, Callable, Optional
 import subprocess
 from pathlib import Path
 import shutil
 import re
-from collections import namedtuple
+import hashlib
+import threading
+import uuid
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 from diff_parsing import DiffParsingService
+from typecheck_service import get_typecheck_service, files_with_errors, format_diagnostics_for_prompt
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 FileState = namedtuple('FileState', ['exists', 'content'])
+# Outcome of phase 1 of apply_changes for one file: its state before (pending or on disk) and after all of its changes,
+# the content its last successful modify started from (for the .diff file), and (index, info, error) per change
+FilePlan = namedtuple('FilePlan', ['rel_path', 'original', 'final', 'modified_from', 'outcomes'])
+
+# Upper bound on diff results computed ahead of apply_changes (see prevalidate_change)
+PREVALIDATED_CACHE_SIZE = 64
+# Files whose new content apply_changes computes concurrently
+APPLY_CHANGES_WORKERS = int(os.getenv("APPLY_CHANGES_WORKERS", 8))
+# Set TYPECHECK_OVERLAY=0 to write changes before type-checking them, even with the daemon
+TYPECHECK_OVERLAY = os.getenv("TYPECHECK_OVERLAY", "1") == "1"
+
+APPLIED_CHANGE_DETAILS = "Change was applied but the file contains compilation errors. For fixing assume the previous changes were applied and treat the file contents as new."
+PENDING_CHANGE_DETAILS = "Change was applied but the file contains compilation errors, so it is not saved yet. For fixing assume the previous changes were applied and treat the file contents as new; fetch_files returns them."
 
 class FileOperationsService:
     """
@@ -38,13 +56,88 @@ class FileOperationsService:
         if not self.project_root or not os.path.isdir(self.project_root):
             raise ValueError("A valid project_root directory must be provided.")
 
+        # Callbacks invoked with the relative path of every file this service writes or deletes
+        self._change_listeners: List[Callable[[str], None]] = []
+
+        # (path, sha256 of original content, sha256 of diffs) -> diff result, filled while the model streams
+        self._prevalidated: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+        self._prevalidated_lock = threading.Lock()
+
+        # owner -> (rel_path -> FilePlan) of batches that did not type-check yet, not written to disk.
+        # A path is pending for at most one owner.
+        self._pending: "Dict[Optional[str], OrderedDict[str, FilePlan]]" = {}
+        self._pending_lock = threading.Lock()
+
         logger.info(f"FileOperationsService initialized with project root: {self.project_root}")
 
-    def apply_changes(self, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def add_change_listener(self, listener: Callable[[str], None]) -> None:
+        """Registers a callback that is notified of every file written or deleted by this service."""
+        self._change_listeners.append(listener)
+
+    def _notify_change(self, rel_path: str) -> None:
+        for listener in self._change_listeners:
+            try:
+                listener(rel_path)
+            except Exception as e:
+                logger.warning(f"Change listener failed for {rel_path}: {e}")
+
+    def prevalidate_change(self, change: Dict[str, Any]) -> Optional[str]:
+        """
+        Applies a single 'modify' change's SEARCH/REPLACE blocks in memory, without writing,
+        and remembers the result so apply_changes can reuse it if the file is unchanged by then.
+
+        Returns:
+            The diff error message, or None if the change applies cleanly (or is not a modify).
+        """
+        rel_path = change.get("path")
+        diffs = change.get("differences")
+        if change.get("type") != "modify" or not rel_path or not diffs:
+            return None
+
+        path = Path(self.project_root) / rel_path
+        if not path.is_file():
+            return "File to modify does not exist."
+
+        original_content = path.read_text(encoding="utf-8")
+        key = self._prevalidation_key(rel_path, original_content, diffs)
+        with self._prevalidated_lock:
+            cached = self._prevalidated.get(key)
+        if cached is None:
+            cached = self.diff_parser.apply_diff_to_content(original_content=original_content, diff_content="\n".join(diffs), is_final=True)
+            with self._prevalidated_lock:
+                self._prevalidated[key] = cached
+                while len(self._prevalidated) > PREVALIDATED_CACHE_SIZE:
+                    self._prevalidated.popitem(last=False)
+
+        return None if cached.get("success") else cached.get("error_message")
+
+    @staticmethod
+    def _prevalidation_key(rel_path: str, original_content: str, diffs: List[str]) -> Tuple[str, str, str]:
+        return (
+            Path(rel_path).as_posix(),
+            hashlib.sha256(original_content.encode("utf-8")).hexdigest(),
+            hashlib.sha256(json.dumps(diffs, ensure_ascii=False).encode("utf-8")).hexdigest(),
+        )
+
+    def apply_changes(self, changes: List[Dict[str, Any]], force: bool = False, owner: Optional[str] = None) -> Dict[str, Any]:
         """
     Applies a series of file changes (create, modify, delete) to the project and reports the results.
 
+    The batch is all-or-nothing: the new content of every file is computed in memory first
+    (files in parallel, changes to the same file in order), and files are only written when
+    every change applied cleanly.
+
+    With the type-check daemon, the new contents are also type-checked in memory before
+    anything is written. If the project does not compile, they are kept as pending changes:
+    read_file_state (and so fetch_files) returns them, the next batch of the same owner applies
+    on top of them, and they are written together with its first batch that type-checks (or by
+    commit_pending). Pending files of other owners are part of the check, but their errors are
+    not reported as errors of this batch.
+
     Args:
+        force (bool): Write the changes without type-checking them in memory first.
+        owner (Optional[str]): Who the batch belongs to, e.g. the plan step. Pending changes are
+            only carried into later batches of the same owner.
         changes (List[Dict[str, Any]]): 
             A list of change specifications. 
             Each change dictionary should include:
@@ -62,7 +155,7 @@ class FileOperationsService:
                     "results": []
                 }
 
-            If some or all changes fail:
+            If some or all changes fail (nothing is written; the other changes are "skipped"):
                 {
                     "status": "failure",
                     "scope": "file",
@@ -71,6 +164,16 @@ class FileOperationsService:
                     "results": List[Dict[str, Any]]  # Per-change result details
                 }
 
+            If the changes applied but the project no longer type-checks:
+                {
+                    "status": "failure",
+                    "scope": "project",
+                    "errors": str,            # Errors grouped per file (see format_diagnostics_for_prompt)
+                    "error_files": List[str], # Files with at least one compiler error
+                    "diagnostics": List[TypeDiagnostic],
+                    "results": List[Dict[str, Any]]
+                }
+
             If all changes succeed:
                 {
                     "status": "success",
@@ -82,8 +185,8 @@ class FileOperationsService:
                     "index": int,         # Index of the change in the input list
                     "path": str,          # File path associated with the change
                     "type": str,          # Change type ("create", "modify", "delete")
-                    "status": str,        # "success", "failure", or "error"
-                    "details": Optional[str]  # Error details if applicable
+                    "status": str,        # "success", "failure", "skipped", or "error"
+                    "details": Optional[str]  # Error details, or a note on a successful change (e.g. approximate SEARCH matches)
                 }
 
     Raises:
@@ -92,46 +195,46 @@ class FileOperationsService:
         if not changes:
             return {"status": "failure", "errors": ["No changes were provided."], "results": []}
 
-        results = []
+        results: List[Optional[Dict[str, Any]]] = [None] * len(changes)
         errors = []
 
+        # Changes to the same file are applied on top of each other, in order
+        file_changes: "OrderedDict[str, List[int]]" = OrderedDict()
         for i, change in enumerate(changes):
             change_type = change.get("type")
             rel_path = change.get("path")
-            result_payload = {"index": i, "path": rel_path, "type": change_type}
-            
             if not all([change_type, rel_path]):
                 error_msg = f"Change #{i} is invalid: missing 'type' or 'path'."
                 errors.append({"file_path": rel_path, "error": error_msg})
-                results.append({**result_payload, "status": "error", "details": error_msg})
+                results[i] = {"index": i, "path": rel_path, "type": change_type, "status": "error", "details": error_msg}
                 continue
-            
-            try:
-                full_path = Path(self.project_root) / rel_path
-                if change_type == "create":
-                    _, error = self._process_create(full_path, change)
-                elif change_type == "modify":
-                    _, error = self._process_modify(full_path, change, i)
-                elif change_type == "delete":
-                    _, error = self._process_delete(full_path)
-                else:
-                    error = f"Unknown change type: {change_type}"
+            file_changes.setdefault(os.path.normpath(rel_path), []).append(i)
 
+        # Phase 1: compute the final content of every file in memory, files in parallel
+        workers = max(1, min(APPLY_CHANGES_WORKERS, len(file_changes)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="apply-changes") as executor:
+            plans: List[FilePlan] = list(executor.map(lambda indexes: self._plan_file(changes, indexes), file_changes.values()))
+
+        for plan in plans:
+            for i, info, error in plan.outcomes:
+                change = changes[i]
+                result_payload = {"index": i, "path": change.get("path"), "type": change.get("type")}
                 if error:
-                    errors.append({"file_path": rel_path, "error": error})
-                    results.append({**result_payload, "status": "failure", "details": error})
+                    errors.append({"file_path": change.get("path"), "error": error})
+                    results[i] = {**result_payload, "status": "failure", "details": error}
                 else:
-                    results.append({**result_payload, "status": "success"})
+                    results[i] = {**result_payload, "status": "success", **info}
 
-            except Exception as e:
-                logger.exception(f"Unexpected error processing change #{i} for path {rel_path}")
-                error_msg = f"System error: {str(e)}"
-                errors.append({"file_path": rel_path, "error": error_msg})
-                results.append({**result_payload, "status": "error", "details": error_msg})
-        
         if errors:
+            # Nothing is written unless every change applies
+            for result in results:
+                if result["status"] == "success":
+                    result["status"] = "skipped"
+                    result["details"] = "Not written because another change in this call failed."
             error_files: List[str] = [e.get("file_path") for e in errors if isinstance(e, dict) and e.get("file_path")]
             error_strings: str = "\n".join(e.get("error", "") for e in errors if isinstance(e, dict))
+            error_strings += (f"\nNone of the {len(changes)} changes were written. Resubmit all changes of this "
+                              f"write_to_files call with the failing ones fixed.")
             return {
                 "status": "failure",
                 "scope": "file",
@@ -139,28 +242,168 @@ class FileOperationsService:
                 "error_files": list(set(error_files)),
                 "results": results
             }
-        
-        syntax_result = self._check_project_syntax()
+
+        plans = self._merge_with_pending(plans, owner)
+        changed_files = [r["path"] for r in results if r.get("status") == "success"]
+
+        # Phase 2: with the warm checker, type-check the new contents in memory first. If the
+        # project does not compile they stay pending (see read_file_state) instead of being written.
+        checked = False
+        if TYPECHECK_OVERLAY and not force and get_typecheck_service(self.project_root).supports_overlay:
+            overlay = {plan.rel_path: plan.final.content if plan.final.exists else None for plan in plans}
+            foreign = self._foreign_pending(owner, exclude=set(overlay))
+            syntax_result = self._check_project_syntax(list(overlay), {**foreign, **overlay})
+            syntax_result = self._without_files(syntax_result, set(foreign))
+            if syntax_result["available"] and not syntax_result["success"]:
+                self._settle_pending(owner, plans, keep=True)
+                logger.warning(f"Project syntax check failed; keeping {len(plans)} file(s) in memory.")
+                return self._project_failure_report(results, syntax_result, PENDING_CHANGE_DETAILS)
+            checked = syntax_result["available"]
+
+        # Phase 3: write all files or none
+        try:
+            self._commit_plans(plans)
+        except Exception as e:
+            logger.exception("Failed to write the changes; the project was restored to its previous state.")
+            error_msg = f"System error: {str(e)}. No files were changed."
+            for result in results:
+                result["status"] = "error"
+                result["details"] = error_msg
+            return {
+                "status": "failure",
+                "scope": "file",
+                "errors": error_msg,
+                "error_files": sorted({r["path"] for r in results}),
+                "results": results
+            }
+        self._settle_pending(owner, plans, keep=False)
+        self._after_commit(plans)
+
+        if checked:
+            return {"status": "success", "results": results}
+
+        syntax_result = self._check_project_syntax(changed_files)
         #return {"status": "success", "results": results}
         if syntax_result["success"]:
             return {"status": "success", "results": results}
         
         logger.warning("Project syntax check failed.")
-        project_errors = syntax_result["errors"]
-        syntax_error_files = self._extract_error_files(str(project_errors))
+        return self._project_failure_report(results, syntax_result, APPLIED_CHANGE_DETAILS)
+
+    @staticmethod
+    def _without_files(syntax_result: Dict[str, Any], paths: set) -> Dict[str, Any]:
+        """The check result without the diagnostics in `paths`; a success if only those files had errors."""
+        if syntax_result["success"] or not paths or not syntax_result["diagnostics"]:
+            return syntax_result
+        diagnostics = [d for d in syntax_result["diagnostics"] if not d.file or os.path.normpath(d.file) not in paths]
+        success = not any(d.category == "error" for d in diagnostics)
+        return {**syntax_result, "success": success, "diagnostics": diagnostics}
+
+    def _project_failure_report(self, results: List[Dict[str, Any]], syntax_result: Dict[str, Any], details: str) -> Dict[str, Any]:
+        diagnostics = syntax_result["diagnostics"]
+        syntax_error_files = set(files_with_errors(diagnostics))
+        # Grouped, errors-only rendering keeps the repair prompt small; raw output if nothing parsed
+        project_errors = format_diagnostics_for_prompt(diagnostics) or syntax_result["errors"]
 
         for result in results:
             if result["status"] == "success" and result["path"] in syntax_error_files:
                 result["status"] = "failure"
-                result["details"] = "Change was applied but the file contains compilation errors. For fixing assume the previous changes were applied and treat the file contents as new."
+                result["details"] = details
         
         return {
             "status": "failure",
             "scope": "project",
             "errors": project_errors,
-            "error_files": list(syntax_error_files),
+            "error_files": sorted(syntax_error_files),
+            "diagnostics": diagnostics,
             "results": results
         }
+
+    # ---------------- Pending (uncommitted) changes ---------------- #
+
+    def read_file_state(self, rel_path: str) -> FileState:
+        """State of a file as the model should see it: its pending content if any, else the file on disk."""
+        pending = self.pending_state(rel_path)
+        return pending if pending is not None else self._capture_file_state(rel_path)
+
+    def pending_state(self, rel_path: str) -> Optional[FileState]:
+        """The content held in memory for `rel_path` by a batch that did not type-check, or None."""
+        rel_path = os.path.normpath(rel_path)
+        with self._pending_lock:
+            plan = next((pending[rel_path] for pending in self._pending.values() if rel_path in pending), None)
+        return plan.final if plan is not None else None
+
+    def has_pending_changes(self) -> bool:
+        with self._pending_lock:
+            return any(self._pending.values())
+
+    def commit_pending(self) -> List[str]:
+        """
+        Writes the changes held in memory, of every owner, to disk even though they do not type-check,
+        e.g. when a request ends, so the project on disk reflects the work done. Returns the written paths.
+        """
+        with self._pending_lock:
+            plans = [plan for pending in self._pending.values() for plan in pending.values()]
+        if not plans:
+            return []
+        try:
+            self._commit_plans(plans)
+        except Exception as e:
+            logger.error(f"Could not write {len(plans)} pending file(s): {e}")
+            return []
+        logger.info(f"Wrote {len(plans)} pending file(s) that did not type-check.")
+        with self._pending_lock:
+            self._pending.clear()
+        self._after_commit(plans)
+        return [plan.rel_path for plan in plans]
+
+    def discard_pending(self) -> None:
+        with self._pending_lock:
+            self._pending.clear()
+
+    def _merge_with_pending(self, plans: List[FilePlan], owner: Optional[str]) -> List[FilePlan]:
+        """
+        The batch's plans plus the owner's pending files it does not touch; they are checked and
+        written together.
+        """
+        planned = {plan.rel_path for plan in plans}
+        with self._pending_lock:
+            own = self._pending.get(owner, {})
+            carried = [plan._replace(outcomes=[]) for path, plan in own.items() if path not in planned]
+        return carried + plans
+
+    def _settle_pending(self, owner: Optional[str], plans: List[FilePlan], keep: bool) -> None:
+        """
+        Records the outcome of the owner's batch: its plans stay pending (keep) or were written.
+        Files pending for another owner that the batch changed were applied on top of (see
+        read_file_state), so they are dropped from that owner either way.
+        """
+        planned = {plan.rel_path for plan in plans}
+        with self._pending_lock:
+            for other in [other for other in self._pending if other != owner]:
+                for path in planned & set(self._pending[other]):
+                    del self._pending[other][path]
+                if not self._pending[other]:
+                    del self._pending[other]
+            if keep:
+                self._pending[owner] = OrderedDict((plan.rel_path, plan) for plan in plans)
+            else:
+                self._pending.pop(owner, None)
+
+    def _foreign_pending(self, owner: Optional[str], exclude: set) -> Dict[str, Optional[str]]:
+        """Content of the files pending for other owners, except `exclude`, as a type-check overlay."""
+        with self._pending_lock:
+            return {path: plan.final.content if plan.final.exists else None
+                    for other, pending in self._pending.items() if other != owner
+                    for path, plan in pending.items() if path not in exclude}
+
+    def _after_commit(self, plans: List[FilePlan]) -> None:
+        for plan in plans:
+            if plan.modified_from is not None and plan.final.exists:
+                self._write_diff_file(abs_path=str(Path(self.project_root) / plan.rel_path),
+                                      original_content=plan.modified_from, new_content=plan.final.content)
+        for plan in plans:
+            self._notify_change(plan.rel_path)
     
     def _capture_file_state(self, rel_path: str) -> FileState:
         """Capture current state of a file."""
@@ -192,70 +435,138 @@ class FileOperationsService:
             logger.error(f"Error restoring file {rel_path}: {e}")
             raise # Re-raise to be caught by the critical error handler
 
-    def _extract_error_files(self, tsc_errors: str) -> set:
-        """
-        Extract file paths from TypeScript compiler errors.
-        """
-        error_files = set()
-        pattern = re.compile(r'^(.*\.(?:ts|tsx|js|jsx))\((\d+),(\d+)\):\s+error TS\d+:')
-        
-        for line in tsc_errors.splitlines():
-            match = pattern.match(line.strip())
-            if match:
-                # The first group is the file path.
-                file_path = match.group(1)
-                try:
-                    # Normalize the path to be relative from the project root.
-                    abs_path = Path(self.project_root) / file_path
-                    if abs_path.exists():
-                         # Make path relative to the project root for consistency
-                        rel_path = abs_path.relative_to(self.project_root)
-                        error_files.add(rel_path.as_posix())
-                    else:
-                        error_files.add(Path(file_path).as_posix()) # Add as is if path resolution is tricky
-                except Exception:
-                    error_files.add(Path(file_path).as_posix())
-        
-        return error_files
+    def _plan_file(self, changes: List[Dict[str, Any]], indexes: List[int]) -> FilePlan:
+        """Applies the changes at `indexes`, which all target one file, to its content in memory."""
+        rel_path = os.path.normpath(changes[indexes[0]]["path"])
+        original = self.read_file_state(rel_path)
+        current = original
+        modified_from = None
+        outcomes = []
+
+        for i in indexes:
+            change = changes[i]
+            change_type = change.get("type")
+            info: Dict[str, Any] = {}
+            try:
+                if change_type == "create":
+                    current, error = self._plan_create(current, change)
+                elif change_type == "modify":
+                    before = current
+                    current, info, error = self._plan_modify(rel_path, current, change, i)
+                    if not error and current is not before:
+                        modified_from = before.content
+                elif change_type == "delete":
+                    current, info, error = self._plan_delete(rel_path, current)
+                else:
+                    error = f"Unknown change type: {change_type}"
+            except Exception as e:
+                logger.exception(f"Unexpected error processing change #{i} for path {rel_path}")
+                error = f"System error: {str(e)}"
+            outcomes.append((i, info, error))
 
-    def _process_create(self, path: Path, change: Dict) -> Tuple[Dict, str]:
+        return FilePlan(rel_path, original, current, modified_from, outcomes)
+
+    def _plan_create(self, current: FileState, change: Dict) -> Tuple[FileState, str]:
         content = change.get("content")
         if content is None:
-            return {}, "Create operation missing 'content' field."
-        
-        try:          
-            path.parent.mkdir(parents=True, exist_ok=True)
-            path.write_text(content, encoding="utf-8")
-            return {}, ""
-        except Exception as e:
-            return {}, f"Failed to write file: {e}"
+            return current, "Create operation missing 'content' field."
+        return FileState(True, content), ""
 
-    def _process_modify(self, path: Path, change: Dict, change_number: int) -> Tuple[Dict, str]:
+    def _plan_modify(self, rel_path: str, current: FileState, change: Dict, change_number: int) -> Tuple[FileState, Dict, str]:
         diffs = change.get("differences")
         if not diffs:
             logger.warning(f"Modify operation {change_number + 1} missing 'differences' field.")
             # Instead of returning an error we will pass it as sucess because soemtimes the AI does a verification run without any changes.
-            return {}, ""
+            return current, {}, ""
 
-        if not path.exists():
-            return {}, "File to modify does not exist."
+        if not current.exists or current.content is None:
+            return current, {}, "File to modify does not exist."
 
-        try:
-            original_content = path.read_text(encoding="utf-8")
+        # Reuse the result computed while the response was still streaming, if the file is unchanged
+        key = self._prevalidation_key(rel_path, current.content, diffs)
+        with self._prevalidated_lock:
+            result = self._prevalidated.pop(key, None)
+        if result is None:
             combined_diff = "\n".join(diffs)
-            result = self.diff_parser.apply_diff_to_content(original_content=original_content, diff_content=combined_diff, is_final=True)
-            
-            if not result.get("success"):
-                return {}, result.get("error_message")
-            
-            new_content = result.get("content")
-            path.write_text(new_content, encoding="utf-8")
-            self._write_diff_file(abs_path=str(path), original_content=original_content, new_content=new_content)
-            return {}, ""
-        except Exception as e:
-            logger.exception(f"Failed to apply modification: {e}")
-            return {}, f"Failed to apply modification for file {path.name}: {e}"
-    
+            result = self.diff_parser.apply_diff_to_content(original_content=current.content, diff_content=combined_diff, is_final=True)
+
+        if not result.get("success"):
+            return current, {}, result.get("error_message")
+        return FileState(True, result.get("content")), self._approximate_match_info(result), ""
+
+    def _plan_delete(self, rel_path: str, current: FileState) -> Tuple[FileState, Dict, str]:
+        if not current.exists:
+            logger.warning(f"Attempted to delete non-existent file: {rel_path}")
+            return current, {"details": "File did not exist, no action taken."}, ""
+        return FileState(False, None), {}, ""
+
+    def _commit_plans(self, plans: List[FilePlan]) -> None:
+        """
+        Writes the final state of every planned file, or none of them.
+
+        New contents are first written to temporary files next to their targets; only
+        when all of them are on disk is each target swapped in with os.replace (atomic
+        per file). If a swap or delete fails, the files already committed are restored
+        to their state on disk before the commit with _restore_file_state and the error
+        is re-raised.
+        """
+        staged: List[Tuple[FilePlan, FileState, Optional[Path]]] = []
+        try:
+            for plan in plans:
+                disk_state = self._capture_file_state(plan.rel_path)
+                if plan.final == disk_state:
+                    continue
+                full_path = Path(self.project_root) / plan.rel_path
+                if not plan.final.exists:
+                    staged.append((plan, disk_state, None))
+                    continue
+                full_path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = full_path.with_name(f".{full_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+                with open(temp_path, "x", encoding="utf-8") as f:
+                    f.write(plan.final.content)
+                staged.append((plan, disk_state, temp_path))
+                if full_path.is_file():
+                    shutil.copymode(full_path, temp_path)
+        except Exception:
+            self._discard_temp_files(staged)
+            raise
+
+        committed: List[Tuple[FilePlan, FileState]] = []
+        try:
+            for plan, disk_state, temp_path in staged:
+                full_path = Path(self.project_root) / plan.rel_path
+                if temp_path is not None:
+                    os.replace(temp_path, full_path)
+                elif full_path.exists():
+                    os.remove(full_path)
+                committed.append((plan, disk_state))
+        except Exception:
+            logger.error(f"Commit failed after {len(committed)} of {len(staged)} file(s); rolling back.")
+            for plan, disk_state in reversed(committed):
+                self._restore_file_state(plan.rel_path, disk_state)
+            self._discard_temp_files(staged)
+            raise
+
+    @staticmethod
+    def _discard_temp_files(staged: List[Tuple[FilePlan, FileState, Optional[Path]]]) -> None:
+        for _, _, temp_path in staged:
+            if temp_path is not None:
+                try:
+                    temp_path.unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not remove temporary file {temp_path}: {e}")
+
+    @staticmethod
+    def _approximate_match_info(result: Dict[str, Any]) -> Dict[str, Any]:
+        """Tells the model which SEARCH blocks were applied by similarity rather than an exact match."""
+        matches = result.get("approximate_matches")
+        if not matches:
+            return {}
+        blocks = ", ".join(f"#{m['block']} at line {m['line']} (similarity {m['similarity']:.2f})" for m in matches)
+        return {"details": f"SEARCH block(s) {blocks} did not match exactly and were applied to the most similar region. Check these edits."}
+
     def _write_diff_file(self, abs_path: str, original_content: str, new_content: str) -> str:
         original_lines = original_content.splitlines(keepends=True)
         new_lines = new_content.splitlines(keepends=True)
@@ -270,36 +581,14 @@ class FileOperationsService:
         logger.info(f"Diff file saved at: {diff_file_path}")
         return diff_file_path
     
-    def _process_delete(self, path: Path) -> Tuple[Dict, str]:
-        if not path.exists():
-            logger.warning(f"Attempted to delete non-existent file: {path}")
-            return {"details": "File did not exist, no action taken."}, ""
-        try:
-            os.remove(str(path))
-            return {}, ""
-        except Exception as e:
-            return {}, f"Failed to delete file: {e}"
-    
-    def _check_project_syntax(self) -> dict:
-        # Use npx to ensure the project's version of typescript is used
-        tsc_command = shutil.which("npx")
-        if not tsc_command:
-            return {"success": False, "errors": "Could not find 'npx' in PATH. Please ensure Node.js is installed."}
-        
-        # Command arguments for running tsc via npx
-        cmd = [tsc_command, "tsc", "-b", "--noEmit", "--pretty", "false"]
-        
-        try:
-            logger.info(f"Running project syntax check with command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, cwd=self.project_root, check=True, capture_output=True, text=True, encoding='utf-8')
-            return {"success": True, "errors": ""}
-        except subprocess.CalledProcessError as e:
-            # Combine stderr and stdout for a complete error picture
-            error_output = (e.stderr or "") + (e.stdout or "")
-            logger.warning(f"Syntax check failed with output:\n{error_output}")
-            return {"success": False, "errors": error_output}
-        except FileNotFoundError:
-            return {"success": False, "errors": "Command 'npx' not found. Is Node.js installed and in your PATH?"}
+    def _check_project_syntax(self, changed_files: Optional[List[str]] = None,
+                              overlay: Optional[Dict[str, Optional[str]]] = None) -> dict:
+        # Delegates to the shared, warm type-check daemon (falls back to `npx tsc -b`)
+        result = get_typecheck_service(self.project_root).check(changed_files, overlay)
+        if not result["success"] and result["available"]:
+            logger.warning(f"Syntax check failed with output:\n{result['errors']}")
+        return {"success": result["success"], "errors": result["errors"], "diagnostics": result["diagnostics"],
+                "available": result["available"]}
         
 if __name__ == "__main__":
     service = FileOperationsService(project_root="../app_template/react-app")
@@ -0,0 +1,185 @@
+"""
+JSON codec for POKIO system.
+Drop-in `loads`/`dumps` for the hot paths (response verification, tool results,
+conversation logs). It uses orjson (or msgspec for decoding) when installed and
+falls back to the stdlib `json` module otherwise.
+
+The output is the same as the stdlib's:
+- `loads` returns what `json.loads` returns. Input the fast backend rejects
+  (NaN, huge integers, invalid JSON) is decoded again by the stdlib, so errors
+  carry the stdlib's messages.
+- `dumps` uses orjson only for a layout it writes identically to `json.dumps`,
+  i.e. `indent=2, ensure_ascii=False`, and only for values built from plain JSON
+  types (dict with str keys, list, tuple, str, int, float, bool, None). orjson
+  also encodes enums, UUIDs, dataclasses and datetimes, which the stdlib rejects
+  or writes differently, so anything else goes through the stdlib. The default
+  `json.dumps(obj)` layout (", " / ": " separators, ASCII escapes) is what
+  prompts are built from, so it always goes through the stdlib.
+
+Known differences with indent=2: orjson writes floats outside [1e-4, 1e16)
+without the exponent sign/padding (1e16 instead of 1e+16) and NaN/Infinity as null.
+
+Backend selection: JSON_BACKEND=auto (default) | orjson | msgspec | stdlib
+"""
+import json
+import logging
+import os
+from typing import Any, Optional, Union
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+JSON_BACKENDS = ("auto", "orjson", "msgspec", "stdlib")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _select_backend(requested: str) -> str:
+    if requested not in JSON_BACKENDS:
+        logger.warning(f"Unknown JSON_BACKEND '{requested}', expected one of {JSON_BACKENDS}. Using auto.")
+        requested = "auto"
+    if requested in ("auto", "orjson") and orjson is not None:
+        return "orjson"
+    if requested in ("auto", "msgspec") and msgspec is not None:
+        return "msgspec"
+    if requested not in ("auto", "stdlib"):
+        logger.warning(f"JSON backend '{requested}' is not installed. Using the stdlib json module.")
+    return "stdlib"
+
+
+backend = _select_backend(JSON_BACKEND)
+
+if backend == "orjson":
+    _fast_loads = orjson.loads
+elif backend == "msgspec":
+    _fast_loads = msgspec.json.Decoder().decode
+else:
+    _fast_loads = None
+
+
+_PLAIN_SCALARS = (str, int, float, bool, type(None))
+
+
+def _is_plain(obj: Any) -> bool:
+    """True if `obj` only contains exact dict (str keys), list, tuple and scalar types."""
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind in _PLAIN_SCALARS:
+            continue
+        if kind is dict:
+            for key, item in value.items():
+                if type(key) is not str:
+                    return False
+                if type(item) not in _PLAIN_SCALARS:
+                    stack.append(item)
+        elif kind is list or kind is tuple:
+            stack.extend(item for item in value if type(item) not in _PLAIN_SCALARS)
+        else:
+            return False
+    return True
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Same result as `json.loads(data)`."""
+    if _fast_loads is not None:
+        try:
+            return _fast_loads(data)
+        except Exception:
+            pass
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: Optional[int] = None, ensure_ascii: bool = True) -> str:
+    """Same output as `json.dumps(obj, indent=indent, ensure_ascii=ensure_ascii)`."""
+    if backend == "orjson" and indent == 2 and not ensure_ascii and _is_plain(obj):
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+        except TypeError:
+            # e.g. integers beyond 64 bits: let the stdlib decide
+            pass
+    return json.dumps(obj, indent=indent, ensure_ascii=ensure_ascii)
+
+
+if __name__ == "__main__":
+    import enum
+    import glob
+    import time
+    import uuid
+    from mock_openrouter import load_recorded_responses
+    from verification_service import VerificationService
+
+    logging.disable(logging.CRITICAL)
+    print(f"JSON backend: {backend}")
+
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs", "logs")
+    responses = [
+        recorded.content
+        for log_path in sorted(glob.glob(os.path.join(log_dir, "*", "*_logs", "full_conversation.log")))
+        for recorded in load_recorded_responses(log_path)
+    ]
+    verifier = VerificationService()
+    blobs = [verifier._extract_json_blob(response)[0] for response in responses]
+    conversation = [{"role": "assistant", "content": response} for response in responses]
+    sources = {
+        path: open(path, "r", encoding="utf-8").read()
+        for path in glob.glob(os.path.join(log_dir, "*", "*_logs", "src", "**", "*.tsx"), recursive=True)
+    }
+    tool_result = {"tool": "fetch_files", "result": [
+        {"filePath": path, "content": content, "status": "success", "metadata": {"fileSize": len(content), "encoding": "utf-8"}}
+        for path, content in sources.items()
+    ]}
+
+    def parse_all(parse):
+        for blob in blobs:
+            try:
+                parse(blob)
+            except ValueError:
+                pass
+
+    cases = [
+        ("loads (recorded response blobs)", lambda: parse_all(json.loads), lambda: parse_all(loads)),
+        ("dumps indent=2 (save_conversation)",
+         lambda: [json.dumps(message, indent=2, ensure_ascii=False) for message in conversation],
+         lambda: [dumps(message, indent=2, ensure_ascii=False) for message in conversation]),
+        ("dumps default (tool result prompt)", lambda: json.dumps(tool_result), lambda: dumps(tool_result)),
+    ]
+
+    class Color(enum.Enum):
+        RED = 1
+    for value in ({"a": Color.RED}, {"id": uuid.UUID(int=1)}, {1: "a"}, {"a": (1, [2.5, None])}):
+        try:
+            expected = json.dumps(value, indent=2, ensure_ascii=False)
+        except TypeError:
+            expected = TypeError
+        try:
+            actual = dumps(value, indent=2, ensure_ascii=False)
+        except TypeError:
+            actual = TypeError
+        assert actual == expected, value
+
+    for message in conversation:
+        assert dumps(message, indent=2, ensure_ascii=False) == json.dumps(message, indent=2, ensure_ascii=False)
+    assert dumps(tool_result) == json.dumps(tool_result)
+
+    rounds = 20
+    for label, stdlib_run, codec_run in cases:
+        timings = []
+        for run in (stdlib_run, codec_run):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                run()
+            timings.append((time.perf_counter() - start) / rounds * 1000)
+        print(f"{label}: stdlib {timings[0]:.2f}ms, codec {timings[1]:.2f}ms ({timings[0] / max(timings[1], 1e-9):.1f}x)")
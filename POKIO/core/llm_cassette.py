@@ -0,0 +1,176 @@
+"""
+LLM cassette for POKIO system.
+Records streamed model responses keyed by a hash of the request (model,
+temperature, messages, reasoning flag) and replays them on identical requests,
+so experiments can be re-run without paying model latency and cost again.
+
+Modes (LLM_CASSETTE_MODE):
+    off            - every call goes to the model (default)
+    record         - every call goes to the model and is (re)recorded
+    replay         - only cassettes are used; a missing cassette is an error
+    record_missing - replay when a cassette exists, record otherwise
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Generator, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")
+LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "llm_cassettes")
+LLM_CASSETTE_MAX_ENTRIES = int(os.getenv("LLM_CASSETTE_MAX_ENTRIES", 2000))
+LLM_CASSETTE_MAX_BYTES = int(os.getenv("LLM_CASSETTE_MAX_BYTES", 500 * 1024 * 1024))
+# 1.0 replays with the recorded chunk timing, 0 as fast as possible
+LLM_CASSETTE_REPLAY_SPEED = float(os.getenv("LLM_CASSETTE_REPLAY_SPEED", 0.0))
+
+CASSETTE_MODES = ("off", "record", "replay", "record_missing")
+
+
+class LLMCassette:
+    """
+    One JSON file per request key:
+        {"key", "model", "chunks": [[seconds_since_start, text], ...],
+         "usage": {prompt_tokens, completion_tokens, total_tokens, cached_tokens}, "stop_reason", "duration"}
+
+    Eviction is least-recently-used by file mtime (replays touch the file) once the
+    directory exceeds `max_entries` files or `max_bytes` bytes.
+    """
+
+    def __init__(self, directory: str = LLM_CASSETTE_DIR, mode: str = LLM_CASSETTE_MODE,
+                 max_entries: int = LLM_CASSETTE_MAX_ENTRIES, max_bytes: int = LLM_CASSETTE_MAX_BYTES,
+                 replay_speed: float = LLM_CASSETTE_REPLAY_SPEED):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode '{mode}', expected one of {CASSETTE_MODES}")
+        self.directory = Path(directory)
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.replay_speed = replay_speed
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def request_key(model: str, temperature: float, messages: List[Dict[str, Any]], reasoning: bool) -> str:
+        payload = json.dumps(
+            {"model": model, "temperature": temperature, "messages": messages, "reasoning": bool(reasoning)},
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    @property
+    def replays(self) -> bool:
+        return self.mode in ("replay", "record_missing")
+
+    @property
+    def records(self) -> bool:
+        return self.mode in ("record", "record_missing")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cassette {path.name}: {e}")
+            return None
+        # Mark as recently used for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def save(self, entry: Dict[str, Any]) -> None:
+        path = self._path(entry["key"])
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            files = []
+            for path in self.directory.glob("*.json"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+
+            total_bytes = sum(size for _, size, _ in files)
+            while files and (len(files) > self.max_entries or total_bytes > self.max_bytes):
+                _, size, path = files.pop(0)
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+                total_bytes -= size
+                logger.info(f"Evicted cassette {path.name}")
+
+    def replay(self, entry: Dict[str, Any]) -> Generator[str, None, None]:
+        """Yields the recorded chunks, paced by `replay_speed` times the recorded timing."""
+        start = time.time()
+        for offset, text in entry.get("chunks", []):
+            if self.replay_speed:
+                delay = offset * self.replay_speed - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield text
+
+
+class CassetteRecorder:
+    """Collects the chunks of one live call together with their timing."""
+
+    def __init__(self, key: str, model: str):
+        self.key = key
+        self.model = model
+        self.start = time.time()
+        self.chunks: List[List[Any]] = []
+
+    def add(self, text: str) -> None:
+        self.chunks.append([round(time.time() - self.start, 4), text])
+
+    def entry(self, usage: Dict[str, int], stop_reason: Optional[str]) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "model": self.model,
+            "chunks": self.chunks,
+            "usage": usage,
+            "stop_reason": stop_reason,
+            "duration": round(time.time() - self.start, 4),
+        }
+
+
+_cassette: Optional[LLMCassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[LLMCassette]:
+    """Returns the shared cassette, or None when LLM_CASSETTE_MODE is off."""
+    global _cassette
+    if LLM_CASSETTE_MODE == "off":
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = LLMCassette()
+            logger.info(f"LLM cassette enabled: mode={_cassette.mode}, dir={_cassette.directory.resolve()}")
+        return _cassette
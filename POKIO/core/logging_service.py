@@ -6,6 +6,13 @@ import subprocess
 import logging
 import shutil
 import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from typecheck_service import get_typecheck_service, files_with_errors, format_diagnostic
+from verification_cache import cached_verification
+from snapshot_store import SnapshotStore
 
 load_dotenv()
 
@@ -20,6 +27,11 @@ if not os.path.exists(LOGS_DIR):
 
 # Dedicated file for token usage
 TOKEN_LOG_FILE = os.path.join(LOGS_DIR, "token_usage.log")
+# Content-addressed snapshots of the src folder, one manifest per request (see snapshot_store)
+SNAPSHOTS_DIR = os.path.join(LOGS_DIR, "snapshots")
+
+# Set QUALITY_PIPELINE_BACKGROUND=1 to let the end-of-request checks run while the next prompt is typed
+QUALITY_PIPELINE_BACKGROUND = os.getenv("QUALITY_PIPELINE_BACKGROUND", "0") == "1"
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +57,8 @@ def log_token_usage_per_call(data: Dict[str, Any]):
         f.write("------------\n")
         f.write(f" - Tokens: {data.get('tokens', 0)}\n")
         f.write(f" - Duration: {data.get('duration', 0.0):.2f}s\n")
+        if "input_tokens" in data:
+            f.write(f" - Input tokens: {data['input_tokens']} (cached: {data.get('cached_tokens', 0)})\n")
         f.write("\n------------\n")
 
 def log_coder_errors(data: Dict[str, Any]):
@@ -67,50 +81,32 @@ def check_project_syntax() -> dict:
     """Run TypeScript compiler in check mode and log results to a Markdown file."""
     report_path = Path(LOGS_DIR) / "syntax_report.md"
 
-    # Use npx to ensure the project's version of typescript is used
-    tsc_command = shutil.which("npx")
-    if not tsc_command:
-        error_msg = "Could not find 'npx' in PATH. Please ensure Node.js is installed."
+    result = get_typecheck_service(str(PROJECT_ROOT)).check()
+
+    if not result["available"]:
+        error_msg = result["errors"]
         _write_markdown_report(report_path, [], error_msg)
         return {"success": False, "summary": error_msg, "errors": error_msg, "error_files": []}
 
-    cmd = [tsc_command, "tsc", "-b", "--noEmit", "--pretty", "false"]
-
-    try:
-        logger.info(f"Running project syntax check with command: {' '.join(cmd)}")
-        result = subprocess.run(
-            cmd,
-            cwd=PROJECT_ROOT,
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-        )
-
+    if result["success"]:
         # Write success report
         summary = "✅ No syntax errors found."
         _write_markdown_report(report_path, [], summary)
         return {"summary": summary, "errors": [], "error_files": []}
 
-    except subprocess.CalledProcessError as e:
-        error_output = (e.stderr or "") + (e.stdout or "")
-        logger.warning(f"Syntax check failed with output:\n{error_output}")
+    error_output = result["errors"]
+    logger.warning(f"Syntax check failed with output:\n{error_output}")
 
-        # Use the raw string here, not a list
-        error_files = _extract_error_files(error_output, Path(PROJECT_ROOT))
+    diagnostics = [d for d in result["diagnostics"] if d.category == "error"]
+    error_files = files_with_errors(diagnostics)
 
-        # If you still want lines for the report:
-        error_lines = [line for line in error_output.splitlines() if line.strip()]
-        error_count = len(error_lines)
-        summary = f"❌ Found {error_count} syntax errors in {len(error_files)} file(s)."
+    # One report line per diagnostic; raw output if nothing could be parsed
+    error_lines = [format_diagnostic(d) for d in diagnostics] or [line for line in error_output.splitlines() if line.strip()]
+    error_count = len(error_lines)
+    summary = f"❌ Found {error_count} syntax errors in {len(error_files)} file(s)."
 
-        _write_markdown_report(report_path, error_lines, summary=summary)
-        return {"summary": summary, "errors": error_lines, "error_files": sorted(error_files)}
-
-    except FileNotFoundError:
-        error_msg = "Command 'npx' not found. Is Node.js installed and in your PATH?"
-        _write_markdown_report(report_path, [], error_msg)
-        return {"success": False, "summary": error_msg, "errors": error_msg, "error_files": []}
+    _write_markdown_report(report_path, error_lines, summary=summary)
+    return {"summary": summary, "errors": error_lines, "error_files": error_files, "diagnostics": diagnostics}
     
 def _write_markdown_report(report_path: Path, errors: list[str], summary: str) -> None:
     """Helper to save syntax check results in Markdown format."""
@@ -224,17 +220,8 @@ def check_project_lint(report_filename: str = "lint_report.md") -> Dict[str, Any
     cmd = [npm, "run", "lint", "--silent"]  # --silent suppresses npm wrapper noise
 
     try:
-        logger.info(f"Running lint with: {' '.join(cmd)}")
-        # Let lint exit non-zero on problems; we catch it below.
-        result = subprocess.run(
-            cmd,
-            cwd=PROJECT_ROOT,
-            check=False,                # don't raise; we want the output either way
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-        )
-        combined = (result.stdout or "") + (result.stderr or "")
+        # Lint output only depends on the project files, so reuse it while they are unchanged
+        returncode, combined = cached_verification("lint", str(PROJECT_ROOT), lambda: _run_lint(cmd))
 
         # Parse counts (ESLint summary line like: "✖ 3 problems (2 errors, 1 warning)")
         problems, errors, warnings = _parse_eslint_counts(combined)
@@ -244,7 +231,7 @@ def check_project_lint(report_filename: str = "lint_report.md") -> Dict[str, Any
 
         # Build summary
         if errors is not None:  # we recognized ESLint summary
-            if errors == 0 and result.returncode == 0:
+            if errors == 0 and returncode == 0:
                 summary = (
                     f"✅ Lint completed with no errors. "
                     f"Problems={problems or 0}, Errors=0, Warnings={warnings or 0}."
@@ -257,7 +244,7 @@ def check_project_lint(report_filename: str = "lint_report.md") -> Dict[str, Any
         else:
             # Fallback when we can't parse a summary
             err_count = len(error_lines)
-            if result.returncode == 0 and err_count == 0:
+            if returncode == 0 and err_count == 0:
                 summary = "✅ Lint completed with no errors."
             else:
                 summary = f"❌ Lint detected {err_count} potential error line(s)."
@@ -266,7 +253,7 @@ def check_project_lint(report_filename: str = "lint_report.md") -> Dict[str, Any
         _write_markdown_report(report_path, error_lines, summary)
 
         # Decide success: no errors AND process exited 0
-        success = (result.returncode == 0) and ((errors or 0) == 0)
+        success = (returncode == 0) and ((errors or 0) == 0)
         return {
             "success": success,
             "errors": combined,
@@ -280,6 +267,20 @@ def check_project_lint(report_filename: str = "lint_report.md") -> Dict[str, Any
         return {"success": False, "errors": msg, "path": str(report_path), "files": []}
 
 
+def _run_lint(cmd: list[str]) -> Tuple[int, str]:
+    logger.info(f"Running lint with: {' '.join(cmd)}")
+    # Let lint exit non-zero on problems; we catch it below.
+    result = subprocess.run(
+        cmd,
+        cwd=PROJECT_ROOT,
+        check=False,                # don't raise; we want the output either way
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+    )
+    return result.returncode, (result.stdout or "") + (result.stderr or "")
+
+
 def _parse_eslint_counts(output: str) -> tuple[Optional[int], Optional[int], Optional[int]]:
     """
     Try to parse ESLint-style summary lines:
@@ -347,7 +348,8 @@ def _extract_error_lines(output: str) -> Tuple[list[str], list[str]]:
 
 def copy_src_to_exp_folder():
     """
-    Copies the entire 'src' folder into LOGS_DIR, 
+    Snapshots the 'src' folder into the LOGS_DIR snapshot store (one manifest
+    per request, only changed files are stored) and checks it out as LOGS_DIR/src,
     so that LOGS_DIR/src/... exists afterward.
     """
     try:
@@ -357,42 +359,96 @@ def copy_src_to_exp_folder():
         if not src.exists():
             raise FileNotFoundError(f"Source directory '{src}' does not exist.")
 
-        if dest.exists():
-            shutil.rmtree(dest)
-
-        shutil.copytree(src, dest)
-        logger.info(f"Successfully copied folder '{src}' into '{LOGS_DIR}' (as '{dest}').")
+        store = SnapshotStore(SNAPSHOTS_DIR)
+        manifest = store.snapshot(src)
+        stats = store.checkout(manifest, dest)
+        logger.info(f"Snapshotted '{src}' into '{LOGS_DIR}' (as '{dest}'): {stats['written']} file(s) written, {stats['removed']} removed.")
 
     except Exception as error:
         logger.exception(f"An error occurred: {error}")
 
-def _extract_error_files(tsc_errors: str, project_root: Path) -> set[str]:
+# ---------------- End-of-request quality pipeline ---------------- #
+
+# The stages are independent and mostly wait on subprocesses (tsc, eslint) or disk,
+# so threads are enough to overlap them.
+_QUALITY_STAGES = {
+    "syntax": check_project_syntax,
+    "compile_src": compile_react_src,
+    "lint": check_project_lint,
+    "copy_src": copy_src_to_exp_folder,
+}
+
+_pipeline_executor = ThreadPoolExecutor(max_workers=len(_QUALITY_STAGES) + 1, thread_name_prefix="quality")
+_pipeline_lock = threading.Lock()
+_pending_pipeline: Optional[Future] = None
+
+
+def _run_quality_stage(name: str, stage) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        return {"stage": name, "ok": True, "result": stage(), "duration": time.perf_counter() - start}
+    except Exception as e:
+        logger.exception(f"Quality stage '{name}' failed: {e}")
+        return {"stage": name, "ok": False, "result": str(e), "duration": time.perf_counter() - start}
+
+
+def _run_quality_stages() -> Dict[str, Any]:
+    start = time.perf_counter()
+    futures = {name: _pipeline_executor.submit(_run_quality_stage, name, stage) for name, stage in _QUALITY_STAGES.items()}
+    stages = {name: future.result() for name, future in futures.items()}
+    report = {
+        "syntax": stages["syntax"]["result"],
+        "lint": stages["lint"]["result"],
+        "stages": {name: {"ok": st["ok"], "duration": round(st["duration"], 2)} for name, st in stages.items()},
+        "total_time": round(time.perf_counter() - start, 2),
+    }
+    timings = ", ".join(f"{name}={st['duration']:.2f}s" for name, st in stages.items())
+    logger.info(f"Quality pipeline finished in {report['total_time']:.2f}s ({timings}).")
+    return report
+
+
+def run_quality_pipeline(background: bool = QUALITY_PIPELINE_BACKGROUND) -> Optional[Dict[str, Any]]:
     """
-    Extract file paths from TypeScript compiler errors.
+    Runs check_project_syntax, compile_react_src, check_project_lint and copy_src_to_exp_folder
+    concurrently, so the wait is the slowest stage instead of their sum.
+
+    Returns:
+        {
+            "syntax": dict,      # check_project_syntax() result
+            "lint": dict,        # check_project_lint() result
+            "stages": {name: {"ok": bool, "duration": float}},
+            "total_time": float
+        }
+        or None when `background` is True; the run then finishes on its own and
+        wait_for_quality_pipeline() returns its report.
     """
-    error_files: set[str] = set()
-    pattern = re.compile(r'^(.*\.(?:ts|tsx|js|jsx))\((\d+),(\d+)\):\s+error TS\d+:')
+    global _pending_pipeline
+    wait_for_quality_pipeline()
+    if not background:
+        return _run_quality_stages()
+    with _pipeline_lock:
+        _pending_pipeline = _pipeline_executor.submit(_run_quality_stages)
+    return None
 
-    for line in tsc_errors.splitlines():
-        m = pattern.match(line.strip())
-        if not m:
-            continue
-        file_path = m.group(1)
-        try:
-            abs_path = (project_root / file_path).resolve()
-            if abs_path.exists():
-                rel_path = abs_path.relative_to(project_root)
-                error_files.add(rel_path.as_posix())
-            else:
-                error_files.add(Path(file_path).as_posix())
-        except Exception:
-            error_files.add(Path(file_path).as_posix())
 
-    return error_files
+def wait_for_quality_pipeline() -> Optional[Dict[str, Any]]:
+    """
+    Blocks until a background pipeline started by run_quality_pipeline() has finished.
+    Call before touching the project again, as the stages read the src folder.
+    """
+    global _pending_pipeline
+    with _pipeline_lock:
+        pending, _pending_pipeline = _pending_pipeline, None
+    if pending is None:
+        return None
+    return pending.result()
 
 if __name__ == "__main__":
     result = check_project_syntax()
     print(result)
 
     result = check_project_lint()
-    print(result)
\ No newline at end of file
+    print(result)
+
+    report = run_quality_pipeline(background=False)
+    print(report["stages"], report["total_time"])
\ No newline at end of file
@@ -0,0 +1,295 @@
+"""
+Memory manager for POKIO system.
+Keeps a coder agent's message memory from growing with every tool round.
+
+Every fetch_files result used to be appended with the full file contents, so a
+repair loop that fetches the same files again carried one copy per round. The
+memory manager tracks which version (sha256) of each file is in context:
+- a fetched file whose content is already in context (an earlier fetch result or
+  a "FILE: path" block of a prompt) is replaced by a short reference to it; when
+  compaction later removes that copy, the content moves into the newest reference;
+- an older fetch result of a file whose content changed is replaced by a short
+  reference to the newer one, so only the current version stays in context.
+When the memory still exceeds TASK_MEMORY_TOKEN_CEILING, the oldest turns are
+compacted (file contents of fetch results dropped, long messages truncated)
+until it is back under TASK_MEMORY_COMPACT_TARGET of the ceiling. The system
+messages, the task message and the latest turns are never touched.
+
+Memories are plain message lists, changed in place; all state is read from the
+messages themselves, so memories rebuilt by the orchestrators need no setup.
+
+Configuration: TASK_MEMORY_COMPACTION (1/0), TASK_MEMORY_TOKEN_CEILING (tokens, 0 disables
+compaction of older turns), TASK_MEMORY_COMPACT_TARGET, TASK_MEMORY_KEEP_RECENT.
+"""
+import hashlib
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import json_codec
+from context_budget import count_tokens, truncate_text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Set TASK_MEMORY_COMPACTION=0 to append fetch results unchanged and never compact
+TASK_MEMORY_COMPACTION = os.getenv("TASK_MEMORY_COMPACTION", "1") == "1"
+TASK_MEMORY_TOKEN_CEILING = int(os.getenv("TASK_MEMORY_TOKEN_CEILING", 48000))
+# Compaction goes below the ceiling, so the (cached) prefix is not rewritten on every call
+TASK_MEMORY_COMPACT_TARGET = float(os.getenv("TASK_MEMORY_COMPACT_TARGET", 0.75))
+# Latest messages that are never compacted
+TASK_MEMORY_KEEP_RECENT = int(os.getenv("TASK_MEMORY_KEEP_RECENT", 4))
+# Compacted messages keep this many tokens from their start
+COMPACTED_MESSAGE_TOKENS = 200
+
+# File blocks of utils.format_file_blobs in prompts
+_FILE_BLOCK_PATTERN = re.compile(r"^FILE: (.+)\n```[a-z]*\n(.*?)\n```$", re.MULTILINE | re.DOTALL)
+
+UNCHANGED_NOTE = "Content not repeated: the same version of this file is already in context above."
+MOVED_NOTE = "Content not repeated: the same version of this file is in a later fetch_files result."
+SUPERSEDED_NOTE = "Content removed: this version is outdated, a later fetch_files result has the current one."
+DROPPED_NOTE = "Content dropped to keep the context small; fetch the file again if you need it."
+
+
+def content_sha256(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _fetch_result(message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The fetch_files tool result a user message holds, None for any other message."""
+    content = message.get("content")
+    if message.get("role") != "user" or not isinstance(content, str) or not content.startswith("{") or "fetch_files" not in content[:40]:
+        return None
+    try:
+        data = json_codec.loads(content)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and data.get("tool") == "fetch_files" and isinstance(data.get("result"), list):
+        return data
+    return None
+
+
+def _reference(entry: Dict[str, Any], status: str, sha256: str, note: str) -> Dict[str, Any]:
+    return {"filePath": entry.get("filePath"), "status": status, "sha256": sha256[:12], "note": note}
+
+
+def _normalize(path: Optional[str]) -> str:
+    return os.path.normpath(path or "").replace(os.sep, "/")
+
+
+def _file_copies(message: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """(path, content) of every full file copy in a message: fetch_files results and "FILE: path" blocks."""
+    fetched = _fetch_result(message)
+    if fetched is not None:
+        return [
+            (_normalize(entry.get("filePath")), entry["content"])
+            for entry in fetched["result"]
+            if entry.get("status") == "success" and isinstance(entry.get("content"), str)
+        ]
+    if isinstance(message.get("content"), str) and message.get("role") in ("system", "user") and "FILE: " in message["content"]:
+        return [(_normalize(match.group(1)), match.group(2)) for match in _FILE_BLOCK_PATTERN.finditer(message["content"])]
+    return []
+
+
+def files_in_context(memory: List[Dict[str, Any]]) -> Dict[str, List[Tuple[int, str]]]:
+    """
+    Path -> [(message index, sha256), ...] of every file version whose full content is
+    in `memory`: fetch_files results and "FILE: path" blocks of prompts, in memory order.
+    """
+    versions: Dict[str, List[Tuple[int, str]]] = {}
+    for index, message in enumerate(memory):
+        for path, content in _file_copies(message):
+            versions.setdefault(path, []).append((index, content_sha256(content)))
+    return versions
+
+
+def _restore_references(memory: List[Dict[str, Any]], lost: Dict[Tuple[str, str], str]) -> int:
+    """
+    Puts the content of file versions whose last full copy was compacted away back into
+    the newest "unchanged" reference to them; older references to them are pointed at
+    that result. Returns the number of tokens added.
+    """
+    remaining = {(path, sha256) for path, versions in files_in_context(memory).items() for _, sha256 in versions}
+    missing = {(path, sha256[:12]): content for (path, sha256), content in lost.items() if (path, sha256) not in remaining}
+    restored = set()
+    added = 0
+    for index in range(len(memory) - 1, -1, -1):
+        fetched = _fetch_result(memory[index]) if missing or restored else None
+        if fetched is None:
+            continue
+        changed = False
+        for position, entry in enumerate(fetched["result"]):
+            key = (_normalize(entry.get("filePath")), entry.get("sha256"))
+            if entry.get("status") != "unchanged":
+                continue
+            if key in missing:
+                fetched["result"][position] = {"filePath": entry.get("filePath"), "content": missing.pop(key), "status": "success"}
+                restored.add(key)
+                changed = True
+            elif key in restored:
+                fetched["result"][position] = {**entry, "note": MOVED_NOTE}
+                changed = True
+        if changed:
+            before = count_tokens(memory[index]["content"])
+            memory[index] = {**memory[index], "content": json_codec.dumps(fetched)}
+            added += count_tokens(memory[index]["content"]) - before
+    return added
+
+
+def append_fetch_result(memory: List[Dict[str, Any]], tool_result: Dict[str, Any], enabled: bool = TASK_MEMORY_COMPACTION) -> None:
+    """
+    Appends a fetch_files result to `memory`, keeping one copy per file version: files
+    already in context are referenced instead of repeated, and older fetched copies of
+    files whose content changed are replaced by a reference.
+    """
+    if not enabled or tool_result.get("tool") != "fetch_files" or not isinstance(tool_result.get("result"), list):
+        memory.append({"role": "user", "content": json_codec.dumps(tool_result)})
+        return
+
+    versions = files_in_context(memory)
+    entries, superseded = [], {}
+    for entry in tool_result["result"]:
+        if entry.get("status") != "success" or not isinstance(entry.get("content"), str):
+            entries.append(entry)
+            continue
+        path, sha256 = _normalize(entry.get("filePath")), content_sha256(entry["content"])
+        known = versions.get(path, [])
+        if any(known_sha == sha256 for _, known_sha in known):
+            entries.append(_reference(entry, "unchanged", sha256, UNCHANGED_NOTE))
+            continue
+        for index, known_sha in known:
+            superseded.setdefault(index, {})[path] = known_sha
+        entries.append(entry)
+
+    # Only earlier fetch results are rewritten; prompts keep their (possibly outdated) file blocks
+    for index, paths in superseded.items():
+        fetched = _fetch_result(memory[index])
+        if fetched is None:
+            continue
+        fetched["result"] = [
+            _reference(entry, "superseded", paths[_normalize(entry.get("filePath"))], SUPERSEDED_NOTE)
+            if entry.get("status") == "success" and _normalize(entry.get("filePath")) in paths else entry
+            for entry in fetched["result"]
+        ]
+        memory[index] = {**memory[index], "content": json_codec.dumps(fetched)}
+
+    memory.append({"role": "user", "content": json_codec.dumps({**tool_result, "result": entries})})
+
+
+def memory_tokens(memory: List[Dict[str, Any]]) -> int:
+    return sum(count_tokens(message.get("content")) for message in memory if isinstance(message.get("content"), str))
+
+
+def _compact_message(message: Dict[str, Any], level: int) -> Optional[Dict[str, Any]]:
+    """
+    Smaller version of an old message, None if it cannot get smaller. Level 0 drops fetched
+    file contents and truncates long messages, level 1 leaves a one-line stub.
+    """
+    fetched = _fetch_result(message)
+    if fetched is not None:
+        if level == 0:
+            entries = [
+                _reference(entry, "dropped", content_sha256(entry["content"]), DROPPED_NOTE)
+                if entry.get("status") == "success" and isinstance(entry.get("content"), str) else entry
+                for entry in fetched["result"]
+            ]
+        else:
+            entries = [{"filePath": entry.get("filePath"), "status": "dropped"} for entry in fetched["result"]]
+        compacted = json_codec.dumps({**fetched, "result": entries})
+    elif isinstance(message.get("content"), str):
+        compacted = (truncate_text(message["content"], COMPACTED_MESSAGE_TOKENS) if level == 0
+                     else f"(Earlier {message.get('role', 'message')} message omitted to keep the context small.)")
+    else:
+        return None
+    if len(compacted) >= len(message["content"]):
+        return None
+    return {**message, "content": compacted}
+
+
+def compact_memory(memory: List[Dict[str, Any]], ceiling: int = TASK_MEMORY_TOKEN_CEILING,
+                   target: float = TASK_MEMORY_COMPACT_TARGET, keep_recent: int = TASK_MEMORY_KEEP_RECENT,
+                   enabled: bool = TASK_MEMORY_COMPACTION) -> int:
+    """
+    Compacts the oldest turns of `memory` (in place) when it exceeds `ceiling` tokens, until it
+    is under target * ceiling or only protected messages are left. Fetch results are compacted
+    before other messages, and every message is truncated before any is reduced to a stub.
+    Returns the number of tokens removed.
+    """
+    if not enabled or ceiling <= 0:
+        return 0
+    tokens = [count_tokens(message.get("content")) if isinstance(message.get("content"), str) else 0 for message in memory]
+    total = sum(tokens)
+    if total <= ceiling:
+        return 0
+
+    # Protected: leading system messages, the task message after them and the latest turns
+    first = 0
+    while first < len(memory) and memory[first].get("role") == "system":
+        first += 1
+    candidates = list(range(first + 1, len(memory) - keep_recent))
+    candidates.sort(key=lambda index: (_fetch_result(memory[index]) is None, index))
+
+    removed = 0
+    goal = int(ceiling * target)
+    for level in (0, 1):
+        for index in candidates:
+            if total - removed <= goal:
+                break
+            compacted = _compact_message(memory[index], level)
+            if compacted is None:
+                continue
+            compacted_tokens = count_tokens(compacted["content"])
+            if compacted_tokens < tokens[index]:
+                lost = {(path, content_sha256(content)): content for path, content in _file_copies(memory[index])}
+                memory[index] = compacted
+                removed += tokens[index] - compacted_tokens
+                tokens[index] = compacted_tokens
+                if lost:
+                    # Never leave a reference to content that is gone
+                    added = _restore_references(memory, lost)
+                    if added:
+                        removed -= added
+                        tokens = [count_tokens(m.get("content")) if isinstance(m.get("content"), str) else 0 for m in memory]
+
+    logger.info(f"Compacted task memory from {total} to {total - removed} tokens (ceiling {ceiling}).")
+    return removed
+
+
+if __name__ == "__main__":
+    import glob
+    import time
+    from conversation_journal import load_markdown_turns
+
+    logging.disable(logging.CRITICAL)
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs", "logs")
+    ceiling = 8000
+    for log_path in sorted(glob.glob(os.path.join(log_dir, "*", "*_logs", "*_task.md"))):
+        final_memory = max(load_markdown_turns(log_path), key=len)
+        fetches = [message for message in final_memory if _fetch_result(message) is not None]
+        if not fetches:
+            continue
+        fetched = _fetch_result(fetches[0])
+        # Replay a 30-round repair loop: every round the model fetches the same files again,
+        # one of them edited since the previous round, and answers with a response of the recorded size
+        response = next(message for message in final_memory if message.get("role") == "assistant")
+        plain, managed = list(final_memory[:2]), list(final_memory[:2])
+        plain_sizes, managed_sizes, elapsed = [], [], 0.0
+        for round_index in range(30):
+            result = {**fetched, "result": [dict(entry) for entry in fetched["result"]]}
+            if result["result"] and isinstance(result["result"][0].get("content"), str):
+                result["result"][0]["content"] += f"\n// round {round_index}"
+            for memory in (plain, managed):
+                memory.append(response)
+            plain.append({"role": "user", "content": json_codec.dumps(result)})
+            start = time.perf_counter()
+            append_fetch_result(managed, result, enabled=True)
+            compact_memory(managed, ceiling=ceiling, enabled=True)
+            elapsed += time.perf_counter() - start
+            plain_sizes.append(memory_tokens(plain))
+            managed_sizes.append(memory_tokens(managed))
+        print(f"{os.path.relpath(log_path, log_dir)}: input tokens per call, rounds 1/10/30: "
+              f"plain {plain_sizes[0]}/{plain_sizes[9]}/{plain_sizes[29]}, "
+              f"managed (ceiling {ceiling}) {managed_sizes[0]}/{managed_sizes[9]}/{managed_sizes[29]} "
+              f"({elapsed / 30 * 1000:.2f}ms per round)")
@@ -0,0 +1,230 @@
+"""
+Mock OpenRouter server for POKIO system.
+A local, OpenAI-compatible `/chat/completions` endpoint that replays the model
+responses recorded in an experiment's `full_conversation.log`
+(docs/logs/EXPERIMENT_*/<model>_logs/). Responses are streamed as SSE with a
+finish reason and a final usage chunk, exactly like OpenRouter, so the
+orchestrators can be benchmarked offline with reproducible numbers. Like a
+provider prompt cache, message prefixes seen in earlier requests are reported
+as cached prompt tokens.
+
+Usage:
+    python mock_openrouter.py --log ../../docs/logs/EXPERIMENT_solo_S1/gemini-3-flash-preview_logs/full_conversation.log
+    OPENROUTER_BASE_URL=http://127.0.0.1:8765/api/v1 OPENROUTER_API_KEY=mock python main.py
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RecordedResponse = namedtuple('RecordedResponse', ['agent', 'content', 'tokens', 'duration'])
+
+# Mirrors logging_service.log_token_usage_per_call
+_ENTRY_PATTERN = re.compile(
+    r'Agent: (?P<agent>.*?)\n - Response: (?P<content>.*?)\n------------\n'
+    r' - Tokens: (?P<tokens>\d+)\n - Duration: (?P<duration>[\d.]+)s\n',
+    re.DOTALL,
+)
+
+
+def load_recorded_responses(log_path: str) -> List[RecordedResponse]:
+    """Parses a full_conversation.log into its model responses, in call order."""
+    with open(log_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return [
+        RecordedResponse(m.group("agent").strip(), m.group("content"), int(m.group("tokens")), float(m.group("duration")))
+        for m in _ENTRY_PATTERN.finditer(text)
+    ]
+
+
+class ReplayScript:
+    """Hands out the recorded responses in order, wrapping around at the end."""
+
+    def __init__(self, responses: List[RecordedResponse]):
+        if not responses:
+            raise ValueError("No recorded responses to replay.")
+        self.responses = responses
+        self._cursor = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> RecordedResponse:
+        with self._lock:
+            response = self.responses[self._cursor % len(self.responses)]
+            self._cursor += 1
+            return response
+
+
+class PrefixCache:
+    """Remembers the message prefixes of past requests, like a provider-side prompt cache."""
+
+    def __init__(self):
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    def lookup(self, messages: List[Dict[str, Any]]) -> int:
+        """Characters of the longest message prefix seen before; stores every prefix of `messages`."""
+        cached_chars, chars = 0, 0
+        digest = hashlib.sha256()
+        with self._lock:
+            for message in messages:
+                text = json.dumps(message, sort_keys=True, ensure_ascii=False)
+                digest.update(text.encode("utf-8"))
+                chars += len(text)
+                key = digest.hexdigest()
+                if key in self._prefixes:
+                    cached_chars = chars
+                self._prefixes.add(key)
+        return cached_chars
+
+
+class MockOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Set on the server instance by create_server()
+    @property
+    def script(self) -> ReplayScript:
+        return self.server.script
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"data": [{"id": "mock", "tools": True}]})
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        recorded = self.script.next()
+        model = body.get("model", "mock")
+        usage = self._usage(recorded, self.server.prefix_cache.lookup(body.get("messages") or []))
+
+        if body.get("stream"):
+            try:
+                self._stream(recorded, model, usage)
+            except (BrokenPipeError, ConnectionResetError):
+                logger.info("Client closed the stream early.")
+        else:
+            self._send_json({
+                "id": f"gen-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": recorded.content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _usage(self, recorded: RecordedResponse, cached_chars: int = 0) -> Dict[str, Any]:
+        # The log only keeps the total; split it with the usual ~4 characters per token
+        completion_tokens = min(recorded.tokens, max(1, len(recorded.content) // 4))
+        prompt_tokens = recorded.tokens - completion_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": recorded.tokens,
+            "prompt_tokens_details": {"cached_tokens": min(prompt_tokens, cached_chars // 4)},
+        }
+
+    def _stream(self, recorded: RecordedResponse, model: str, usage: Dict[str, Any]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"gen-{uuid.uuid4().hex}"
+        created = int(time.time())
+        size = self.server.chunk_chars
+        pieces = [recorded.content[i:i + size] for i in range(0, len(recorded.content), size)] or [""]
+        # Spread the recorded latency over the chunks (speed 0 = as fast as possible)
+        delay = recorded.duration * self.server.speed / len(pieces)
+
+        def chunk(delta: Dict[str, Any], finish_reason=None, chunk_usage=None) -> Dict[str, Any]:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if chunk_usage:
+                payload["usage"] = chunk_usage
+            return payload
+
+        self._send_event(chunk({"role": "assistant", "content": ""}))
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            self._send_event(chunk({"content": piece}))
+        self._send_event(chunk({}, finish_reason="stop"))
+        self._send_event(chunk(None, chunk_usage=usage))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _send_event(self, payload: Dict[str, Any]):
+        self._write_chunk(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes):
+        # HTTP/1.1 chunked transfer encoding; an empty chunk terminates the body
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(log_path: str, host: str = "127.0.0.1", port: int = 8765, speed: float = 0.0, chunk_chars: int = 64) -> ThreadingHTTPServer:
+    """
+    Builds (but does not start) the mock server.
+
+    Args:
+        speed: Multiplier on the recorded response durations; 0 streams without delays.
+        chunk_chars: Characters of content per streamed chunk.
+    """
+    server = ThreadingHTTPServer((host, port), MockOpenRouterHandler)
+    server.daemon_threads = True
+    server.script = ReplayScript(load_recorded_responses(log_path))
+    server.speed = speed
+    server.chunk_chars = chunk_chars
+    server.prefix_cache = PrefixCache()
+    logger.info(f"Loaded {len(server.script.responses)} recorded responses from {log_path}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded POKIO model responses as a local OpenRouter.")
+    parser.add_argument("--log", required=True, help="Path to a full_conversation.log")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--speed", type=float, default=0.0, help="1.0 replays the recorded latency, 0 disables delays")
+    parser.add_argument("--chunk-chars", type=int, default=64)
+    args = parser.parse_args()
+
+    server = create_server(args.log, args.host, args.port, args.speed, args.chunk_chars)
+    logger.info(f"Mock OpenRouter listening on http://{args.host}:{args.port}/api/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
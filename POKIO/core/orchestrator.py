@@ -4,22 +4,24 @@ Coordinates between the Planner and Coder agents and their respective services.
 """
 import logging
 from typing import Dict, Any, List, Tuple, Optional
-import json
+import json_codec
 import os
 import sys
 from dotenv import load_dotenv
 from utils import OrchestratorState, format_history_lines, save_conversation, format_duration_hms
+from memory_manager import append_fetch_result, compact_memory
 import hashlib
 import time
 
 # Import services
 from verification_service import VerificationService
 from tool_service import ToolService
+from stream_parser import StreamingToolCallDetector
 from file_operations_service import FileOperationsService
-from prompt_builder import PromptBuilder
-from ai import AI
+from prompt_builder import PromptBuilder, prompt_prefix_messages
+from ai import create_ai
 # from rag_service import UIUXRAGService
-from logging_service import log_coder_errors, log_token_usage_final, log_token_usage_per_call, check_project_syntax, compile_react_src, check_project_lint, copy_src_to_exp_folder
+from logging_service import log_coder_errors, log_token_usage_final, log_token_usage_per_call, run_quality_pipeline, wait_for_quality_pipeline
 
 load_dotenv()
 
@@ -56,13 +58,15 @@ class Orchestrator:
         self.implemented_files = ["src/App.tsx", "src/main.tsx", "src/index.css"]
 
         # Initialize services
-        self.coder = AI(model=CODER, temperature=0.1)
-        self.planner = AI(model=PLANNER, temperature=0.1)
+        self.coder = create_ai(model=CODER, temperature=0.1)
+        self.planner = create_ai(model=PLANNER, temperature=0.1)
         
         self.verification_service = VerificationService()
         self.file_operations_service = FileOperationsService(project_root=self.project_root)
         self.tool_service = ToolService(project_root=self.project_root, file_operations_service=self.file_operations_service)
         self.prompt_builder = PromptBuilder(project_root=project_root)
+        # Keep the analyzer's project model current with our own writes
+        self.file_operations_service.add_change_listener(self.prompt_builder.analyzer.notify_file_changed)
         # self.rag_service = UIUXRAGService(guidelines_dir="guidelines")
 
         self.total_token_usage = 0
@@ -85,7 +89,7 @@ class Orchestrator:
 
     def update_conversation_history(self, role: str, content: Dict[str, Any]) -> None:
         """Persist one *condensed* turn to global memory."""     
-        self.conversation_history.append({"role": role, "content": json.dumps(content)})
+        self.conversation_history.append({"role": role, "content": json_codec.dumps(content)})
         self._trim_global_history()
 
 
@@ -104,6 +108,8 @@ class Orchestrator:
         """
         logger.info(f"--- New Request Received: '{user_request[:50]}...' ---")
         request_start_time  = time.time()
+        # A background quality pipeline from the previous request must not see this request's edits
+        wait_for_quality_pipeline()
 
         try:
             history_lines = format_history_lines(self.change_history)
@@ -160,10 +166,9 @@ class Orchestrator:
             planner_tokens = self.planner.get_total_token_usage()
             coder_tokens = self.coder.get_total_token_usage()
             
-            check_project_syntax()
-            compile_react_src()
-            check_project_lint()
-            copy_src_to_exp_folder()
+            # Changes still held in memory because they did not type-check are the result of this request too
+            self.file_operations_service.commit_pending()
+            run_quality_pipeline()
 
             log_data = {
                 "request": user_request,
@@ -188,7 +193,7 @@ class Orchestrator:
         
         system_prompt = self.prompt_builder.load_system_prompt(state=OrchestratorState.PLANNING)
         #messages.extend(self.conversation_history) # Give planner context of past conversations
-        messages.append({"role": "system", "content": system_prompt + "\n" + enhanced_prompt})
+        messages.extend(prompt_prefix_messages(system_prompt, enhanced_prompt))
         messages.append({"role": "user", "content": user_request})
 
         # For simplicity, we won't implement a retry loop for the planner, but one could be added.
@@ -215,7 +220,7 @@ class Orchestrator:
             elif response_type == "tool":
                 tool_result = self._handle_tool_request(parsed_json)
                 messages.append({"role": "assistant", "content": response_text})
-                messages.append({"role": "user", "content": json.dumps(tool_result)})
+                messages.append({"role": "user", "content": json_codec.dumps(tool_result)})
                 continue
             elif response_type == "plan":
                 return True, parsed_json
@@ -251,7 +256,7 @@ class Orchestrator:
     
         # --- Initialize memory for first attempt (normal coding)
         step_memory: List[Dict[str, str]] = [
-            {"role": "system", "content": coder_system_prompt + "\n" + coder_context_prompt},
+            *prompt_prefix_messages(coder_system_prompt, coder_context_prompt),
             {"role": "user", "content": current_task},
         ]
 
@@ -307,14 +312,16 @@ class Orchestrator:
             # If we encountered SEARCH/REPLACE Block errors, request the model to fix building upon the new context
             if scope == "file":
                 applied_paths = [r["path"] for r in results if r.get("status") == "success" and r.get("path")]
-                skipped_or_failed_paths = [r["path"] for r in results if r.get("status") != "success" and r.get("path")]
-                scope_paths = sorted(set(error_files or skipped_or_failed_paths))
+                failed_paths = [r["path"] for r in results if r.get("status") in ("failure", "error") and r.get("path")]
+                skipped_paths = [r["path"] for r in results if r.get("status") == "skipped" and r.get("path")]
+                scope_paths = sorted(set(error_files or failed_paths))
                 report = self.prompt_builder.build_orchestrator_report_edit_repair(
                     step_id=step_id,
                     txn_id=f"{step_id}-txn-{attempt_index + 1}",
                     applied_paths=applied_paths,
                     failed_paths=scope_paths,
-                    errors=errors_raw
+                    errors=errors_raw,
+                    skipped_paths=skipped_paths
                 )
 
                 # append error fixing prompt to the existing context
@@ -354,7 +361,11 @@ class Orchestrator:
         last_parsed_json = None
 
         while True: 
-            response_text, token_usage, duration = self.stream_ai_response(messages=step_memory)
+            # Prefetch files / pre-validate changes as soon as they appear in the stream
+            detector = self.tool_service.stream_detector()
+            # Superseded fetch results are already references; keep older turns under the token ceiling
+            compact_memory(step_memory)
+            response_text, token_usage, duration = self.stream_ai_response(messages=step_memory, detector=detector)
             step_memory.append({"role": "assistant", "content": response_text})
             save_conversation(
                 messages=step_memory, 
@@ -392,7 +403,7 @@ class Orchestrator:
                                 self.implemented_files.append(file)
                     break
                 else:
-                    step_memory.append({"role": "user", "content": json.dumps(tool_result)})
+                    append_fetch_result(step_memory, tool_result)
                     continue
             else:
                 error_message_for_model = "Received an unexpected response type."
@@ -404,7 +415,7 @@ class Orchestrator:
         sys.stdout.write(chunk)
         sys.stdout.flush()
 
-    def stream_ai_response(self, messages: List[Dict[str, str]]) -> Tuple[str, int, float]:
+    def stream_ai_response(self, messages: List[Dict[str, str]], detector: Optional[StreamingToolCallDetector] = None) -> Tuple[str, int, float]:
         logger.info(f"Streaming response with {len(messages)} messages")
 
         if self.state == OrchestratorState.PLANNING:
@@ -422,6 +433,8 @@ class Orchestrator:
                 if isinstance(chunk, str):
                     self.print_streaming_response(chunk)
                     full_response += chunk
+                    if detector:
+                        detector.feed(chunk)
             token_usage = agent.get_call_token_usage()
             duration = agent.get_call_duration()
             cost = agent.calculate_token_cost()
@@ -432,6 +445,8 @@ class Orchestrator:
                 "agent_name": agent_name,
                 "tokens": agent.last_call_tokens,
                 "duration": agent.last_call_duration,
+                "input_tokens": agent.last_input_tokens,
+                "cached_tokens": agent.last_cached_tokens,
                 "response": full_response
             })
             self.total_token_usage += token_usage
@@ -4,22 +4,26 @@ Coordinates between the Planner and Coder agents and their respective services.
 """
 import logging
 from typing import Dict, Any, List, Tuple, Optional, Set
-import json
+import json_codec
 import os
 import sys
 import re
 from dotenv import load_dotenv
 import hashlib
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 # Import services
 from verification_service import VerificationService
 from tool_service import ToolService
+from stream_parser import StreamingToolCallDetector
 from file_operations_service import FileOperationsService
-from prompt_builder import PromptBuilder
-from ai import AI
+from prompt_builder import PromptBuilder, prompt_prefix_messages
+from ai import create_ai
 from utils import OrchestratorState, format_history_lines, save_conversation, format_duration_hms
-from logging_service import log_coder_errors, log_review_rejections, log_token_usage_final, log_token_usage_per_call, check_project_syntax, compile_react_src, check_project_lint, copy_src_to_exp_folder
+from memory_manager import append_fetch_result, compact_memory
+from logging_service import log_coder_errors, log_review_rejections, log_token_usage_final, log_token_usage_per_call, run_quality_pipeline, wait_for_quality_pipeline
 
 load_dotenv()
 
@@ -37,6 +41,44 @@ EXPERIMENT = os.getenv("EXPERIMENT")
 MAX_RETRIES = 3
 REVIEW_RETRY_LIMIT = 3
 GLOBAL_HISTORY_MAX = 14
+# Steps run strictly sequentially by default; above 1, steps whose file sets do not overlap run concurrently
+MAX_PARALLEL_STEPS = int(os.getenv("MAX_PARALLEL_STEPS", 1))
+
+
+def step_files(step: Dict[str, Any]) -> Set[str]:
+    """Files a plan step declares it needs or touches."""
+    return set(step.get("requires", []) or []) | set(step.get("expected_files", []) or [])
+
+
+def _mentions_file(text: str, rel_path: str) -> bool:
+    """Whether `text` names the file, by path or by module name (e.g. a component `TodoList`)."""
+    stem = os.path.splitext(os.path.basename(rel_path))[0]
+    if rel_path in text:
+        return True
+    return stem != "index" and re.search(rf"\b{re.escape(stem)}\b", text) is not None
+
+
+def build_step_dependencies(steps: List[Dict[str, Any]]) -> List[Set[int]]:
+    """
+    Derives the step DAG from the plan: a step depends on every earlier step whose
+    `requires`/`expected_files` overlap its own, or that creates a file the step's
+    description names (planners often leave a new component out of the `requires`
+    of the step that imports it). A step that declares no files depends on all
+    earlier steps, since we cannot tell what it touches.
+    """
+    file_sets = [step_files(step) for step in steps]
+    texts = [f"{step.get('title', '')}\n{step.get('description', '')}\n{step.get('acceptance_criteria', '')}" for step in steps]
+    dependencies: List[Set[int]] = []
+    for i, files in enumerate(file_sets):
+        if not files:
+            dependencies.append(set(range(i)))
+        else:
+            dependencies.append({
+                j for j in range(i)
+                if not file_sets[j] or file_sets[j] & files
+                or any(_mentions_file(texts[i], path) for path in steps[j].get("expected_files", []) or [])
+            })
+    return dependencies
 
 class Orchestrator:
     """Orchestrator to coordinate between Planner and Coder agents."""
@@ -47,6 +89,13 @@ class Orchestrator:
         if not self.project_root:
             raise ValueError("Project root not specified.")
         
+        # Per-thread state: concurrently running steps each have their own state, step index and agents
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        # Step index -> declared files of the steps running concurrently (see _run_steps)
+        self._running_files: Dict[int, Set[str]] = {}
+
         # State Management
         self.state = OrchestratorState.IDLE
         self.plan: Dict[str, Any] = {}
@@ -56,13 +105,15 @@ class Orchestrator:
         self.change_history: List[Dict[str, str]] = []
 
         # Initialize services
-        self.coder = AI(model=CODER, temperature=0.1)
-        self.planner = AI(model=PLANNER, temperature=0.1)
+        self._coder = create_ai(model=CODER, temperature=0.1)
+        self._planner = create_ai(model=PLANNER, temperature=0.1)
         
         self.verification_service = VerificationService()
         self.file_operations_service = FileOperationsService(project_root=self.project_root)
         self.tool_service = ToolService(project_root=self.project_root, file_operations_service=self.file_operations_service)
         self.prompt_builder = PromptBuilder(project_root=project_root)
+        # Keep the analyzer's project model current with our own writes
+        self.file_operations_service.add_change_listener(self.prompt_builder.analyzer.notify_file_changed)
         self.total_token_usage = 0
         self.total_request_cost = 0.0
 
@@ -71,6 +122,40 @@ class Orchestrator:
 
         logger.info(f"Orchestrator initialized for Cycle 3 with project root: {self.project_root}")
 
+    # --- Thread-local state (see _run_steps) ---
+    @property
+    def state(self) -> OrchestratorState:
+        return getattr(self._local, "state", OrchestratorState.IDLE)
+
+    @state.setter
+    def state(self, value: OrchestratorState) -> None:
+        self._local.state = value
+
+    @property
+    def current_step_index(self) -> int:
+        return getattr(self._local, "current_step_index", -1)
+
+    @current_step_index.setter
+    def current_step_index(self, value: int) -> None:
+        self._local.current_step_index = value
+
+    @property
+    def completed_step_ids(self) -> Optional[Set[Any]]:
+        """Plan ids of the steps finished before the current one started; None outside a step."""
+        return getattr(self._local, "completed_step_ids", None)
+
+    @completed_step_ids.setter
+    def completed_step_ids(self, value: Optional[Set[Any]]) -> None:
+        self._local.completed_step_ids = value
+
+    @property
+    def coder(self):
+        return getattr(self._local, "coder", self._coder)
+
+    @property
+    def planner(self):
+        return getattr(self._local, "planner", self._planner)
+
     # --- Memory Management ---
     def _init_conversation_history(self):
         system_prompt = self.prompt_builder.load_system_prompt(state=OrchestratorState.PLANNING)
@@ -83,7 +168,7 @@ class Orchestrator:
 
     def update_conversation_history(self, role: str, content: Dict[str, Any]) -> None:
         """Persist one *condensed* turn to global memory."""     
-        self.conversation_history.append({"role": role, "content": json.dumps(content)})
+        self.conversation_history.append({"role": role, "content": json_codec.dumps(content)})
         self._trim_global_history()
 
 
@@ -94,6 +179,8 @@ class Orchestrator:
         """
         logger.info(f"--- New Request Received: '{user_request[:50]}...' ---")
         request_start_time  = time.time()
+        # A background quality pipeline from the previous request must not see this request's edits
+        wait_for_quality_pipeline()
         
         try:
             history_lines = format_history_lines(self.change_history)
@@ -119,28 +206,19 @@ class Orchestrator:
             self.state = OrchestratorState.CODING
             all_steps = self.plan.get("steps", [])
             
-            for i, step_details in enumerate(all_steps):
-                coder_memory: List[Dict[str, Any]] = []
-                reviewer_memory: List[Dict[str, Any]] = [{"role": "system", "content": self.prompt_builder.build_review_prompt(step_details, plan=self.plan)}]
-
-                self.current_step_index = i
-                logger.info(f"--- Executing Step {i+1}/{len(all_steps)}: {step_details.get('title')} ---")
-                
-                step_result, _ = self._execute_coding_step_with_review(step_details, coder_memory, reviewer_memory)
-                
-                if step_result["status"] == "failure":
-                    self.state = OrchestratorState.FAILED
-                    logger.error(f"Step {i+1} failed. Aborting.")
-
-                    logger.info(f"Total tokens used to complete the request {self.total_token_usage}")
+            failure = self._run_steps(all_steps)
+            if failure:
+                i, step_result = failure
+                self.state = OrchestratorState.FAILED
+                logger.error(f"Step {i+1} failed. Aborting.")
 
-                    return {
-                        "status": "failure", 
-                        "reason": f"Failed at step {i+1}", 
-                        "details": step_result.get("details") or step_result.get("reason")
-                    }
+                logger.info(f"Total tokens used to complete the request {self.total_token_usage}")
 
-                logger.info(f"--- Step {i+1} approved and completed successfully. ---")
+                return {
+                    "status": "failure", 
+                    "reason": f"Failed at step {i+1}", 
+                    "details": step_result.get("details") or step_result.get("reason")
+                }
 
             self.state = OrchestratorState.COMPLETED
             logger.info("--- All steps completed and approved. Workflow finished. ---")
@@ -151,10 +229,9 @@ class Orchestrator:
             planner_tokens = self.planner.get_total_token_usage()
             coder_tokens = self.coder.get_total_token_usage()
             
-            check_project_syntax()
-            compile_react_src()
-            check_project_lint()
-            copy_src_to_exp_folder()
+            # Changes still held in memory because they did not type-check are the result of this request too
+            self.file_operations_service.commit_pending()
+            run_quality_pipeline()
 
             log_data = {
                 "request": user_request,
@@ -171,6 +248,95 @@ class Orchestrator:
             self.planner.total_tokens_used = 0
             self.coder.total_tokens_used = 0
 
+    # --- Step Scheduling ---
+    def _execute_step(self, i: int, step_details: Dict[str, Any], total_steps: int, completed_step_ids: Set[Any]) -> Dict[str, Any]:
+        """
+        Runs one plan step (coding + review) with its own coder and reviewer memory.
+        `completed_step_ids` are the finished steps its prompt lists as already executed.
+        """
+        coder_memory: List[Dict[str, Any]] = []
+        reviewer_memory: List[Dict[str, Any]] = [{"role": "system", "content": self.prompt_builder.build_review_prompt(step_details, plan=self.plan, completed_step_ids=completed_step_ids)}]
+
+        self.current_step_index = i
+        self.completed_step_ids = completed_step_ids
+        logger.info(f"--- Executing Step {i+1}/{total_steps}: {step_details.get('title')} ---")
+
+        step_result, _ = self._execute_coding_step_with_review(step_details, coder_memory, reviewer_memory)
+        if step_result["status"] != "failure":
+            logger.info(f"--- Step {i+1} approved and completed successfully. ---")
+        return step_result
+
+    def _execute_step_in_worker(self, i: int, step_details: Dict[str, Any], total_steps: int, completed_step_ids: Set[Any]) -> Dict[str, Any]:
+        """Worker-thread entry point: private agents so per-call stats of parallel steps do not mix."""
+        self.state = OrchestratorState.CODING
+        self._local.coder = create_ai(model=CODER, temperature=0.1)
+        self._local.planner = create_ai(model=PLANNER, temperature=0.1)
+        self._local.stream_output = False
+        try:
+            return self._execute_step(i, step_details, total_steps, completed_step_ids)
+        finally:
+            # Fold the worker's usage into the request totals reported in handle_user_request
+            with self._stats_lock:
+                self._coder.total_tokens_used += self._local.coder.get_total_token_usage()
+                self._planner.total_tokens_used += self._local.planner.get_total_token_usage()
+
+    def _run_steps(self, all_steps: List[Dict[str, Any]]) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        Executes the plan's steps. Steps are started as soon as every earlier step
+        they share files with has finished (see build_step_dependencies), up to
+        MAX_PARALLEL_STEPS at a time.
+        Returns (step index, step result) of the first failed step, or None.
+        """
+        if MAX_PARALLEL_STEPS <= 1 or len(all_steps) <= 1:
+            for i, step_details in enumerate(all_steps):
+                completed_step_ids = {step.get("id") for step in all_steps[:i]}
+                step_result = self._execute_step(i, step_details, len(all_steps), completed_step_ids)
+                if step_result["status"] == "failure":
+                    return i, step_result
+            return None
+
+        dependencies = build_step_dependencies(all_steps)
+        logger.info(f"Step dependencies: { {i + 1: sorted(d + 1 for d in deps) for i, deps in enumerate(dependencies)} }")
+
+        done: Set[int] = set()
+        pending = list(range(len(all_steps)))
+        running = {}
+        failures: Dict[int, Dict[str, Any]] = {}
+
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_STEPS, thread_name_prefix="step") as executor:
+            while pending or running:
+                # No new steps once one failed; let running ones finish
+                if not failures:
+                    for i in [i for i in pending if dependencies[i] <= done]:
+                        if len(running) >= MAX_PARALLEL_STEPS:
+                            break
+                        pending.remove(i)
+                        # Its prompts list the steps finished by now as executed, not every lower id
+                        completed_step_ids = {all_steps[j].get("id") for j in done}
+                        self._running_files[i] = step_files(all_steps[i])
+                        running[executor.submit(self._execute_step_in_worker, i, all_steps[i], len(all_steps), completed_step_ids)] = i
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    self._running_files.pop(i, None)
+                    try:
+                        step_result = future.result()
+                    except Exception as e:
+                        logger.exception(f"Step {i+1} raised an error: {e}")
+                        step_result = {"status": "failure", "reason": f"Step raised an error: {e}"}
+                    if step_result["status"] == "failure":
+                        failures[i] = step_result
+                    else:
+                        done.add(i)
+
+        if failures:
+            first = min(failures)
+            return first, failures[first]
+        return None
+
     # --- Phase-Specific Execution Logic ---
     def _execute_planning_phase(self, enhanced_prompt: str, user_request: str) -> Tuple[bool, Dict]:
         """Orchestrates the planning agent to generate a step-by-step plan."""
@@ -179,7 +345,7 @@ class Orchestrator:
         
         system_prompt = self.prompt_builder.load_system_prompt(state=OrchestratorState.PLANNING)
         #messages.extend(self.conversation_history) # Give planner context of past conversations
-        messages.append({"role": "system", "content": system_prompt + "\n" + enhanced_prompt})
+        messages.extend(prompt_prefix_messages(system_prompt, enhanced_prompt))
         messages.append({"role": "user", "content": user_request})
 
         # For simplicity, we won't implement a retry loop for the planner, but one could be added.
@@ -206,7 +372,7 @@ class Orchestrator:
             elif response_type == "tool":
                 tool_result = self._handle_tool_request(parsed_json)
                 messages.append({"role": "assistant", "content": response_text})
-                messages.append({"role": "user", "content": json.dumps(tool_result)})
+                messages.append({"role": "user", "content": json_codec.dumps(tool_result)})
                 continue
             elif response_type == "plan":
                 return True, parsed_json
@@ -338,7 +504,11 @@ class Orchestrator:
         last_parsed_json = None
 
         while True: 
-            response_text, token_usage, duration = self.stream_ai_response(messages=step_memory)
+            # Prefetch files / pre-validate changes as soon as they appear in the stream
+            detector = self.tool_service.stream_detector()
+            # Superseded fetch results are already references; keep older turns under the token ceiling
+            compact_memory(step_memory)
+            response_text, token_usage, duration = self.stream_ai_response(messages=step_memory, detector=detector)
             step_memory.append({"role": "assistant", "content": response_text})
             save_conversation(
                 messages=step_memory, 
@@ -359,7 +529,7 @@ class Orchestrator:
             if response_type == "tool":
                 tool_result = self._handle_tool_request(parsed_json)
                 if parsed_json.get("tool_name") == "fetch_files":
-                    step_memory.append({"role": "user", "content": json.dumps(tool_result)})
+                    append_fetch_result(step_memory, tool_result)
                     continue
                 elif parsed_json.get("tool_name") == "write_to_files":
                     final_report = tool_result.get("result")
@@ -376,7 +546,7 @@ class Orchestrator:
         sys.stdout.write(chunk)
         sys.stdout.flush()
 
-    def stream_ai_response(self, messages: List[Dict[str, str]]) -> Tuple[str, int, float]:
+    def stream_ai_response(self, messages: List[Dict[str, str]], detector: Optional[StreamingToolCallDetector] = None) -> Tuple[str, int, float]:
         logger.info(f"Streaming response with {len(messages)} messages")
 
         # Use planner for PLANNING (and also during review), otherwise coder
@@ -389,34 +559,57 @@ class Orchestrator:
         else:
             logger.warning(f"No Agent defined for state {self.state} ")
 
+        # Parallel steps would interleave their streams; they print whole responses instead
+        stream_output = getattr(self._local, "stream_output", True)
         full_response = ""
         try:
             for chunk in agent.call_model(messages=messages):
                 if isinstance(chunk, str):
-                    self.print_streaming_response(chunk)
+                    if stream_output:
+                        self.print_streaming_response(chunk)
                     full_response += chunk
+                    if detector:
+                        detector.feed(chunk)
+            if not stream_output:
+                self.print_streaming_response(f"[Step {self.current_step_index + 1} · {agent_name}]\n{full_response}")
 
             # Get logging metrics
             token_usage = agent.get_call_token_usage()
             duration = agent.get_call_duration()
             cost = agent.calculate_token_cost()
-            self.total_request_cost += cost
 
             print()
-            log_token_usage_per_call({
-                "agent_name": agent_name,
-                "tokens": agent.last_call_tokens,
-                "duration": agent.last_call_duration,
-                "response": full_response
-            })
-            self.total_token_usage += token_usage
+            with self._stats_lock:
+                self.total_request_cost += cost
+                log_token_usage_per_call({
+                    "agent_name": agent_name,
+                    "tokens": agent.last_call_tokens,
+                    "duration": agent.last_call_duration,
+                    "input_tokens": agent.last_input_tokens,
+                    "cached_tokens": agent.last_cached_tokens,
+                    "response": full_response
+                })
+                self.total_token_usage += token_usage
             logger.info(f"Total tokens used so far (Coder and Planner): {self.total_token_usage}")
             print()
         except Exception as e:
             print(f"\n❌ Error streaming response: {e}")
         return full_response, token_usage, duration
     
+    def _files_of_other_running_steps(self) -> Set[str]:
+        files: Set[str] = set()
+        for i, step_file_set in list(self._running_files.items()):
+            if i != self.current_step_index:
+                files |= step_file_set
+        return files
+
     def _handle_tool_request(self, parsed_json: Dict[str, Any]) -> Dict[str, Any]:
+        if parsed_json.get("tool_name") == "write_to_files":
+            # One apply + project type check at a time, even with parallel steps; pending
+            # changes that do not type-check yet stay with the step that wrote them
+            owner = f"step-{self.current_step_index + 1}" if self.current_step_index >= 0 else None
+            with self._apply_lock:
+                return self.tool_service.execute_tool(parsed_json, owner=owner)
         return self.tool_service.execute_tool(parsed_json)
     
 
@@ -503,9 +696,10 @@ class Orchestrator:
                 plan=self.plan,
                 current_step=step_details,
                 guidelines=context,
-                file_blobs=self._get_current_file_blobs(unique_files)
+                file_blobs=self._get_current_file_blobs(unique_files),
+                completed_step_ids=self.completed_step_ids
             )
-            coder_memory.append({"role": "system", "content": coder_system_prompt + "\n" + coder_context_prompt})
+            coder_memory.extend(prompt_prefix_messages(coder_system_prompt, coder_context_prompt))
 
         # Final report containing all attempts changes
         final_report: Dict[str, Any] = {
@@ -586,14 +780,16 @@ class Orchestrator:
             # If we encountered SEARCH/REPLACE Block errors, request the model to fix building upon the new context
             if scope == "file":
                 applied_paths = [r["path"] for r in results if r.get("status") == "success" and r.get("path")]
-                skipped_or_failed_paths = [r["path"] for r in results if r.get("status") != "success" and r.get("path")]
-                scope_paths = sorted(set(error_files or skipped_or_failed_paths))
+                failed_paths = [r["path"] for r in results if r.get("status") in ("failure", "error") and r.get("path")]
+                skipped_paths = [r["path"] for r in results if r.get("status") == "skipped" and r.get("path")]
+                scope_paths = sorted(set(error_files or failed_paths))
                 report = self.prompt_builder.build_orchestrator_report_edit_repair(
                     step_id=step_id,
                     txn_id=f"{step_id}-txn-{attempt_index + 1}",
                     applied_paths=applied_paths,
                     failed_paths=scope_paths,
-                    errors=errors_raw
+                    errors=errors_raw,
+                    skipped_paths=skipped_paths
                 )
 
                 # append error fixing prompt to the existing context
@@ -602,7 +798,9 @@ class Orchestrator:
 
             elif scope == "project":
                 applied_paths = [r["path"] for r in results if r.get("path")]
-                scope_paths = sorted(set(error_files))
+                # Files of steps running concurrently are theirs to fix; adapt this step's own files instead
+                foreign_files = self._files_of_other_running_steps()
+                scope_paths = sorted(set(error_files) - foreign_files) or sorted(set(applied_paths) - foreign_files)
                 report = self.prompt_builder.build_orchestrator_report_build_repair(
                     step_id=step_id,
                     txn_id=f"{step_id}-txn-{attempt_index + 1}",
@@ -774,7 +972,7 @@ class Orchestrator:
         fence_match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, flags=re.DOTALL | re.IGNORECASE)
         if fence_match:
             try:
-                return json.loads(fence_match.group(1))
+                return json_codec.loads(fence_match.group(1))
             except Exception:
                 pass
         # Fallback: take largest {...} span
@@ -783,11 +981,11 @@ class Orchestrator:
         if start != -1 and end != -1 and end > start:
             candidate = text[start:end+1]
             try:
-                return json.loads(candidate)
+                return json_codec.loads(candidate)
             except Exception:
                 return None
         # Direct parse
         try:
-            return json.loads(text)
+            return json_codec.loads(text)
         except Exception:
             return None
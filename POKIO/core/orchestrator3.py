@@ -4,21 +4,23 @@ Coordinates the Coder agent and its respective services.
 """
 import logging
 from typing import Dict, Any, List, Tuple, Optional
-import json
+import json_codec
 import os
 import sys
 from dotenv import load_dotenv
 from utils import OrchestratorState, format_history_lines, save_conversation, format_duration_hms
+from memory_manager import append_fetch_result, compact_memory
 import hashlib
 import time
 
 # Import services
 from verification_service import VerificationService
 from tool_service import ToolService
+from stream_parser import StreamingToolCallDetector
 from file_operations_service import FileOperationsService
 from prompt_builder import PromptBuilder
-from ai import AI
-from logging_service import log_coder_errors, log_token_usage_final, log_token_usage_per_call, check_project_syntax, compile_react_src, check_project_lint, copy_src_to_exp_folder
+from ai import create_ai
+from logging_service import log_coder_errors, log_token_usage_final, log_token_usage_per_call, run_quality_pipeline, wait_for_quality_pipeline
 
 load_dotenv()
 
@@ -49,12 +51,14 @@ class Orchestrator:
         self.change_history: List[Dict[str, str]] = []
 
         # Initialize services
-        self.coder = AI(model=CODER, temperature=0.1)
+        self.coder = create_ai(model=CODER, temperature=0.1)
         
         self.verification_service = VerificationService()
         self.file_operations_service = FileOperationsService(project_root=self.project_root)
         self.tool_service = ToolService(project_root=self.project_root, file_operations_service=self.file_operations_service)
         self.prompt_builder = PromptBuilder(project_root=project_root)
+        # Keep the analyzer's project model current with our own writes
+        self.file_operations_service.add_change_listener(self.prompt_builder.analyzer.notify_file_changed)
         self.total_token_usage = 0
         self.total_request_cost = 0.0
 
@@ -75,7 +79,7 @@ class Orchestrator:
 
     def update_conversation_history(self, role: str, content: Dict[str, Any]) -> None:
         """Persist one *condensed* turn to global memory."""     
-        self.conversation_history.append({"role": role, "content": json.dumps(content)})
+        self.conversation_history.append({"role": role, "content": json_codec.dumps(content)})
         self._trim_global_history()
 
     # --- Main Entry Point ---
@@ -85,6 +89,8 @@ class Orchestrator:
         """
         logger.info(f"--- New Request Received: '{user_request[:50]}...' ---")
         request_start_time = time.time()
+        # A background quality pipeline from the previous request must not see this request's edits
+        wait_for_quality_pipeline()
 
         try:
             # === DIRECT CODING EXECUTION ===
@@ -111,10 +117,9 @@ class Orchestrator:
             total_duration = time.time() - request_start_time
             coder_tokens = self.coder.get_total_token_usage()
             
-            check_project_syntax()
-            compile_react_src()
-            check_project_lint()
-            copy_src_to_exp_folder()
+            # Changes still held in memory because they did not type-check are the result of this request too
+            self.file_operations_service.commit_pending()
+            run_quality_pipeline()
 
             log_data = {
                 "request": user_request,
@@ -206,14 +211,16 @@ class Orchestrator:
                 # If we encountered SEARCH/REPLACE Block errors, request the model to fix building upon the new context
                 if scope == "file":
                     applied_paths = [r["path"] for r in results if r.get("status") == "success" and r.get("path")]
-                    skipped_or_failed_paths = [r["path"] for r in results if r.get("status") != "success" and r.get("path")]
-                    scope_paths = sorted(set(error_files or skipped_or_failed_paths))
+                    failed_paths = [r["path"] for r in results if r.get("status") in ("failure", "error") and r.get("path")]
+                    skipped_paths = [r["path"] for r in results if r.get("status") == "skipped" and r.get("path")]
+                    scope_paths = sorted(set(error_files or failed_paths))
                     report = self.prompt_builder.build_orchestrator_report_edit_repair(
                         step_id=task_id,
                         txn_id=f"{task_id}-txn-{attempt_index + 1}",
                         applied_paths=applied_paths,
                         failed_paths=scope_paths,
-                        errors=errors_raw
+                        errors=errors_raw,
+                        skipped_paths=skipped_paths
                     )
 
                     # append error fixing prompt to the existing context
@@ -253,7 +260,11 @@ class Orchestrator:
         last_parsed_json = None
 
         while True: 
-            response_text, token_usage, duration = self.stream_ai_response(messages=task_memory)
+            # Prefetch files / pre-validate changes as soon as they appear in the stream
+            detector = self.tool_service.stream_detector()
+            # Superseded fetch results are already references; keep older turns under the token ceiling
+            compact_memory(task_memory)
+            response_text, token_usage, duration = self.stream_ai_response(messages=task_memory, detector=detector)
             task_memory.append({"role": "assistant", "content": response_text})
             save_conversation(
                 messages=task_memory, 
@@ -274,7 +285,7 @@ class Orchestrator:
             if response_type == "tool":
                 tool_result = self._handle_tool_request(parsed_json)
                 if parsed_json.get("tool_name") == "fetch_files":
-                    task_memory.append({"role": "user", "content": json.dumps(tool_result)})
+                    append_fetch_result(task_memory, tool_result)
                     continue
                 elif parsed_json.get("tool_name") == "write_to_files":
                     final_report = tool_result.get("result")
@@ -291,7 +302,7 @@ class Orchestrator:
         sys.stdout.write(chunk)
         sys.stdout.flush()
 
-    def stream_ai_response(self, messages: List[Dict[str, str]]) -> Tuple[str, int, float]:
+    def stream_ai_response(self, messages: List[Dict[str, str]], detector: Optional[StreamingToolCallDetector] = None) -> Tuple[str, int, float]:
         logger.info(f"Streaming response with {len(messages)} messages")
 
         agent = self.coder
@@ -303,6 +314,8 @@ class Orchestrator:
                 if isinstance(chunk, str):
                     self.print_streaming_response(chunk)
                     full_response += chunk
+                    if detector:
+                        detector.feed(chunk)
             token_usage = agent.get_call_token_usage()
             duration = agent.get_call_duration()
             cost = agent.calculate_token_cost()
@@ -313,6 +326,8 @@ class Orchestrator:
                 "agent_name": agent_name,
                 "tokens": agent.last_call_tokens,
                 "duration": agent.last_call_duration,
+                "input_tokens": agent.last_input_tokens,
+                "cached_tokens": agent.last_cached_tokens,
                 "response": full_response
             })
             self.total_token_usage += token_usage
@@ -3,21 +3,224 @@ Project analyzer service.
 Scans project directory and returns existing file names, dependencies, and a 
 module dependency graph using robust AST parsing.
 """
+import atexit
+import hashlib
 import json
 import logging
+import sqlite3
 import subprocess
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, List, Set, Optional
+from typing import Dict, Any, List, Set, Optional, Tuple
 import os
 
+from project_watcher import create_project_watcher
+from relevance_index import RelevanceIndex
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Number of long-lived `node parser.js --worker` processes used to parse source files
+AST_PARSER_WORKERS = int(os.getenv("AST_PARSER_WORKERS", 2))
+
+# Cached parse result of one source file. `imports`/`exports` are None when parsing failed.
+FileIndexEntry = namedtuple('FileIndexEntry', ['mtime_ns', 'size', 'sha256', 'imports', 'exports'])
+
+# Persist the file index under <project_root>/.pokio/ so restarts only re-parse changed files
+PROJECT_INDEX_PERSIST = os.getenv("PROJECT_INDEX_PERSIST", "1") == "1"
+PROJECT_INDEX_DIR = ".pokio"
+PROJECT_INDEX_SCHEMA_VERSION = "1"
+
+# Keep the project model hot with a filesystem watcher: "auto" (inotify, polling fallback), "poll" or "off"
+PROJECT_WATCHER = os.getenv("PROJECT_WATCHER", "auto")
+PROJECT_WATCHER_POLL_INTERVAL = float(os.getenv("PROJECT_WATCHER_POLL_INTERVAL", 1.0))
+
+
+class ASTParserWorker:
+    """A long-lived Node.js parser process speaking a JSON-lines protocol over stdin/stdout."""
+
+    def __init__(self, parser_script_path: Path):
+        self.process = subprocess.Popen(
+            ["node", str(parser_script_path), "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        self._next_id = 0
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def parse(self, file_path: Path) -> Dict[str, Any]:
+        """Sends one parse request and blocks until the matching response line arrives."""
+        self._next_id += 1
+        request_id = self._next_id
+        self.process.stdin.write(json.dumps({"id": request_id, "file": str(file_path)}) + "\n")
+        self.process.stdin.flush()
+
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("AST parser worker exited unexpectedly.")
+        response = json.loads(line)
+        if response.get("id") != request_id:
+            raise RuntimeError(f"AST parser worker answered request {response.get('id')}, expected {request_id}.")
+        return response
+
+    def close(self) -> None:
+        if not self.is_alive():
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=2)
+        except Exception:
+            self.process.kill()
+
+
+class ASTParserPool:
+    """
+    A small pool of warm parser workers. Files are split across the workers and each
+    worker processes its share sequentially, so Node startup and @babel/parser loading
+    are paid once per worker instead of once per file.
+    """
+
+    def __init__(self, parser_script_path: Path, size: int = AST_PARSER_WORKERS):
+        self.parser_script_path = parser_script_path
+        self.size = max(1, size)
+        self._workers: List[ASTParserWorker] = []
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self, count: int) -> List[ASTParserWorker]:
+        """Starts missing workers and replaces dead ones."""
+        self._workers = [w for w in self._workers if w.is_alive()]
+        while len(self._workers) < count:
+            self._workers.append(ASTParserWorker(self.parser_script_path))
+        return self._workers[:count]
+
+    def parse_files(self, file_paths: List[Path]) -> Dict[Path, Dict[str, Any]]:
+        """
+        Parses files on the warm workers. Returns raw parser responses keyed by path.
+        Files a worker could not answer (e.g. because it crashed) are left out of the
+        result so the caller can fall back to the one-shot parser for them.
+        """
+        if not file_paths:
+            return {}
+
+        with self._lock:
+            workers = self._ensure_workers(min(self.size, len(file_paths)))
+            chunks = [file_paths[i::len(workers)] for i in range(len(workers))]
+
+            def run_chunk(worker: ASTParserWorker, chunk: List[Path]) -> Dict[Path, Dict[str, Any]]:
+                parsed: Dict[Path, Dict[str, Any]] = {}
+                for file_path in chunk:
+                    try:
+                        parsed[file_path] = worker.parse(file_path)
+                    except Exception as e:
+                        logger.warning(f"AST parser worker failed on {file_path}: {e}")
+                        worker.close()
+                        break
+                return parsed
+
+            results: Dict[Path, Dict[str, Any]] = {}
+            with ThreadPoolExecutor(max_workers=len(workers)) as executor:
+                for parsed in executor.map(run_chunk, workers, chunks):
+                    results.update(parsed)
+            return results
+
+    def close(self) -> None:
+        with self._lock:
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+
+
+class ProjectIndexStore:
+    """
+    SQLite-backed on-disk copy of the analyzer's file index.
+
+    The store is tagged with the schema version and the sha256 of parser.js, so a
+    changed parser invalidates every persisted parse result.
+    """
+
+    def __init__(self, db_path: Path, parser_signature: str):
+        self.db_path = db_path
+        self.parser_signature = parser_signature
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, sha256 TEXT, imports TEXT, exports TEXT)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # A short-lived connection per operation keeps the store usable from any thread
+        return sqlite3.connect(str(self.db_path))
+
+    def load(self) -> Dict[str, FileIndexEntry]:
+        """Returns the persisted entries, or an empty index if the store is stale."""
+        with self._connect() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            if meta.get("schema_version") != PROJECT_INDEX_SCHEMA_VERSION or meta.get("parser_signature") != self.parser_signature:
+                conn.execute("DELETE FROM files")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                    [("schema_version", PROJECT_INDEX_SCHEMA_VERSION), ("parser_signature", self.parser_signature)]
+                )
+                return {}
+
+            entries: Dict[str, FileIndexEntry] = {}
+            for path, mtime_ns, size, sha256, imports, exports in conn.execute("SELECT * FROM files"):
+                if imports is None or exports is None:
+                    # Failed parse saved by an older version: leave it to be parsed again
+                    continue
+                entries[path] = FileIndexEntry(
+                    mtime_ns=mtime_ns,
+                    size=size,
+                    sha256=sha256,
+                    imports=json.loads(imports) if imports is not None else None,
+                    exports=json.loads(exports) if exports is not None else None,
+                )
+            return entries
+
+    def save(self, updated: Dict[str, FileIndexEntry], removed: List[str]) -> None:
+        """Upserts changed entries and deletes removed ones in a single transaction."""
+        if not updated and not removed:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (path, mtime_ns, size, sha256, imports, exports) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        path,
+                        entry.mtime_ns,
+                        entry.size,
+                        entry.sha256,
+                        json.dumps(entry.imports) if entry.imports is not None else None,
+                        json.dumps(entry.exports) if entry.exports is not None else None,
+                    )
+                    for path, entry in updated.items()
+                ]
+            )
+            conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+
+
 class ProjectAnalyzerService:
     """Service to analyze project structure and file information using robust techniques."""
 
-    def __init__(self, project_root: str):
+    def __init__(
+        self,
+        project_root: str,
+        use_worker_pool: bool = True,
+        persist_index: bool = PROJECT_INDEX_PERSIST,
+        watch: str = PROJECT_WATCHER
+    ):
         if not project_root or not os.path.exists(project_root):
             raise ValueError(f"Valid project root directory is required. Got: {project_root}")
         
@@ -27,12 +230,66 @@ class ProjectAnalyzerService:
             raise FileNotFoundError("Node.js parser script 'parser.js' not found.")
             
         # Baseline ignore patterns
-        self.ignored_dirs = {'.git', 'node_modules', 'dist', 'build', '.vscode', '.idea', '__pycache__'}
+        self.ignored_dirs = {'.git', 'node_modules', 'dist', 'build', '.vscode', '.idea', '__pycache__', PROJECT_INDEX_DIR}
         self.ignored_files = {'.DS_Store', 'package-lock.json', 'yarn.lock', 'eslint.config.js', 'vite-env.d.ts'}
         self.code_file_extensions = {'.ts', '.tsx', '.js', '.jsx'}
+
+        # Warm Node.js parser processes; falls back to one-shot parsing when unavailable
+        self._parser_pool: Optional[ASTParserPool] = ASTParserPool(self.parser_script_path) if use_worker_pool else None
+        atexit.register(self.close)
+
+        # Per-file parse cache keyed by project-relative path; validated by mtime + size,
+        # confirmed by sha256 when the stat data changed
+        self._file_index: Dict[str, FileIndexEntry] = {}
+        self._graph_markdown: Optional[str] = None
+        # Lexical index over the same code files, synced with the file index on use
+        self._relevance_index = RelevanceIndex()
+
+        self._index_store: Optional[ProjectIndexStore] = None
+        if persist_index:
+            self._load_persisted_index()
+
+        # In-memory project model (relative posix paths, scan ignore rules applied), kept
+        # current by the watcher and by direct notifications from FileOperationsService.
+        # Stays None until the first full scan.
+        self._model_lock = threading.RLock()
+        self._model_files: Optional[Set[str]] = None
+        self._model_dirs: Set[str] = set()
+        self._dirty_files: Set[str] = set()
+        self._index_validated = False
+        self._tree_markdown: Optional[str] = None
+        self._watcher = None
+        self._start_watcher(watch)
         
         logger.info(f"ProjectAnalyzerService initialized for {self.project_root}")
 
+    def _load_persisted_index(self) -> None:
+        """Seeds the in-memory file index from the on-disk store; entries are re-validated on use."""
+        try:
+            parser_signature = self._sha256_file(self.parser_script_path)
+            self._index_store = ProjectIndexStore(self.project_root / PROJECT_INDEX_DIR / "index.sqlite3", parser_signature)
+            self._file_index = self._index_store.load()
+            logger.info(f"Loaded {len(self._file_index)} persisted file index entries.")
+        except Exception as e:
+            logger.warning(f"Could not load persisted project index, starting cold: {e}")
+            self._index_store = None
+            self._file_index = {}
+
+    def _start_watcher(self, mode: str) -> None:
+        try:
+            self._watcher = create_project_watcher(
+                self.project_root,
+                on_event=self._on_fs_event,
+                dir_filter=lambda d: not self._is_path_ignored(d.relative_to(self.project_root)),
+                mode=mode,
+                interval=PROJECT_WATCHER_POLL_INTERVAL
+            )
+            if self._watcher is not None:
+                self._watcher.start()
+        except Exception as e:
+            logger.warning(f"Could not start project watcher, falling back to per-call scans: {e}")
+            self._watcher = None
+
     def _is_path_ignored(self, path: Path) -> bool:
         """Checks if a path should be ignored by baseline rules."""
         if any(part in self.ignored_dirs for part in path.parts) or path.name in self.ignored_files:
@@ -173,8 +430,21 @@ class ProjectAnalyzerService:
         Args:
             include_hidden: If True, include dot-files/dirs except those in ignore lists.
             max_depth: Optional depth limit (0 = only root, 1 = root's children, etc.).
+
+        With a running watcher the default view is rendered from the in-memory
+        project model instead of walking the filesystem.
         """
         try:
+            if self._watcher is not None and not include_hidden and max_depth is None:
+                with self._model_lock:
+                    self._ensure_model()
+                    if self._tree_markdown is None:
+                        self._tree_markdown = self._tree_to_markdown(self._model_tree())
+                    return {
+                        "tool": "project_analyzer",
+                        "result": {"status": "success", "tree_markdown": self._tree_markdown}
+                    }
+
             root = self.project_root
             project_tree: Dict[str, Any] = {}
 
@@ -238,29 +508,280 @@ class ProjectAnalyzerService:
         """
         Builds a dependency graph by parsing files with an AST parser
         and returns a markdown representation.
+
+        Only files that changed since the previous call are re-parsed; when nothing
+        changed the previously rendered markdown is returned as is.
         """
         try:
-            nodes: List[Dict[str, Any]] = []
+            with self._model_lock:
+                return self._build_dependency_graph()
+        except Exception as e:
+            return self._create_error_response(f"Error building dependency graph: {e}")
+
+    def _build_dependency_graph(self) -> Dict[str, Any]:
+        if self._watcher is not None:
+            # Hot model: no filesystem walk, only files reported as changed are checked
+            self._ensure_model()
+            code_files = [
+                self.project_root / rel_path
+                for rel_path in sorted(self._model_files)
+                if Path(rel_path).suffix in self.code_file_extensions
+            ]
+            candidates = self._dirty_files if self._index_validated else None
+            self._dirty_files = set()
+        else:
             code_files = self._scan_project_files(self.project_root, self.code_file_extensions)
+            candidates = None
 
-            for file_path in code_files:
-                parsed_data = self._parse_file_with_node(file_path)
-                if parsed_data:
-                    nodes.append({
-                        "id": file_path.relative_to(self.project_root).as_posix(),
-                        "imports": sorted(parsed_data.get("imports", [])),
-                        #"exports": sorted(parsed_data.get("exports", []))
-                    })
+        changed = self._refresh_file_index(code_files, candidates=candidates)
+        self._index_validated = True
+        if not changed and self._graph_markdown is not None:
+            return {
+                "tool": "project_analyzer",
+                "result": {"status": "success", "graph_markdown": self._graph_markdown}
+            }
 
-            markdown_graph = self._dependency_graph_to_markdown(nodes)
+        nodes: List[Dict[str, Any]] = []
+        for rel_path, entry in self._file_index.items():
+            if entry.imports is not None:
+                nodes.append({
+                    "id": rel_path,
+                    "imports": sorted(entry.imports),
+                    #"exports": sorted(entry.exports)
+                })
 
+        markdown_graph = self._dependency_graph_to_markdown(nodes)
+        self._graph_markdown = markdown_graph
+
+        return {
+            "tool": "project_analyzer",
+            "result": {"status": "success", "graph_markdown": markdown_graph}
+        }
+
+    # ---------------- Relevance ranking ---------------- #
+
+    def rank_relevant_files(self, query: str, top_k: int = 5) -> Dict[str, Any]:
+        """
+        Ranks the project's code files by lexical relevance (BM25 over paths, exported
+        names, JSX text and identifiers) to `query`, e.g. a user request or plan step.
+        """
+        try:
+            with self._model_lock:
+                # Refreshes the per-file parse cache, whose exports feed the index
+                self._build_dependency_graph()
+                self._sync_relevance_index()
+                ranked = self._relevance_index.search(query, top_k)
             return {
                 "tool": "project_analyzer",
-                "result": {"status": "success", "graph_markdown": markdown_graph}
+                "result": {"status": "success", "files": [{"path": path, "score": round(score, 3)} for path, score in ranked]}
             }
         except Exception as e:
-            return self._create_error_response(f"Error building dependency graph: {e}")
+            return self._create_error_response(f"Error ranking relevant files: {e}")
+
+    def _sync_relevance_index(self) -> None:
+        """Re-indexes files whose content differs from what the relevance index holds."""
+        for rel_path in self._relevance_index.paths() - self._file_index.keys():
+            self._relevance_index.remove(rel_path)
+        for rel_path, entry in self._file_index.items():
+            if self._relevance_index.signature(rel_path) == entry.sha256:
+                continue
+            try:
+                data = (self.project_root / rel_path).read_bytes()
+            except OSError:
+                continue
+            self._relevance_index.update(rel_path, data.decode("utf-8", errors="replace"), exports=entry.exports or [],
+                                         signature=hashlib.sha256(data).hexdigest())
+
+    # ---------------- Hot project model ---------------- #
+
+    def _ensure_model(self) -> None:
+        """Populates the in-memory project model with one full walk, if not done yet."""
+        if self._model_files is not None:
+            return
+        self._model_files = set()
+        self._model_dirs = set()
+        self._add_subtree_to_model(self.project_root)
+        logger.info(f"Project model loaded: {len(self._model_files)} files in {len(self._model_dirs)} directories.")
+
+    def _add_subtree_to_model(self, directory: Path) -> None:
+        for dirpath, dirnames, filenames in os.walk(directory):
+            rel_dir = Path(dirpath).relative_to(self.project_root)
+            dirnames[:] = [d for d in dirnames if not self._is_path_ignored(rel_dir / d)]
+            for d in dirnames:
+                self._model_dirs.add((rel_dir / d).as_posix())
+            for f in filenames:
+                rel_file = rel_dir / f
+                if not self._is_path_ignored(rel_file):
+                    self._model_files.add(rel_file.as_posix())
+                    self._dirty_files.add(rel_file.as_posix())
+
+    def _model_tree(self) -> Dict[str, Any]:
+        """Nested dict tree of the model, hiding dot-files/dirs like `get_project_tree` does."""
+        project_tree: Dict[str, Any] = {}
+
+        def visible(parts: Tuple[str, ...]) -> bool:
+            return not any(part.startswith('.') for part in parts)
+
+        for rel_dir in self._model_dirs:
+            parts = Path(rel_dir).parts
+            if visible(parts):
+                node = project_tree
+                for part in parts:
+                    node = node.setdefault(part, {})
+
+        for rel_file in self._model_files:
+            parts = Path(rel_file).parts
+            if visible(parts):
+                node = project_tree
+                for part in parts[:-1]:
+                    node = node.setdefault(part, {})
+                node[parts[-1]] = "file"
+
+        return project_tree
+
+    def _on_fs_event(self, abs_path: str, kind: str, is_dir: bool) -> None:
+        """Applies one create/modify/delete event to the in-memory tree and dependency graph."""
+        rel_path = Path(os.path.relpath(abs_path, self.project_root))
+        if rel_path.parts and rel_path.parts[0] == '..':
+            return
+        if rel_path == Path('.') or self._is_path_ignored(rel_path):
+            return
+
+        rel = rel_path.as_posix()
+        with self._model_lock:
+            if self._model_files is None:
+                # Not loaded yet; the first full scan will pick the change up
+                return
+
+            if is_dir:
+                if kind == "created":
+                    self._model_dirs.add(rel)
+                    self._add_subtree_to_model(self.project_root / rel_path)
+                elif kind == "deleted":
+                    prefix = rel + "/"
+                    self._model_dirs = {d for d in self._model_dirs if d != rel and not d.startswith(prefix)}
+                    self._model_files = {f for f in self._model_files if not f.startswith(prefix)}
+                self._tree_markdown = None
+                return
+
+            if kind == "deleted":
+                if rel in self._model_files:
+                    self._model_files.discard(rel)
+                    self._tree_markdown = None
+            elif rel not in self._model_files:
+                self._model_files.add(rel)
+                for parent in rel_path.parents:
+                    if parent != Path('.'):
+                        self._model_dirs.add(parent.as_posix())
+                self._tree_markdown = None
+            self._dirty_files.add(rel)
+
+    def notify_file_changed(self, rel_path: str) -> None:
+        """
+        Direct notification for writes made by POKIO itself (see FileOperationsService),
+        so they are reflected without waiting for, or relying on, the watcher.
+        """
+        full_path = self.project_root / rel_path
+        self._on_fs_event(str(full_path), "modified" if full_path.exists() else "deleted", False)
     
+    def _refresh_file_index(self, code_files: List[Path], candidates: Optional[Set[str]] = None) -> bool:
+        """
+        Brings the per-file parse cache in line with `code_files`, re-parsing only
+        new files and files whose content changed. Returns True if any entry changed.
+
+        If `candidates` is given, already indexed files outside of it are trusted
+        without a stat call (the hot model knows they did not change).
+        """
+        stale: List[Path] = []
+        stale_meta: Dict[Path, Tuple[os.stat_result, str]] = {}
+        seen: Set[str] = set()
+        updated: Dict[str, FileIndexEntry] = {}
+
+        for file_path in code_files:
+            rel_path = file_path.relative_to(self.project_root).as_posix()
+            seen.add(rel_path)
+            entry = self._file_index.get(rel_path)
+            if entry and candidates is not None and rel_path not in candidates:
+                continue
+
+            stat = file_path.stat()
+
+            if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                continue
+
+            sha256 = self._sha256_file(file_path)
+            if entry and entry.sha256 == sha256:
+                # Touched but not modified: refresh the stat key only
+                self._file_index[rel_path] = updated[rel_path] = entry._replace(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                continue
+
+            stale.append(file_path)
+            stale_meta[file_path] = (stat, sha256)
+
+        removed = [rel_path for rel_path in self._file_index if rel_path not in seen]
+        for rel_path in removed:
+            del self._file_index[rel_path]
+
+        if stale:
+            logger.info(f"Re-parsing {len(stale)} changed file(s) out of {len(code_files)}.")
+            parsed_files = self._parse_files(stale)
+            for file_path in stale:
+                stat, sha256 = stale_meta[file_path]
+                parsed_data = parsed_files.get(file_path)
+                rel_path = file_path.relative_to(self.project_root).as_posix()
+                if parsed_data is None:
+                    # Not indexed (nor persisted), so the next refresh parses it again instead of
+                    # trusting a transient parser failure until the file is edited
+                    if self._file_index.pop(rel_path, None) is not None:
+                        removed.append(rel_path)
+                    continue
+                self._file_index[rel_path] = updated[rel_path] = FileIndexEntry(
+                    mtime_ns=stat.st_mtime_ns,
+                    size=stat.st_size,
+                    sha256=sha256,
+                    imports=parsed_data.get("imports", []),
+                    exports=parsed_data.get("exports", []),
+                )
+
+        if self._index_store is not None:
+            try:
+                self._index_store.save(updated, removed)
+            except Exception as e:
+                logger.warning(f"Could not persist project index: {e}")
+
+        return bool(stale or removed)
+
+    @staticmethod
+    def _sha256_file(file_path: Path) -> str:
+        return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+    def _parse_files(self, file_paths: List[Path]) -> Dict[Path, Optional[Dict[str, Any]]]:
+        """
+        Parses files on the warm worker pool, falling back to the one-shot
+        `_parse_file_with_node` path for anything the pool could not handle.
+        """
+        results: Dict[Path, Optional[Dict[str, Any]]] = {}
+
+        if self._parser_pool is not None:
+            try:
+                for file_path, parsed_output in self._parser_pool.parse_files(file_paths).items():
+                    if parsed_output.get("error"):
+                        logger.warning(f"AST parser error for {file_path}: {parsed_output['error']}")
+                        results[file_path] = None
+                    else:
+                        results[file_path] = parsed_output
+            except FileNotFoundError:
+                logger.error("`node` command not found. Disabling the AST parser worker pool.")
+                self._parser_pool = None
+            except Exception as e:
+                logger.warning(f"AST parser worker pool failed, falling back to one-shot parsing: {e}")
+
+        for file_path in file_paths:
+            if file_path not in results:
+                results[file_path] = self._parse_file_with_node(file_path)
+
+        return results
+
     def _parse_file_with_node(self, file_path: Path) -> Optional[Dict[str, Any]]:
         """Uses a Node.js subprocess for robust AST parsing."""
         try:
@@ -284,6 +805,14 @@ class ProjectAnalyzerService:
     def _create_error_response(self, message: str) -> Dict[str, Any]:
         return {"tool": "project_analyzer", "result": {"status": "error", "error": message}}
 
+    def close(self) -> None:
+        """Stops the watcher and the parser worker processes."""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        if self._parser_pool is not None:
+            self._parser_pool.close()
+
 # --- Main execution block to demonstrate usage ---
 if __name__ == "__main__":
     analyzer = ProjectAnalyzerService("../app_template/react-app")
@@ -309,3 +838,26 @@ if __name__ == "__main__":
     else:
         logger.warning("Could not build dependency graph.")
         print(graph_result)
+
+    print("\n--- 4. Benchmark: one-shot parser processes vs. warm worker pool ---")
+    code_files = analyzer._scan_project_files(analyzer.project_root, analyzer.code_file_extensions)
+    rounds = 5
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for file_path in code_files:
+            analyzer._parse_file_with_node(file_path)
+    one_shot_time = (time.perf_counter() - start) / rounds
+
+    analyzer._parse_files(code_files)  # warm up the workers
+    start = time.perf_counter()
+    for _ in range(rounds):
+        analyzer._parse_files(code_files)
+    pool_time = (time.perf_counter() - start) / rounds
+
+    print(f"Files parsed per round: {len(code_files)}")
+    print(f"One-shot: {one_shot_time * 1000:.1f} ms/round")
+    print(f"Worker pool ({AST_PARSER_WORKERS} workers): {pool_time * 1000:.1f} ms/round")
+    if pool_time > 0:
+        print(f"Speedup: {one_shot_time / pool_time:.1f}x")
+    analyzer.close()
@@ -0,0 +1,172 @@
+"""
+Project watcher.
+Keeps the ProjectAnalyzerService's in-memory project model hot by delivering
+create/modify/delete events instead of letting every prompt rescan the tree.
+
+Uses watchdog (inotify on Linux) when it is installed and falls back to a
+polling thread otherwise.
+"""
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional
+    FileSystemEventHandler = object
+    Observer = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Called with (absolute path, "created" | "modified" | "deleted", is_directory)
+EventCallback = Callable[[str, str, bool], None]
+# Decides whether a directory should be watched at all (e.g. node_modules is not)
+DirFilter = Callable[[Path], bool]
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Translates watchdog events into (path, kind, is_dir) callbacks."""
+
+    def __init__(self, watcher: "InotifyProjectWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        self.watcher._dispatch(event.src_path, "created", event.is_directory)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.watcher._dispatch(event.src_path, "modified", False)
+
+    def on_deleted(self, event):
+        self.watcher._dispatch(event.src_path, "deleted", event.is_directory)
+
+    def on_moved(self, event):
+        self.watcher._dispatch(event.src_path, "deleted", event.is_directory)
+        self.watcher._dispatch(event.dest_path, "created", event.is_directory)
+
+
+class InotifyProjectWatcher:
+    """
+    watchdog-based watcher. Directories are watched one by one (non-recursively)
+    so ignored trees such as node_modules never consume inotify watches.
+    """
+
+    def __init__(self, root: Path, on_event: EventCallback, dir_filter: DirFilter):
+        if Observer is None:
+            raise RuntimeError("watchdog is not installed.")
+        self.root = root
+        self.on_event = on_event
+        self.dir_filter = dir_filter
+        self._observer = Observer()
+        self._handler = _EventHandler(self)
+        self._watches: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        self._watch_tree(self.root)
+        self._observer.daemon = True
+        self._observer.start()
+        logger.info(f"Watching {len(self._watches)} directories under {self.root} (inotify).")
+
+    def stop(self) -> None:
+        self._observer.stop()
+
+    def _watch_tree(self, directory: Path) -> None:
+        for dirpath, dirnames, _ in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if self.dir_filter(Path(dirpath) / d)]
+            with self._lock:
+                if dirpath not in self._watches:
+                    self._watches[dirpath] = self._observer.schedule(self._handler, dirpath, recursive=False)
+
+    def _dispatch(self, path: str, kind: str, is_dir: bool) -> None:
+        if is_dir and not self.dir_filter(Path(path)):
+            return
+        if is_dir and kind == "created":
+            self._watch_tree(Path(path))
+        elif is_dir and kind == "deleted":
+            with self._lock:
+                for watched in [p for p in self._watches if p == path or p.startswith(path + os.sep)]:
+                    try:
+                        self._observer.unschedule(self._watches.pop(watched))
+                    except Exception:
+                        pass
+        self.on_event(path, kind, is_dir)
+
+
+class PollingProjectWatcher:
+    """Fallback watcher that diffs (mtime, size) snapshots on a background thread."""
+
+    def __init__(self, root: Path, on_event: EventCallback, dir_filter: DirFilter, interval: float = 1.0):
+        self.root = root
+        self.on_event = on_event
+        self.dir_filter = dir_filter
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._files: Dict[str, Tuple[int, int]] = {}
+        self._dirs: Set[str] = set()
+
+    def start(self) -> None:
+        self._files, self._dirs = self._snapshot()
+        self._thread = threading.Thread(target=self._run, name="project-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Polling {self.root} for changes every {self.interval:.1f}s.")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _snapshot(self) -> Tuple[Dict[str, Tuple[int, int]], Set[str]]:
+        files: Dict[str, Tuple[int, int]] = {}
+        dirs: Set[str] = set()
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if self.dir_filter(Path(dirpath) / d)]
+            dirs.update(os.path.join(dirpath, d) for d in dirnames)
+            for f in filenames:
+                path = os.path.join(dirpath, f)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+        return files, dirs
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                files, dirs = self._snapshot()
+            except Exception as e:
+                logger.warning(f"Project polling failed: {e}")
+                continue
+
+            for d in sorted(dirs - self._dirs):
+                self.on_event(d, "created", True)
+            for path, stat in files.items():
+                previous = self._files.get(path)
+                if previous is None:
+                    self.on_event(path, "created", False)
+                elif previous != stat:
+                    self.on_event(path, "modified", False)
+            for path in self._files.keys() - files.keys():
+                self.on_event(path, "deleted", False)
+            for d in sorted(self._dirs - dirs, reverse=True):
+                self.on_event(d, "deleted", True)
+
+            self._files, self._dirs = files, dirs
+
+
+def create_project_watcher(root: Path, on_event: EventCallback, dir_filter: DirFilter, mode: str = "auto", interval: float = 1.0):
+    """
+    Returns a started-ready watcher for `mode`: "auto" prefers inotify and falls back
+    to polling, "poll" always polls, anything else disables watching (returns None).
+    """
+    if mode == "auto" and Observer is not None:
+        return InotifyProjectWatcher(root, on_event, dir_filter)
+    if mode in ("auto", "poll"):
+        return PollingProjectWatcher(root, on_event, dir_filter, interval=interval)
+    return None
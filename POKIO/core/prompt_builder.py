@@ -1,21 +1,47 @@
 import os
 import logging
 import json
+import hashlib
 from project_analyzer import ProjectAnalyzerService
-from typing import Dict, Any, Tuple, List
+from typing import Dict, Any, Tuple, List, Optional, Set
 import os
 from dotenv import load_dotenv
 from utils import OrchestratorState, format_history_lines, format_file_blobs, stringify_errors, summarize_lint_and_syntax
 from logging_service import check_project_lint, check_project_syntax
+from context_budget import ContextSection, assemble_context, fit_file_blobs, fold_tree, summarize_graph, truncate_text
 
 load_dotenv()
 
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
+# Attach the contents of this many files ranked most relevant to the request/step, so the model
+# does not need a fetch_files round-trip for them (0 disables)
+RELEVANT_FILES_TOP_K = int(os.getenv("RELEVANT_FILES_TOP_K", 0))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Context section -> (weight, priority, min_tokens) when the context exceeds CONTEXT_TOKEN_BUDGET (see context_budget).
+# Weight is the share of the budget, the lowest priority is dropped first.
+CONTEXT_SECTIONS = {
+    "files": (6, 4, 50),
+    "tree": (2, 3, 150),
+    "dependencies": (1, 2, 20),
+    "dev_dependencies": (1, 2, 20),
+    "graph": (3, 1, 300),
+    "history": (1, 0, 100),
+}
+
+def prompt_prefix_messages(*parts: str) -> List[Dict[str, str]]:
+    """
+    Leading system messages for a prompt, one per part, ordered from most to least stable
+    (system prompt file, then project context). Providers cache prompts by prefix, so the
+    parts are kept apart instead of concatenated and everything volatile (request, step,
+    files, tool results) goes after them; see ai.add_cache_control for the breakpoints.
+    """
+    return [{"role": "system", "content": part} for part in parts if part]
+
+
 class PromptBuilder:
     """
     A service for building prompts with project analysis and dependency graph information.
@@ -96,11 +122,17 @@ class PromptBuilder:
     plan: Dict[str, Any],
     current_step: Dict[str, Any],
     guidelines: str,
-    file_blobs: List[dict]
+    file_blobs: List[dict],
+    relevant_files_top_k: int = RELEVANT_FILES_TOP_K,
+    completed_step_ids: Optional[Set[Any]] = None
     ) -> Tuple[str, str]:
         """
         Enhances the user's base prompt with a multi-faceted view of the project,
         including file structure, dependencies, and inter-file connections.
+        With relevant_files_top_k, the files most relevant to the step are attached after file_blobs.
+        completed_step_ids are the steps already executed (with parallel steps, not every lower id);
+        by default all steps with a lower id.
+        Returns (context, task): the context belongs in the cached prompt prefix, the task after it.
         """
         # ------------------------------------------------------------------
         # 1. Extract plan-level information
@@ -115,8 +147,11 @@ class PromptBuilder:
         # ------------------------------------------------------------------
         
         # Format Previously Done Steps
-        # We check for steps with an ID lower than the current one
-        past_steps_list = [s for s in all_steps if s['id'] < current_step_id]
+        # We check for steps with an ID lower than the current one, unless told which ones finished
+        if completed_step_ids is None:
+            past_steps_list = [s for s in all_steps if s['id'] < current_step_id]
+        else:
+            past_steps_list = [s for s in all_steps if s['id'] in completed_step_ids]
         if past_steps_list:
             past_steps_str = "\n".join(
                 [f"- [x] Step {s['id']}: {s['title']}" for s in past_steps_list]
@@ -128,8 +163,11 @@ class PromptBuilder:
         step_description = self._format_step(step=current_step, step_count=step_count)
 
         # Format Future Steps
-        # We check for steps with an ID higher than the current one
-        future_steps_list = [s for s in all_steps if s['id'] > current_step_id]
+        # We check for steps with an ID higher than the current one (or, if given, every other unfinished one)
+        if completed_step_ids is None:
+            future_steps_list = [s for s in all_steps if s['id'] > current_step_id]
+        else:
+            future_steps_list = [s for s in all_steps if s['id'] != current_step_id and s['id'] not in completed_step_ids]
         if future_steps_list:
             # Including description here is useful so the coder knows where the architecture is heading
             future_steps_str = "\n".join(
@@ -138,7 +176,6 @@ class PromptBuilder:
         else:
             future_steps_str = "- None (This is the final step)"
 
-        prefetched_content = format_file_blobs(file_blobs)
         # ------------------------------------------------------------------
         # 3. Pull project context
         # ------------------------------------------------------------------
@@ -148,11 +185,22 @@ class PromptBuilder:
             dependencies_str,
             dev_dependencies_str,
         ) = self._get_project_context()
+        file_blobs = list(file_blobs) + self._relevant_file_blobs(
+            f"{current_step.get('title', '')}\n{current_step.get('description', '')}",
+            relevant_files_top_k,
+            exclude=[blob.get("path") for blob in file_blobs]
+        )
+        context = self._fit_context(tree=project_tree_str, graph=dependency_graph_str, dependencies=dependencies_str,
+                                    dev_dependencies=dev_dependencies_str, file_blobs=file_blobs)
+        project_tree_str, dependency_graph_str = context["tree"], context["graph"]
+        dependencies_str, dev_dependencies_str = context["dependencies"], context["dev_dependencies"]
+        prefetched_content = context["files"]
 
         # ------------------------------------------------------------------
         # 4. Assemble final prompt
         # ------------------------------------------------------------------
 
+        # Ordered from least to most volatile (fixed rules, then the project state), see prompt_prefix_messages
         enhanced_prompt = f"""
 # Project context & constraints
 
@@ -162,16 +210,6 @@ class PromptBuilder:
 * Prefer semantic HTML, accessible keyboard order, responsive Tailwind utilities.
 * Use clean file paths under `src/` (e.g., `src/pages/*`, `src/components/*`, `src/data/*`).
 
-## File Tree
-{project_tree_str}
-
-## Dependency Graph
-{dependency_graph_str}
-
-## Repo inbstalled dependencies:
-* Dependencies: {dependencies_str}
-* Dev Dependencies: {dev_dependencies_str}
-
 ## Coding Guidelines:
 * You do not need to import React when using JSX, as long as your build setup supports the new JSX transform.
 Import hooks directly when needed: `import {{useState}} from 'react';`
@@ -184,6 +222,16 @@ Import hooks directly when needed: `import {{useState}} from 'react';`
   * Use Heroicons v2: use imports from '@heroicons/react/24/solid'; Example: import {{Bars3Icon, XMarkIcon}} from '@heroicons/react/24/solid';
   * Github, Twitter and Linkedin Icons are imported from 'lucide-react';
 
+## File Tree
+{project_tree_str}
+
+## Dependency Graph
+{dependency_graph_str}
+
+## Repo inbstalled dependencies:
+* Dependencies: {dependencies_str}
+* Dev Dependencies: {dev_dependencies_str}
+
 {guidelines}
     """
         
@@ -215,6 +263,11 @@ IMPORTANT: If you need the contents of a file that is not listed in these files,
         """
         # --- 1. Gather All Contexts Gracefully ---
         project_tree_str, dependency_graph_str, dependencies_str, dev_dependencies_str = self._get_project_context()
+        context = self._fit_context(tree=project_tree_str, graph=dependency_graph_str, dependencies=dependencies_str,
+                                    dev_dependencies=dev_dependencies_str, history=change_history if change_history != "(none)" else None)
+        project_tree_str, dependency_graph_str = context["tree"], context["graph"]
+        dependencies_str, dev_dependencies_str = context["dependencies"], context["dev_dependencies"]
+        change_history = context.get("history", change_history)
 
         previous_implementations = ""
 
@@ -310,8 +363,12 @@ Your previous implementation was subject to review and was rejected. Feedback:
         history_lines = format_history_lines(change_history)
         applied_str = "\n  - " + "\n  - ".join(sorted(set(applied_paths))) if applied_paths else " (none)"
         scope_paths_str = "\n  - " + "\n  - ".join(sorted(set(tsc_error_files))) if tsc_error_files else " (none)"
-        files_text = format_file_blobs(file_blobs)
         project_tree_str, dependency_graph_str, _, _ = self._get_project_context()
+        # The files in scope go first, so they are the last to lose their content
+        scope = set(tsc_error_files or [])
+        file_blobs = sorted(file_blobs, key=lambda blob: blob.get("path") not in scope)
+        context = self._fit_context(tree=project_tree_str, file_blobs=file_blobs)
+        project_tree_str, files_text = context["tree"], context["files"]
 
         return (
             f"REPAIR MODE: BUILD (TypeScript compile errors)\n\n"
@@ -342,17 +399,24 @@ Your previous implementation was subject to review and was rejected. Feedback:
         txn_id: str,
         applied_paths: List[str],
         failed_paths: List[str],
-        errors: Any
+        errors: Any,
+        skipped_paths: Optional[List[str]] = None
     ) -> str:
         """
         Build a *single* user message that:
           - Explains what happened
           - Restricts SCOPE to the failed files
-          - Provides current file content for those files
+          - Lists the valid changes that were skipped because the batch failed
           - Requires one valid JSON tool call
         """
         applied_str = "\n  - " + "\n  - ".join(sorted(set(applied_paths))) if applied_paths else " (none)"
         failed_str = "\n  - " + "\n  - ".join(sorted(set(failed_paths))) if failed_paths else " (none)"
+        skipped = sorted(set(skipped_paths or []) - set(failed_paths))
+        skipped_str = "\n  - " + "\n  - ".join(skipped) if skipped else " (none)"
+        resubmit_rule = (
+            "\n7. Nothing from the previous call was written. Resubmit the skipped changes unchanged, together with the fixed ones, in the same call."
+            if skipped else ""
+        )
         scope_paths_str = "\n  - " + "\n  - ".join(sorted(set(failed_paths))) if failed_paths else ""
 
         return (
@@ -362,6 +426,7 @@ ERROR NOTICE: The previous write_to_files request failed validation.
 WHAT HAPPENED:
 - Applied (in prior attempt):{applied_str}
 - Failed validation / not applied:{failed_str}
+- Skipped (valid, but not written because the call failed; resubmit them):{skipped_str}
 Validator message:
 {stringify_errors(errors)}
 Please regenerate exactly ONE JSON `write_to_files` tool call (no extra text). Follow these rules precisely:
@@ -377,7 +442,7 @@ Please regenerate exactly ONE JSON `write_to_files` tool call (no extra text). F
 3. Only modify the target lines — keep the surrounding code exactly as in the fetched file within the SEARCH block so the validator can match it.
 4. Do not include extra `>>>>>>> REPLACE` lines or duplicate markers. Use exactly one `<<<<<<< SEARCH`, one `=======`, and one `>>>>>>> REPLACE` per `differences` string.
 5. Return exactly one valid JSON tool call object using the schema the system expects and nothing else. The `changes` array should be an array of `modify` entries with `path` and `differences` strings as above.
-6. If SEARCH block is not found in original content. It is most probably you modified a file without getting it's latest contents. You MUST fetch the contents of these files using the `fetch_files` tool before remodifiyng them.
+6. If SEARCH block is not found in original content. It is most probably you modified a file without getting it's latest contents. You MUST fetch the contents of these files using the `fetch_files` tool before remodifiyng them.{resubmit_rule}
 
             """
         )
@@ -434,8 +499,8 @@ Before approving, answer internally:
 You must respond with a single valid JSON object.
 """
     
-    def build_review_prompt(self, step_details: dict, plan: dict) -> str:
-        """Build the review prompt for the planner."""
+    def build_review_prompt(self, step_details: dict, plan: dict, completed_step_ids: Optional[Set[Any]] = None) -> str:
+        """Build the review prompt for the planner. completed_step_ids as in build_coder_prompt_for_step."""
     
         all_steps = plan.get('steps', [])
         current_step_id = step_details.get('id')
@@ -444,8 +509,11 @@ You must respond with a single valid JSON object.
         # ------------------------------------------------------------------
         
         # Format Previously Done Steps
-        # We check for steps with an ID lower than the current one
-        past_steps_list = [s for s in all_steps if s['id'] < current_step_id]
+        # We check for steps with an ID lower than the current one, unless told which ones finished
+        if completed_step_ids is None:
+            past_steps_list = [s for s in all_steps if s['id'] < current_step_id]
+        else:
+            past_steps_list = [s for s in all_steps if s['id'] in completed_step_ids]
         if past_steps_list:
             past_steps_str = "\n".join(
                 [f"- [x] Step {s['id']}: {s['title']}" for s in past_steps_list]
@@ -454,8 +522,11 @@ You must respond with a single valid JSON object.
             past_steps_str = "- None (This is the first step)"
 
         # Format Future Steps
-        # We check for steps with an ID higher than the current one
-        future_steps_list = [s for s in all_steps if s['id'] > current_step_id]
+        # We check for steps with an ID higher than the current one (or, if given, every other unfinished one)
+        if completed_step_ids is None:
+            future_steps_list = [s for s in all_steps if s['id'] > current_step_id]
+        else:
+            future_steps_list = [s for s in all_steps if s['id'] != current_step_id and s['id'] not in completed_step_ids]
         if future_steps_list:
             # Including description here is useful so the coder knows where the architecture is heading
             future_steps_str = "\n".join(
@@ -616,18 +687,82 @@ If REJECTING, respond exactly with:
                 dev_deps = deps_result["result"].get("devDependencies", {})
                 dependencies_str = ", ".join(deps.keys()) if deps else "None"
                 dev_dependencies_str = ", ".join(dev_deps.keys()) if dev_deps else "None"
-
-            return project_tree_str, dependency_graph_str, dependencies_str, dev_dependencies_str
         except Exception:
             pass # Ignore errors, the default value will be used
 
-    def build_single_agent_prompt(self, base_prompt: str, change_history: str) -> str:
+        return project_tree_str, dependency_graph_str, dependencies_str, dev_dependencies_str
+
+    def _relevant_file_blobs(self, query: str, top_k: int, exclude: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """Current contents of the top_k files ProjectAnalyzerService ranks most relevant to `query`."""
+        if top_k <= 0 or not query:
+            return []
+        excluded = {os.path.normpath(path) for path in exclude or [] if path}
+        ranked = self.analyzer.rank_relevant_files(query, top_k=top_k + len(excluded))
+        if ranked.get("result", {}).get("status") != "success":
+            logger.warning(f"Could not rank relevant files: {ranked.get('result', {}).get('error')}")
+            return []
+
+        blobs: List[Dict[str, str]] = []
+        for item in ranked["result"]["files"]:
+            if os.path.normpath(item["path"]) in excluded or len(blobs) >= top_k:
+                continue
+            try:
+                with open(os.path.join(self.project_root, item["path"]), "r", encoding="utf-8") as f:
+                    content = f.read()
+            except OSError as e:
+                logger.warning(f"Could not read relevant file {item['path']}: {e}")
+                continue
+            blobs.append({"path": item["path"], "sha256": hashlib.sha256(content.encode("utf-8")).hexdigest(), "content": content})
+        logger.info(f"Pre-attaching {len(blobs)} relevant file(s): {[blob['path'] for blob in blobs]}")
+        return blobs
+
+    def _fit_context(self, tree: Optional[str] = None, graph: Optional[str] = None, dependencies: Optional[str] = None,
+                     dev_dependencies: Optional[str] = None, history: Optional[str] = None,
+                     file_blobs: Optional[List[Dict[str, str]]] = None) -> Dict[str, str]:
+        """
+        Fits the given context sections into CONTEXT_TOKEN_BUDGET (see context_budget).
+        Returns the text per given section; "files" is the formatted file_blobs.
+        """
+        fits = {
+            "tree": lambda n: fold_tree(tree, n),
+            "graph": lambda n: summarize_graph(graph, n, focus=[b.get("path", "") for b in file_blobs or []]),
+            "dependencies": lambda n: truncate_text(dependencies, n),
+            "dev_dependencies": lambda n: truncate_text(dev_dependencies, n),
+            "history": lambda n: truncate_text(history, n, keep="tail"),
+            "files": lambda n: fit_file_blobs(file_blobs, n, format_file_blobs),
+        }
+        texts = {"tree": tree, "graph": graph, "dependencies": dependencies, "dev_dependencies": dev_dependencies,
+                 "history": history, "files": format_file_blobs(file_blobs) if file_blobs is not None else None}
+        sections = [
+            ContextSection(name, text, *CONTEXT_SECTIONS[name], fits[name])
+            for name, text in texts.items() if text is not None
+        ]
+        return assemble_context(sections)
+
+    def build_single_agent_prompt(self, base_prompt: str, change_history: str, relevant_files_top_k: int = RELEVANT_FILES_TOP_K) -> str:
         """
         Enhances the user's base prompt with a multi-faceted view of the project,
         including file structure, dependencies, and inter-file connections.
+        With relevant_files_top_k, the files most relevant to the request are attached.
         """
         # --- 1. Gather All Contexts Gracefully ---
         project_tree_str, dependency_graph_str, dependencies_str, dev_dependencies_str = self._get_project_context()
+        relevant_blobs = self._relevant_file_blobs(base_prompt, relevant_files_top_k)
+        context = self._fit_context(tree=project_tree_str, graph=dependency_graph_str, dependencies=dependencies_str,
+                                    dev_dependencies=dev_dependencies_str, history=change_history if change_history != "(none)" else None,
+                                    file_blobs=relevant_blobs or None)
+        project_tree_str, dependency_graph_str = context["tree"], context["graph"]
+        dependencies_str, dev_dependencies_str = context["dependencies"], context["dev_dependencies"]
+        change_history = context.get("history", change_history)
+
+        prefetched_files = ""
+        fetch_instruction = "then call `fetch_files` to obtain those files. (You must only fetch files you listed.)"
+        if relevant_blobs:
+            prefetched_files = f"""
+            ### 5. Pre-fetched files (most relevant to the request, current contents):
+{context["files"]}
+"""
+            fetch_instruction = "then call `fetch_files` to obtain the listed files that are not pre-fetched above. (You must only fetch files you listed.) If every file you need is pre-fetched, skip this step."
 
         previous_implementations = ""
 
@@ -653,13 +788,13 @@ If REJECTING, respond exactly with:
         * Dev Dependencies: {dev_dependencies_str}
 
         {previous_implementations}
-        
+        {prefetched_files}
         ## TASK: What you must produce
         "{base_prompt}"
 
         1. **Plan** — first, list the *minimal* set of files you will read to implement this change, and why each is needed. In your plan include how you will implement each feature/component,
         every component must be fully functional and accessible. If the request mentioned page creations, pages must be filled with content and not have any placeholder content.
-        2. **Fetch** — then call `fetch_files` to obtain those files. (You must only fetch files you listed.)
+        2. **Fetch** — {fetch_instruction}
         3. Fully implement the user's request in a visually stunning and production ready applciation in a single ``write_to_files`` tool call that includes all file operations.
 """
         
@@ -0,0 +1,182 @@
+"""
+Relevance index for POKIO system.
+Incremental BM25 index over project source files, used to pick the files most
+likely needed for a request before the model asks for them.
+
+A file is indexed by the words of its path, its exported names, the text of its
+JSX and its identifiers (camelCase/PascalCase split into words), weighted in that
+order. Query words that do not occur in any file are matched to indexed words by
+character trigram similarity, so "buttons" still finds "Button.tsx".
+"""
+import hashlib
+import heapq
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Term frequency weight per field of a file
+FIELD_WEIGHTS = {"path": 3.0, "exports": 3.0, "jsx": 2.0, "identifiers": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Minimum trigram Jaccard similarity for a query word to match an indexed word
+TRIGRAM_SIMILARITY = 0.5
+
+_WORD_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9]*")
+_CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_JSX_TEXT_PATTERN = re.compile(r">([^<>{}]*[A-Za-z][^<>{}]*)<")
+
+# Words of requests that say nothing about which files are meant
+QUERY_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "create", "for", "from", "have", "i", "in",
+    "into", "is", "it", "make", "me", "my", "of", "on", "or", "please", "should", "so", "that", "the",
+    "their", "there", "this", "to", "use", "want", "we", "when", "which", "with", "you", "your",
+}
+
+
+def split_words(text: str) -> List[str]:
+    """Lower-case words of `text`; compound identifiers yield their parts and the whole ("navbar", "nav", "bar")."""
+    words = []
+    for identifier in _WORD_PATTERN.findall(text):
+        parts = _CAMEL_PATTERN.findall(identifier)
+        words.extend(part.lower() for part in parts if len(part) > 1)
+        if len(parts) > 1:
+            words.append(identifier.lower())
+    return words
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RelevanceIndex:
+    """BM25 over weighted file fields, updated one file at a time."""
+
+    def __init__(self):
+        self._docs: Dict[str, Dict[str, float]] = {}
+        self._lengths: Dict[str, float] = {}
+        self._signatures: Dict[str, str] = {}
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._trigram_terms: Dict[str, Set[str]] = defaultdict(set)
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def paths(self) -> Set[str]:
+        return set(self._docs)
+
+    def signature(self, rel_path: str) -> Optional[str]:
+        """sha256 of the content `rel_path` was indexed with, None if not indexed."""
+        return self._signatures.get(rel_path)
+
+    def update(self, rel_path: str, content: str, exports: Iterable[str] = (), signature: Optional[str] = None) -> None:
+        """(Re-)indexes one file. `signature` defaults to the sha256 of `content`."""
+        self.remove(rel_path)
+        fields = {
+            "path": split_words(rel_path),
+            # 'default' and re-exports ('* from ./x') are not names
+            "exports": split_words(" ".join(e for e in exports if e != "default" and not e.startswith("*"))),
+            "jsx": split_words(" ".join(_JSX_TEXT_PATTERN.findall(content))),
+            "identifiers": split_words(content),
+        }
+        weights: Dict[str, float] = Counter()
+        for field, words in fields.items():
+            for word in words:
+                weights[word] += FIELD_WEIGHTS[field]
+
+        self._docs[rel_path] = dict(weights)
+        self._lengths[rel_path] = sum(weights.values())
+        self._total_length += self._lengths[rel_path]
+        self._signatures[rel_path] = signature or hashlib.sha256(content.encode("utf-8")).hexdigest()
+        for term in weights:
+            if not self._postings[term]:
+                for trigram in trigrams(term):
+                    self._trigram_terms[trigram].add(term)
+            self._postings[term].add(rel_path)
+
+    def remove(self, rel_path: str) -> None:
+        weights = self._docs.pop(rel_path, None)
+        if weights is None:
+            return
+        self._total_length -= self._lengths.pop(rel_path)
+        del self._signatures[rel_path]
+        for term in weights:
+            postings = self._postings[term]
+            postings.discard(rel_path)
+            if not postings:
+                del self._postings[term]
+                for trigram in trigrams(term):
+                    self._trigram_terms[trigram].discard(term)
+
+    def _similar_terms(self, word: str) -> List[Tuple[str, float]]:
+        word_trigrams = trigrams(word)
+        shared: Dict[str, int] = Counter()
+        for trigram in word_trigrams:
+            for term in self._trigram_terms.get(trigram, ()):
+                shared[term] += 1
+        similar = []
+        for term, count in shared.items():
+            similarity = count / (len(word_trigrams) + len(trigrams(term)) - count)
+            if similarity >= TRIGRAM_SIMILARITY:
+                similar.append((term, similarity))
+        return similar
+
+    def query_terms(self, query: str) -> Dict[str, float]:
+        """Indexed terms for the words of `query`, with their weight (1 for exact, similarity for fuzzy)."""
+        terms: Dict[str, float] = {}
+        for word in set(split_words(query)) - QUERY_STOPWORDS:
+            if word in self._postings:
+                terms[word] = 1.0
+            elif len(word) >= 4:
+                for term, similarity in self._similar_terms(word):
+                    terms[term] = max(terms.get(term, 0.0), similarity)
+        return terms
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """The top_k (path, score) pairs for `query`, best first; files sharing no term are not returned."""
+        if not self._docs:
+            return []
+        doc_count = len(self._docs)
+        average_length = self._total_length / doc_count or 1.0
+        scores: Dict[str, float] = defaultdict(float)
+        for term, query_weight in self.query_terms(query).items():
+            postings = self._postings[term]
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for rel_path in postings:
+                tf = self._docs[rel_path][term]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[rel_path] / average_length)
+                scores[rel_path] += query_weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+if __name__ == "__main__":
+    import glob
+    import os
+    import time
+
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs", "logs")
+    src_dirs = sorted(glob.glob(os.path.join(log_dir, "*", "*_logs", "src")))
+    src_dir = max(src_dirs, key=lambda d: len(glob.glob(os.path.join(d, "**", "*.tsx"), recursive=True)))
+
+    index = RelevanceIndex()
+    start = time.perf_counter()
+    for path in glob.glob(os.path.join(src_dir, "**", "*.ts*"), recursive=True):
+        if not path.endswith((".ts", ".tsx")):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            index.update(os.path.relpath(path, os.path.dirname(src_dir)).replace(os.sep, "/"), f.read())
+    print(f"Indexed {len(index)} files of {os.path.relpath(src_dir, log_dir)} in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    for query in ("Add a contact form to the footer", "Make the navigation menu responsive on mobile",
+                  "Show the product cards in a grid", "Fix the dark mode toggle in the header"):
+        start = time.perf_counter()
+        ranked = index.search(query, top_k=3)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{query!r} ({elapsed:.2f}ms): {', '.join(f'{path} ({score:.1f})' for path, score in ranked) or '-'}")
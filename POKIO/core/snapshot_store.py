@@ -0,0 +1,276 @@
+"""
+Snapshot store for POKIO system.
+Content-addressed copies of a directory tree (the React app's src folder).
+Every distinct file content is stored once as a blob named by its sha256; a
+snapshot is a small manifest mapping relative paths to blob hashes. Taking a
+snapshot therefore only writes the files that changed since any earlier one,
+and checking one out hardlinks the blobs instead of copying them.
+
+Layout under the store root:
+    objects/ab/cdef...   blob with sha256 "abcdef..." (read-only)
+    manifests/<name>.json
+"""
+import difflib
+import hashlib
+import logging
+import os
+import shutil
+import stat
+import threading
+import uuid
+from collections import namedtuple
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Union
+
+import json_codec
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Directories a snapshot never contains
+SNAPSHOT_IGNORED_DIRS = {'.git', 'node_modules', '__pycache__'}
+
+# relative posix path -> sha256 of the file content
+Manifest = Dict[str, str]
+
+HashEntry = namedtuple('HashEntry', ['mtime_ns', 'size', 'sha256'])
+SnapshotDiff = namedtuple('SnapshotDiff', ['added', 'removed', 'modified'])
+
+_hashes: Dict[str, HashEntry] = {}
+_hashes_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    """sha256 of a file; cached by (mtime_ns, size), so unchanged files are not read again."""
+    file_stat = os.stat(path)
+    with _hashes_lock:
+        cached = _hashes.get(path)
+    if cached and cached.mtime_ns == file_stat.st_mtime_ns and cached.size == file_stat.st_size:
+        return cached.sha256
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    with _hashes_lock:
+        _hashes[path] = HashEntry(file_stat.st_mtime_ns, file_stat.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def scan_directory(root: Union[str, Path]) -> Manifest:
+    """Manifest of the files under `root` as they are on disk."""
+    root = os.path.abspath(root)
+    manifest: Manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SNAPSHOT_IGNORED_DIRS]
+        prefix = os.path.relpath(dirpath, root).replace(os.sep, "/") + "/" if dirpath != root else ""
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                manifest[prefix + name] = file_sha256(path)
+            except OSError as e:
+                logger.warning(f"Skipping unreadable file '{path}': {e}")
+    return manifest
+
+
+def mirror_directory(src: Union[str, Path], dest: Union[str, Path]) -> Dict[str, int]:
+    """
+    Makes `dest` an exact copy of `src`, copying only the files whose content differs
+    and deleting the ones `src` does not have. Returns {"written": n, "removed": n}.
+    """
+    if not os.path.isdir(src):
+        raise FileNotFoundError(f"Source directory '{src}' does not exist.")
+    return _sync_directory(scan_directory(src), dest, lambda rel_path, _: os.path.join(src, rel_path), link=False)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except PermissionError:
+        # Read-only hardlinks to blobs (Windows refuses to delete those)
+        os.chmod(path, stat.S_IWRITE)
+        os.unlink(path)
+
+
+def _sync_directory(wanted: Manifest, dest: Union[str, Path], source_of: Callable[[str, str], str], link: bool) -> Dict[str, int]:
+    dest = str(dest)
+    current = scan_directory(dest) if os.path.isdir(dest) else {}
+    removed = 0
+    for rel_path in current.keys() - wanted.keys():
+        _remove_file(os.path.join(dest, rel_path))
+        removed += 1
+
+    written = 0
+    for rel_path, sha256 in wanted.items():
+        if current.get(rel_path) == sha256:
+            continue
+        source = source_of(rel_path, sha256)
+        target = os.path.join(dest, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if rel_path in current:
+            _remove_file(target)
+        if link:
+            try:
+                os.link(source, target)
+            except OSError:
+                # Other filesystem or no hardlink support: fall back to a writable copy
+                shutil.copyfile(source, target)
+        else:
+            shutil.copy2(source, target)
+        written += 1
+
+    # Directories left empty by removed files
+    for dirpath, dirnames, filenames in os.walk(dest, topdown=False):
+        if dirpath != dest and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return {"written": written, "removed": removed}
+
+
+class SnapshotStore:
+    """Content-addressed store of directory snapshots, see the module docstring."""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.manifests_dir = self.root / "manifests"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        # Hashes of blobs known to be stored, so unchanged files cost no disk access
+        self._stored = set()
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256[2:])
+
+    def has_blob(self, sha256: str) -> bool:
+        if sha256 in self._stored:
+            return True
+        if os.path.exists(self.blob_path(sha256)):
+            self._stored.add(sha256)
+            return True
+        return False
+
+    def snapshot(self, src: Union[str, Path], name: Optional[str] = None) -> Manifest:
+        """
+        Stores the files under `src` that are not in the store yet and saves a
+        manifest called `name` (next "snapshot-NNNN" by default). Returns the manifest.
+        """
+        if not os.path.isdir(src):
+            raise FileNotFoundError(f"Source directory '{src}' does not exist.")
+        name = name or self.next_name()
+        manifest = scan_directory(src)
+
+        stored = 0
+        for rel_path, sha256 in manifest.items():
+            if self._store_blob(os.path.join(src, rel_path), sha256):
+                stored += 1
+
+        manifest_path = self.manifests_dir / f"{name}.json"
+        temp_path = manifest_path.with_name(f".{manifest_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(json_codec.dumps(dict(sorted(manifest.items())), indent=2, ensure_ascii=False))
+        os.replace(temp_path, manifest_path)
+        logger.info(f"Snapshot '{name}': {len(manifest)} file(s), {stored} new blob(s).")
+        return manifest
+
+    def _store_blob(self, path: str, sha256: str) -> bool:
+        if self.has_blob(sha256):
+            return False
+        blob = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        temp_path = f"{blob}.{uuid.uuid4().hex[:8]}.tmp"
+        shutil.copyfile(path, temp_path)
+        # Blobs are shared by every snapshot and hardlinked checkout; editing one in place would corrupt them all
+        os.chmod(temp_path, stat.S_IREAD)
+        os.replace(temp_path, blob)
+        self._stored.add(sha256)
+        return True
+
+    def load(self, name: str) -> Manifest:
+        with open(self.manifests_dir / f"{name}.json", "r", encoding="utf-8") as f:
+            return json_codec.loads(f.read())
+
+    def list_snapshots(self) -> List[str]:
+        """Snapshot names, oldest first."""
+        manifests = sorted(self.manifests_dir.glob("*.json"), key=lambda p: (p.stat().st_mtime_ns, p.name))
+        return [p.stem for p in manifests]
+
+    def next_name(self) -> str:
+        return f"snapshot-{len(self.list_snapshots()) + 1:04d}"
+
+    def checkout(self, snapshot: Union[str, Manifest], dest: Union[str, Path], link: bool = True) -> Dict[str, int]:
+        """
+        Makes `dest` match a snapshot (name or manifest). Only files that differ are
+        touched. With `link`, files are read-only hardlinks to the blobs, so do not
+        check out into a directory that is edited afterwards; use link=False there.
+        Returns {"written": n, "removed": n}.
+        """
+        manifest = self.load(snapshot) if isinstance(snapshot, str) else snapshot
+        missing = [rel_path for rel_path, sha256 in manifest.items() if not self.has_blob(sha256)]
+        if missing:
+            raise FileNotFoundError(f"Snapshot blobs missing for: {', '.join(sorted(missing)[:5])}")
+        return _sync_directory(manifest, dest, lambda rel_path, sha256: self.blob_path(sha256), link)
+
+    def diff(self, old: Union[str, Manifest], new: Union[str, Manifest]) -> SnapshotDiff:
+        """Paths added, removed and modified between two snapshots (names or manifests)."""
+        old = self.load(old) if isinstance(old, str) else old
+        new = self.load(new) if isinstance(new, str) else new
+        return SnapshotDiff(
+            added=sorted(new.keys() - old.keys()),
+            removed=sorted(old.keys() - new.keys()),
+            modified=sorted(p for p in old.keys() & new.keys() if old[p] != new[p]),
+        )
+
+    def unified_diff(self, old: Union[str, Manifest], new: Union[str, Manifest]) -> str:
+        """Unified text diff of every file that differs between two snapshots."""
+        old_manifest = self.load(old) if isinstance(old, str) else old
+        new_manifest = self.load(new) if isinstance(new, str) else new
+        changes = self.diff(old_manifest, new_manifest)
+        parts = []
+        for rel_path in sorted(changes.added + changes.removed + changes.modified):
+            before = self._read_blob(old_manifest.get(rel_path))
+            after = self._read_blob(new_manifest.get(rel_path))
+            parts.extend(difflib.unified_diff(before, after, fromfile=f"a/{rel_path}", tofile=f"b/{rel_path}"))
+        return "".join(parts)
+
+    def _read_blob(self, sha256: Optional[str]) -> List[str]:
+        if sha256 is None:
+            return []
+        with open(self.blob_path(sha256), "r", encoding="utf-8", errors="replace") as f:
+            return f.readlines()
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "src"
+        for i in range(400):
+            path = src / f"components/group{i % 20}/Component{i}.tsx"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f"export const Component{i} = () => <div>{i}</div>;\n" * 60, encoding="utf-8")
+
+        store = SnapshotStore(Path(tmp) / "snapshots")
+        copy_times, snapshot_times = [], []
+        for request in range(10):
+            for i in range(3):
+                (src / f"components/group{i}/Component{i}.tsx").write_text(f"// request {request}\n", encoding="utf-8")
+
+            start = time.perf_counter()
+            dest = Path(tmp) / "copy"
+            if dest.exists():
+                shutil.rmtree(dest)
+            shutil.copytree(src, dest)
+            copy_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            store.checkout(store.snapshot(src), Path(tmp) / "checkout")
+            snapshot_times.append(time.perf_counter() - start)
+
+        first, last = store.list_snapshots()[0], store.list_snapshots()[-1]
+        assert scan_directory(Path(tmp) / "checkout") == scan_directory(src)
+        print(f"rmtree+copytree: {sum(copy_times) / len(copy_times) * 1000:.1f}ms per request")
+        print(f"snapshot+checkout: first {snapshot_times[0] * 1000:.1f}ms, then {sum(snapshot_times[1:]) / 9 * 1000:.1f}ms per request")
+        print(f"{first} -> {last}: {store.diff(first, last)}")
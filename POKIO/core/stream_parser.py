@@ -0,0 +1,169 @@
+"""
+Streaming tool-call detection for POKIO system.
+Scans a model response chunk by chunk and reports the parts of a tool call that
+are already complete, so file reads (fetch_files) and per-change validation
+(write_to_files) can start while the model is still generating.
+
+Everything reported here is speculative: the final response still goes through
+VerificationService, and consumers must treat callbacks as hints only.
+"""
+import json
+import logging
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Same root-key convention as VerificationService._find_json_blob
+_TOOL_CALL_START = re.compile(r'\{\s*"tool_name"\s*:')
+# How far back a partial `{ "tool_name"` may start when it is split across chunks
+_START_LOOKBEHIND = 64
+
+
+class StreamingToolCallDetector:
+    """
+    Incremental JSON scanner for the first `{"tool_name": ...}` object in a stream.
+
+    Calls `on_fetch_paths(paths)` as soon as a fetch_files `filePaths` array closes
+    and `on_change(change)` for every element of a write_to_files `changes` array
+    as soon as that element closes.
+    """
+
+    def __init__(self,
+                 on_fetch_paths: Optional[Callable[[List[str]], None]] = None,
+                 on_change: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_fetch_paths = on_fetch_paths
+        self.on_change = on_change
+
+        self.buffer = ""
+        self.tool_name: Optional[str] = None
+        self.done = False
+
+        self._search_from = 0
+        self._pos = -1                          # next index to scan, -1 until the tool call starts
+        self._stack: List[Dict[str, Any]] = []  # open containers
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+
+    def feed(self, chunk: str) -> None:
+        if self.done or not chunk:
+            return
+        self.buffer += chunk
+
+        if self._pos < 0:
+            match = _TOOL_CALL_START.search(self.buffer, self._search_from)
+            if not match:
+                self._search_from = max(self._search_from, len(self.buffer) - _START_LOOKBEHIND)
+                return
+            self._pos = match.start()
+
+        self._scan()
+
+    def _scan(self) -> None:
+        buffer = self.buffer
+        i = self._pos
+        end = len(buffer)
+
+        while i < end:
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._on_string(self._string_start, i)
+            elif c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == '{' or c == '[':
+                self._open(c, i)
+            elif c == '}' or c == ']':
+                if self._close(i):
+                    self.done = True
+                    i += 1
+                    break
+            elif c == ',' and self._stack and self._stack[-1]["kind"] == '{':
+                self._stack[-1]["expect_key"] = True
+            elif c == ':' and self._stack:
+                self._stack[-1]["expect_key"] = False
+            i += 1
+
+        self._pos = i
+
+    def _on_string(self, start: int, end: int) -> None:
+        if not self._stack:
+            return
+        top = self._stack[-1]
+        if top["kind"] != '{':
+            return
+        try:
+            value = json.loads(self.buffer[start:end + 1])
+        except ValueError:
+            return
+        if top["expect_key"]:
+            top["current_key"] = value
+        elif len(self._stack) == 1 and top["current_key"] == "tool_name":
+            self.tool_name = value
+
+    def _open(self, kind: str, index: int) -> None:
+        parent = self._stack[-1] if self._stack else None
+        key = parent["current_key"] if parent and parent["kind"] == '{' else None
+        self._stack.append({"kind": kind, "start": index, "key": key, "expect_key": kind == '{', "current_key": None})
+
+    def _close(self, index: int) -> bool:
+        """Pops the innermost container; returns True when the tool call object itself closed."""
+        if not self._stack:
+            return True
+        frame = self._stack.pop()
+        parent = self._stack[-1] if self._stack else None
+
+        if frame["kind"] == '[' and frame["key"] == "filePaths" and self.tool_name == "fetch_files":
+            paths = self._load(frame["start"], index)
+            if isinstance(paths, list) and self.on_fetch_paths:
+                self._notify(self.on_fetch_paths, [p for p in paths if isinstance(p, str)])
+        elif (frame["kind"] == '{' and parent and parent["kind"] == '[' and parent["key"] == "changes"
+              and self.tool_name == "write_to_files"):
+            change = self._load(frame["start"], index)
+            if isinstance(change, dict) and self.on_change:
+                self._notify(self.on_change, change)
+
+        return not self._stack
+
+    def _load(self, start: int, end: int) -> Any:
+        try:
+            return json.loads(self.buffer[start:end + 1])
+        except ValueError:
+            # Malformed JSON is reported by VerificationService on the full response
+            return None
+
+    @staticmethod
+    def _notify(callback: Callable, value: Any) -> None:
+        try:
+            callback(value)
+        except Exception as e:
+            logger.warning(f"Streaming tool-call callback failed: {e}")
+
+
+if __name__ == "__main__":
+    import time
+
+    response = (
+        "I will fetch the files first.\n```json\n"
+        '{"tool_name": "write_to_files", "parameters": {"title": "t", "changes": ['
+        + ",".join(f'{{"type": "modify", "path": "src/File{i}.tsx", "differences": ["<<<<<<< SEARCH\\\\n}}\\\\n=======\\\\n]\\\\n>>>>>>> REPLACE"]}}' for i in range(50))
+        + "]}}\n```"
+    )
+    chunks = [response[i:i + 40] for i in range(0, len(response), 40)]
+
+    seen = []
+    detector = StreamingToolCallDetector(on_change=lambda change: seen.append(change["path"]))
+    start = time.perf_counter()
+    for chunk in chunks:
+        detector.feed(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"{len(chunks)} chunks, {len(seen)} changes detected, done={detector.done} in {elapsed * 1000:.2f}ms")
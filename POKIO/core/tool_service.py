@@ -4,9 +4,12 @@ Handles execution of tools including file fetching and file operations.
 """
 import os
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from file_operations_service import FileOperationsService
+from stream_parser import StreamingToolCallDetector
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -15,6 +18,8 @@ logger = logging.getLogger(__name__)
 COLOR_GREEN = '\033[92m'
 COLOR_RESET = '\033[0m'
 
+MAX_PENDING_PREFETCHES = 8
+
 class ToolService:
     """Service to execute POKIO tools and provide results."""
     
@@ -30,6 +35,49 @@ class ToolService:
         self.file_operations_service = file_operations_service
         if not self.file_operations_service:
             raise ValueError("ToolService requires an instance of FileOperationsService.")
+
+        # Work started while a response is still streaming (see stream_detector)
+        self._speculative_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tool-prefetch")
+        self._prefetched: Dict[Tuple[str, ...], Future] = {}
+        self._prefetch_lock = threading.Lock()
+
+    def stream_detector(self) -> StreamingToolCallDetector:
+        """
+        Returns a detector to feed with response chunks. It prefetches the files of a
+        fetch_files call and pre-validates write_to_files changes before the response ends.
+        """
+        return StreamingToolCallDetector(on_fetch_paths=self.prefetch_files, on_change=self.prevalidate_change)
+
+    def prefetch_files(self, file_paths: List[str]) -> None:
+        """Starts reading `file_paths` in the background; _fetch_files picks the result up."""
+        if not file_paths:
+            return
+        key = tuple(file_paths)
+        with self._prefetch_lock:
+            if key not in self._prefetched:
+                logger.info(f"Prefetching {len(file_paths)} file(s) while the response streams.")
+                self._prefetched[key] = self._speculative_executor.submit(self._read_files_with_stats, file_paths)
+                # Prefetches the final response did not ask for are never picked up; keep only the latest few
+                while len(self._prefetched) > MAX_PENDING_PREFETCHES:
+                    self._prefetched.pop(next(iter(self._prefetched))).cancel()
+
+    def prevalidate_change(self, change: Dict[str, Any]) -> None:
+        """Runs the SEARCH/REPLACE matching of one change in the background."""
+        self._speculative_executor.submit(self.file_operations_service.prevalidate_change, change)
+
+    def _file_stats(self, file_paths: List[str]) -> List[Optional[Tuple[int, int]]]:
+        stats = []
+        for file_path in file_paths:
+            try:
+                stat = os.stat(os.path.join(self.project_root, file_path))
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append(None)
+        return stats
+
+    def _read_files_with_stats(self, file_paths: List[str]) -> Tuple[List[Optional[Tuple[int, int]]], Dict[str, Any]]:
+        stats = self._file_stats(file_paths)
+        return stats, self._read_files(file_paths)
     
     def to_string(self, data: Dict[str, Any]) -> str:
         """
@@ -125,12 +173,13 @@ class ToolService:
         
         return "\n".join(lines)
         
-    def execute_tool(self, tool_data: Dict[str, Any]) -> Dict[str, Any]:
+    def execute_tool(self, tool_data: Dict[str, Any], owner: Optional[str] = None) -> Dict[str, Any]:
         """
         Execute the specified tool based on the tool_data.
         
         Args:
             tool_data: Dictionary containing tool name and parameters
+            owner: Who write_to_files changes belong to (see FileOperationsService.apply_changes)
             
         Returns:
             Dictionary with tool execution results
@@ -148,7 +197,7 @@ class ToolService:
             elif tool_name == "ask_followup_question":
                 return self._ask_followup_question(parameters.get("question"))
             elif tool_name == "write_to_files":
-                return self._write_to_files(parameters)
+                return self._write_to_files(parameters, owner)
             else:
                 return self._create_error_response("tool_execution", f"Unknown tool: {tool_name}")
                 
@@ -156,12 +205,13 @@ class ToolService:
             logger.exception(f"Error executing tool: {str(e)}")
             return self._create_error_response("tool_execution", f"Tool execution error: {str(e)}")
 
-    def _write_to_files(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    def _write_to_files(self, parameters: Dict[str, Any], owner: Optional[str] = None) -> Dict[str, Any]:
         """
         Use the FileOperationsService to apply the requested code changes.
         
         Args:
             parameters: The parameters for the completion, including the changes list.
+            owner: Who the changes belong to, e.g. the plan step.
             
         Returns:
             A dictionary with the tool name and the report from the file operations.
@@ -177,7 +227,7 @@ class ToolService:
         logger.info(f"Writing to files with {len(changes)} changes.")
         
         # The core logic is now delegated to the file operations service
-        report = self.file_operations_service.apply_changes(changes)
+        report = self.file_operations_service.apply_changes(changes, owner=owner)
         
         # Return the report in the standard tool result format
         return {
@@ -191,10 +241,39 @@ class ToolService:
         """
         if not file_paths:
             return self._create_error_response("fetch_files", "No file paths specified")
-        
+
+        with self._prefetch_lock:
+            prefetched = self._prefetched.pop(tuple(file_paths), None)
+        if prefetched is not None:
+            try:
+                stats, result = prefetched.result()
+                # Only valid if no file changed since it was read (pending changes are not on disk)
+                if stats == self._file_stats(file_paths) and not self.file_operations_service.has_pending_changes():
+                    return result
+            except Exception as e:
+                logger.warning(f"Prefetch failed, reading files again: {e}")
+
+        return self._read_files(file_paths)
+
+    def _read_files(self, file_paths: List[str]) -> Dict[str, Any]:
         results = []
         for file_path in file_paths:
             try:
+                pending = self.file_operations_service.pending_state(file_path)
+                if pending is not None:
+                    # Written by a write_to_files call that does not type-check yet
+                    if not pending.exists:
+                        results.append({"filePath": file_path, "status": "error", "error": "File not found"})
+                        continue
+                    results.append({
+                        "filePath": file_path, "content": pending.content, "status": "success",
+                        "metadata": {
+                            "fileSize": len(pending.content.encode("utf-8")), "encoding": "utf-8",
+                            "lastModified": datetime.now().isoformat()
+                        }
+                    })
+                    continue
+
                 full_path = os.path.join(self.project_root, file_path)
                 if not os.path.isfile(full_path):
                     results.append({"filePath": file_path, "status": "error", "error": "File not found"})
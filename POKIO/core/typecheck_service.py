@@ -0,0 +1,387 @@
+"""
+Type-check service for POKIO system.
+Keeps a warm, incremental TypeScript checker (TS_checker/checker.js) running per
+project instead of cold-starting `npx tsc -b --noEmit` after every apply.
+A daemon that fails or does not answer within TYPECHECK_DAEMON_TIMEOUT is
+killed and restarted; the CLI is only used when the restarted one fails too.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from dotenv import load_dotenv
+
+from verification_cache import cached_verification
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Set TYPECHECK_DAEMON=0 to always use the `npx tsc -b` CLI
+TYPECHECK_DAEMON = os.getenv("TYPECHECK_DAEMON", "1") == "1"
+
+# Seconds to wait for a daemon answer before it is considered wedged and killed
+TYPECHECK_DAEMON_TIMEOUT = float(os.getenv("TYPECHECK_DAEMON_TIMEOUT", 180))
+# Restarts after a daemon failure before falling back to the CLI for the rest of the process
+TYPECHECK_DAEMON_RESTARTS = int(os.getenv("TYPECHECK_DAEMON_RESTARTS", 1))
+
+CHECKER_SCRIPT_PATH = Path(__file__).parent / "TS_checker/checker.js"
+
+# Caps how many diagnostics per file end up in a repair prompt
+TSC_MAX_DIAGNOSTICS_PER_FILE = int(os.getenv("TSC_MAX_DIAGNOSTICS_PER_FILE", 8))
+
+# One compiler diagnostic. `file` is relative to the project root (None for global/config
+# diagnostics); `related` is a tuple of RelatedSpan ("The expected type comes from ...").
+TypeDiagnostic = namedtuple('TypeDiagnostic', ['file', 'line', 'column', 'code', 'category', 'message', 'related'])
+RelatedSpan = namedtuple('RelatedSpan', ['file', 'line', 'column', 'message'])
+
+# `src/App.tsx(12,5): error TS2322: message` or `error TS6053: message`
+_TSC_LINE_PATTERN = re.compile(r'^(?:(.+?)\((\d+),(\d+)\):\s+)?(error|warning|message|suggestion)\s+TS(\d+):\s?(.*)$')
+
+
+def _normalize_path(file_path: str, project_root: Path) -> str:
+    """Project-relative posix path for a compiler-reported file (kept as-is if outside the project)."""
+    try:
+        return (project_root / file_path).resolve().relative_to(project_root).as_posix()
+    except Exception:
+        return Path(file_path).as_posix()
+
+
+def diagnostics_from_records(records: List[Dict[str, Any]]) -> List[TypeDiagnostic]:
+    """Builds deduplicated TypeDiagnostics from the daemon's JSON records."""
+    diagnostics = [
+        TypeDiagnostic(
+            file=r.get("file"),
+            line=r.get("line"),
+            column=r.get("column"),
+            code=r.get("code"),
+            category=r.get("category"),
+            message=r.get("message", ""),
+            related=tuple(
+                RelatedSpan(x.get("file"), x.get("line"), x.get("column"), x.get("message", ""))
+                for x in r.get("related") or []
+            ),
+        )
+        for r in records
+    ]
+    return dedupe_diagnostics(diagnostics)
+
+
+def parse_tsc_output(output: str, project_root: Path) -> List[TypeDiagnostic]:
+    """
+    Parses `tsc --pretty false` text into TypeDiagnostics. Only used for the CLI fallback;
+    indented continuation lines are folded into the preceding message.
+    """
+    diagnostics: List[TypeDiagnostic] = []
+    current: Optional[Dict[str, Any]] = None
+
+    for line in output.splitlines():
+        m = _TSC_LINE_PATTERN.match(line.strip())
+        if m:
+            if current:
+                diagnostics.append(TypeDiagnostic(**current))
+            file_path, line_no, column, category, code, message = m.groups()
+            current = {
+                "file": _normalize_path(file_path, project_root) if file_path else None,
+                "line": int(line_no) if line_no else None,
+                "column": int(column) if column else None,
+                "code": int(code),
+                "category": category,
+                "message": message,
+                "related": (),
+            }
+        elif current and line.startswith(" ") and line.strip():
+            current["message"] += "\n" + line.strip()
+    if current:
+        diagnostics.append(TypeDiagnostic(**current))
+
+    return dedupe_diagnostics(diagnostics)
+
+
+def dedupe_diagnostics(diagnostics: List[TypeDiagnostic]) -> List[TypeDiagnostic]:
+    """
+    Drops repeated diagnostics, keeping the first occurrence. `tsc -b` reports a file once
+    per referenced project that includes it, so duplicates are common.
+    """
+    seen = set()
+    unique = []
+    for d in diagnostics:
+        key = (d.file, d.line, d.column, d.code, d.message)
+        if key not in seen:
+            seen.add(key)
+            unique.append(d)
+    return unique
+
+
+def group_diagnostics_by_file(diagnostics: List[TypeDiagnostic]) -> Dict[Optional[str], List[TypeDiagnostic]]:
+    """Groups diagnostics per file, files sorted, diagnostics by position."""
+    groups: Dict[Optional[str], List[TypeDiagnostic]] = {}
+    for d in diagnostics:
+        groups.setdefault(d.file, []).append(d)
+    return {
+        f: sorted(groups[f], key=lambda d: (d.line or 0, d.column or 0))
+        for f in sorted(groups, key=lambda f: (f is not None, f or ""))
+    }
+
+
+def files_with_errors(diagnostics: List[TypeDiagnostic]) -> List[str]:
+    """Sorted project files that have at least one error."""
+    return sorted({d.file for d in diagnostics if d.category == "error" and d.file})
+
+
+def format_diagnostic(diagnostic: TypeDiagnostic) -> str:
+    """Renders a diagnostic exactly like `tsc --pretty false`."""
+    head = f"{diagnostic.category} TS{diagnostic.code}: {diagnostic.message}"
+    if diagnostic.file:
+        return f"{diagnostic.file}({diagnostic.line},{diagnostic.column}): {head}"
+    return head
+
+
+def format_diagnostics_for_prompt(diagnostics: List[TypeDiagnostic], max_per_file: int = TSC_MAX_DIAGNOSTICS_PER_FILE) -> str:
+    """
+    Compact, per-file rendering of the errors for repair prompts. Warnings are left out,
+    file paths are printed once per group and related spans are indented below their error.
+    """
+    errors = [d for d in diagnostics if d.category == "error"]
+    lines: List[str] = []
+    for file, group in group_diagnostics_by_file(errors).items():
+        lines.append(f"{file or '(project)'}: {len(group)} error(s)")
+        for d in group[:max_per_file]:
+            position = f"{d.line}:{d.column} " if d.line else ""
+            message = d.message.replace("\n", "\n    ")
+            lines.append(f"  {position}TS{d.code}: {message}")
+            for r in d.related:
+                where = f"{r.file}:{r.line}:{r.column}" if r.file else "(project)"
+                lines.append(f"    related {where}: {r.message}")
+        if len(group) > max_per_file:
+            lines.append(f"  ... {len(group) - max_per_file} more in this file")
+    return "\n".join(lines)
+
+
+class TypeCheckService:
+    """
+    Runs TypeScript checks for one project.
+
+    The daemon answers with structured diagnostics; they are also rendered in the
+    exact `--pretty false` text format of tsc so existing consumers keep working.
+    """
+
+    def __init__(self, project_root: str, use_daemon: bool = TYPECHECK_DAEMON, timeout: float = TYPECHECK_DAEMON_TIMEOUT):
+        self.project_root = str(Path(project_root).resolve())
+        self.use_daemon = use_daemon
+        self.timeout = timeout
+        self._process: Optional[subprocess.Popen] = None
+        # Lines of the daemon's stdout, filled by a reader thread so reads can time out
+        self._lines: Optional["queue.Queue[Optional[str]]"] = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    # ---------------- Public API ---------------- #
+
+    @property
+    def supports_overlay(self) -> bool:
+        """Whether check() can type-check in-memory contents (only the daemon can)."""
+        return self.use_daemon and shutil.which("node") is not None
+
+    def check(self, changed_files: Optional[List[str]] = None,
+              overlay: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+        """
+        Type-checks the whole project.
+
+        Args:
+            changed_files: Paths (relative to the project root) known to have changed.
+                A hint only; the daemon also notices other modified files by mtime.
+            overlay: Proposed contents to check instead of the files on disk, by path
+                relative to the project root; None marks a file as deleted. Requires
+                the daemon: without it the result has "available": False.
+
+        Returns:
+            {
+                "success": bool,
+                "errors": str,                         # tsc-style text output, "" on success
+                "diagnostics": List[TypeDiagnostic],   # deduplicated, in compiler order
+                "available": bool                      # False if no checker could be run at all
+            }
+        """
+        check_name = "typecheck"
+        if overlay:
+            # The disk fingerprint plus the overlay identifies what is checked
+            overlay_digest = hashlib.sha256(json.dumps(overlay, sort_keys=True).encode("utf-8")).hexdigest()
+            check_name = f"typecheck-overlay-{overlay_digest}"
+
+        # Identical project contents always type-check the same way
+        return cached_verification(
+            check_name,
+            self.project_root,
+            lambda: self._run_check(changed_files or [], overlay or {}),
+            should_cache=lambda result: result["available"],
+        )
+
+    def _run_check(self, changed_files: List[str], overlay: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        with self._lock:
+            for attempt in range(TYPECHECK_DAEMON_RESTARTS + 1):
+                if not self.use_daemon:
+                    break
+                try:
+                    return self._check_with_daemon(changed_files, overlay)
+                except Exception as e:
+                    self._stop_daemon()
+                    if attempt < TYPECHECK_DAEMON_RESTARTS:
+                        logger.warning(f"Type-check daemon failed, restarting it: {e}")
+                    else:
+                        logger.warning(f"Type-check daemon failed again, falling back to the tsc CLI: {e}")
+                        self.use_daemon = False
+            if overlay:
+                # The CLI can only check what is on disk
+                return {"success": False, "errors": "In-memory type checking needs the type-check daemon.", "diagnostics": [], "available": False}
+            return self._check_with_cli()
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop_daemon()
+
+    # ---------------- Daemon ---------------- #
+
+    def _start_daemon(self) -> None:
+        node = shutil.which("node")
+        if not node:
+            raise RuntimeError("Could not find 'node' in PATH.")
+
+        logger.info(f"Starting type-check daemon for {self.project_root}")
+        self._process = subprocess.Popen(
+            [node, str(CHECKER_SCRIPT_PATH), self.project_root],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_lines, args=(self._process, self._lines), name="typecheck-daemon-reader", daemon=True).start()
+        handshake = self._read_message()
+        if not handshake.get("ready"):
+            self._stop_daemon()
+            raise RuntimeError(handshake.get("error") or "Type-check daemon failed to start.")
+        logger.info(f"Type-check daemon ready (TypeScript {handshake.get('version')}).")
+
+    def _stop_daemon(self) -> None:
+        if self._process is None:
+            return
+        try:
+            self._process.stdin.close()
+            self._process.wait(timeout=2)
+        except Exception:
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+        self._lines = None
+
+    @staticmethod
+    def _read_lines(process: subprocess.Popen, lines: "queue.Queue[Optional[str]]") -> None:
+        try:
+            for line in process.stdout:
+                lines.put(line)
+        except (OSError, ValueError):
+            pass
+        # End of output: the daemon exited or was killed
+        lines.put(None)
+
+    def _read_message(self) -> Dict[str, Any]:
+        try:
+            line = self._lines.get(timeout=self.timeout)
+        except queue.Empty:
+            # A wedged checker would otherwise block apply_changes (and its locks) forever
+            self._process.kill()
+            raise TimeoutError(f"Type-check daemon did not answer within {self.timeout:g}s.")
+        if not line:
+            raise RuntimeError("Type-check daemon exited unexpectedly.")
+        return json.loads(line)
+
+    def _check_with_daemon(self, changed_files: List[str], overlay: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        if self._process is None or self._process.poll() is not None:
+            self._start_daemon()
+
+        self._next_id += 1
+        request = {
+            "id": self._next_id,
+            "cmd": "check",
+            "changed": [str(Path(self.project_root) / p) for p in changed_files],
+        }
+        if overlay:
+            request["overlay"] = {str(Path(self.project_root) / p): content for p, content in overlay.items()}
+        self._process.stdin.write(json.dumps(request) + "\n")
+        self._process.stdin.flush()
+
+        response = self._read_message()
+        if response.get("id") != request["id"]:
+            raise RuntimeError(f"Type-check daemon answered request {response.get('id')}, expected {request['id']}.")
+        if response.get("error"):
+            raise RuntimeError(response["error"])
+
+        diagnostics = diagnostics_from_records(response.get("diagnostics", []))
+        has_errors = any(d.category == "error" for d in diagnostics)
+        return {
+            "success": not has_errors,
+            "errors": "\n".join(format_diagnostic(d) for d in diagnostics) if has_errors else "",
+            "diagnostics": diagnostics,
+            "available": True,
+        }
+
+    # ---------------- CLI fallback ---------------- #
+
+    def _check_with_cli(self) -> Dict[str, Any]:
+        # Use npx to ensure the project's version of typescript is used
+        tsc_command = shutil.which("npx")
+        if not tsc_command:
+            return {"success": False, "errors": "Could not find 'npx' in PATH. Please ensure Node.js is installed.", "diagnostics": [], "available": False}
+
+        cmd = [tsc_command, "tsc", "-b", "--noEmit", "--pretty", "false"]
+
+        try:
+            logger.info(f"Running project syntax check with command: {' '.join(cmd)}")
+            subprocess.run(cmd, cwd=self.project_root, check=True, capture_output=True, text=True, encoding='utf-8')
+            return {"success": True, "errors": "", "diagnostics": [], "available": True}
+        except subprocess.CalledProcessError as e:
+            # Combine stderr and stdout for a complete error picture
+            error_output = (e.stderr or "") + (e.stdout or "")
+            diagnostics = parse_tsc_output(error_output, Path(self.project_root))
+            return {"success": False, "errors": error_output, "diagnostics": diagnostics, "available": True}
+        except FileNotFoundError:
+            return {"success": False, "errors": "Command 'npx' not found. Is Node.js installed and in your PATH?", "diagnostics": [], "available": False}
+
+
+_services: Dict[str, TypeCheckService] = {}
+_services_lock = threading.Lock()
+
+
+def get_typecheck_service(project_root: str) -> TypeCheckService:
+    """Returns the shared TypeCheckService for a project, so all callers reuse one warm daemon."""
+    key = str(Path(project_root).resolve())
+    with _services_lock:
+        if key not in _services:
+            _services[key] = TypeCheckService(key)
+        return _services[key]
+
+
+if __name__ == "__main__":
+    import time
+
+    service = get_typecheck_service("../app_template/react-app")
+    for i in range(3):
+        start = time.perf_counter()
+        result = service.check()
+        print(f"Check {i + 1}: success={result['success']} in {time.perf_counter() - start:.2f}s")
+    print(format_diagnostics_for_prompt(result["diagnostics"]))
+    service.close()
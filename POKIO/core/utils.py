@@ -1,9 +1,10 @@
 import logging
 import os
-import shutil
 from enum import Enum
 from typing import List, Dict, Any
-import json
+import json_codec
+from snapshot_store import mirror_directory
+from conversation_journal import CONVERSATION_JOURNAL, get_journal, journal_path_for
 
 logger = logging.getLogger(__name__)
 class OrchestratorState(Enum):
@@ -16,19 +17,12 @@ class OrchestratorState(Enum):
 
 def initiliaze_react_app(src: str, dest: str):
     """
-    Copies the directory from src to dest.
-    If the destination directory exists, it is removed before copying.
+    Resets the directory dest to the contents of src.
+    Only files that differ are copied and files src does not have are removed.
     """
     try:
-        if not os.path.exists(src):
-            raise FileNotFoundError(f"Source directory '{src}' does not exist.")
-
-        if os.path.exists(dest):
-            logger.info(f"Destination '{dest}' exists. Removing it...")
-            shutil.rmtree(dest)
-
-        shutil.copytree(src, dest)
-        logger.info(f"Successfully copied '{src}' to '{dest}'.")
+        stats = mirror_directory(src, dest)
+        logger.info(f"Successfully reset '{dest}' to '{src}' ({stats['written']} file(s) copied, {stats['removed']} removed).")
 
     except Exception as error:
         logger.exception(f"An error occurred: {error}")
@@ -58,7 +52,7 @@ def format_file_blobs(blobs: List[Dict[str, str]]) -> str:
 
 def stringify_errors(errors: Any, max_chars: int = 5000) -> str:
     try:
-        s = errors if isinstance(errors, str) else json.dumps(errors, indent=2, ensure_ascii=False)
+        s = errors if isinstance(errors, str) else json_codec.dumps(errors, indent=2, ensure_ascii=False)
     except Exception:
         s = str(errors)
     # keep prompts reasonable in size
@@ -68,21 +62,33 @@ def save_in_file(content: Any, filename: str):
     try:
         with open(filename, 'a', encoding='utf-8') as f:
             if isinstance(content, dict):
-                f.write(json.dumps(content, indent=2, ensure_ascii=False) + "\n")
+                f.write(json_codec.dumps(content, indent=2, ensure_ascii=False) + "\n")
             else:
                     f.write(str(content) + "\n")
     except IOError as e:
         print(f"Error: Could not write to file {filename}. Reason: {e}")
         
 
-def save_conversation(messages: List[Dict[str, str]], filename: str, token_usage: str = 0, duration: float = 0.0):
+def save_conversation(messages: List[Dict[str, str]], filename: str, token_usage: str = 0, duration: float = 0.0,
+                      journal: bool = CONVERSATION_JOURNAL):
+    """
+    Logs the current message memory. By default only the messages not logged yet are appended
+    to the journal next to `filename` (.jsonl, see conversation_journal); render_markdown()
+    rebuilds `filename`'s Markdown view. With journal=False the whole memory is appended as Markdown.
+    """
+    if journal:
+        try:
+            get_journal(journal_path_for(filename)).record_turn(messages, token_usage, duration)
+        except (IOError, TypeError, ValueError) as e:
+            print(f"Error: Could not write to file {journal_path_for(filename)}. Reason: {e}")
+        return
     try:
         with open(filename, 'a', encoding='utf-8') as f:
             f.write("\n# New turn:\n")
             for message in messages:
                 # if isinstance(message, dict) and message.get("role", {}) == "system":
                 #     continue
-                f.write(f"\n```json\n{json.dumps(message, indent=2, ensure_ascii=False)}\n```\n")
+                f.write(f"\n```json\n{json_codec.dumps(message, indent=2, ensure_ascii=False)}\n```\n")
             f.write(f"Tokens used: {token_usage}" + "\n")
             f.write(f"Time taken {duration:.2f}" + "\n")
     except IOError as e:
@@ -0,0 +1,141 @@
+"""
+Verification cache for POKIO system.
+Remembers the results of whole-project checks (type check, lint) keyed by a
+fingerprint of the project's file contents, so a check that already ran against
+identical files is not run again. Shared by FileOperationsService,
+logging_service and everything that goes through them.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Set VERIFICATION_CACHE=0 to always re-run every check
+VERIFICATION_CACHE = os.getenv("VERIFICATION_CACHE", "1") == "1"
+VERIFICATION_CACHE_SIZE = int(os.getenv("VERIFICATION_CACHE_SIZE", 32))
+
+# Generated or tool-owned directories that do not influence check results
+FINGERPRINT_IGNORED_DIRS = {'.git', 'node_modules', 'dist', 'build', '__pycache__', '.pokio', '.vite'}
+
+HashEntry = namedtuple('HashEntry', ['mtime_ns', 'size', 'sha256'])
+
+
+class VerificationCache:
+    """
+    LRU of check results keyed by (check name, project fingerprint).
+
+    The fingerprint hashes every project file; file hashes are cached by
+    (mtime_ns, size), so after the first call only modified files are re-read.
+    """
+
+    def __init__(self, max_entries: int = VERIFICATION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self._hashes: Dict[str, HashEntry] = {}
+        self._lock = threading.Lock()
+
+    def fingerprint(self, project_root: str) -> str:
+        """Content fingerprint of all files under `project_root` except ignored directories."""
+        root = Path(project_root).resolve()
+        digest = hashlib.sha256()
+        seen = set()
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in FINGERPRINT_IGNORED_DIRS)
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(path)
+                file_hash = self._file_hash(path, stat)
+                if file_hash is None:
+                    continue
+                digest.update(os.path.relpath(path, root).encode("utf-8"))
+                digest.update(b"\0")
+                digest.update(file_hash.encode("ascii"))
+                digest.update(b"\n")
+
+        with self._lock:
+            for path in [p for p in self._hashes if p.startswith(str(root)) and p not in seen]:
+                del self._hashes[path]
+        return digest.hexdigest()
+
+    def _file_hash(self, path: str, stat: os.stat_result) -> Optional[str]:
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached and cached.mtime_ns == stat.st_mtime_ns and cached.size == stat.st_size:
+            return cached.sha256
+
+        try:
+            with open(path, "rb") as f:
+                file_hash = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        with self._lock:
+            self._hashes[path] = HashEntry(stat.st_mtime_ns, stat.st_size, file_hash)
+        return file_hash
+
+    def get_or_run(self, check_name: str, project_root: str, run: Callable[[], Any],
+                   should_cache: Callable[[Any], bool] = lambda result: True) -> Any:
+        """
+        Returns the cached result of `check_name` for the current project contents,
+        or calls `run()` and caches what it returns.
+
+        A result is only stored if the files did not change while `run()` was
+        executing and `should_cache(result)` agrees (e.g. not for "npx not found").
+        """
+        before = self.fingerprint(project_root)
+        key = (check_name, before)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                logger.info(f"Reusing '{check_name}' result for unchanged project contents ({before[:12]}).")
+                return self._results[key]
+
+        result = run()
+
+        if should_cache(result) and self.fingerprint(project_root) == before:
+            with self._lock:
+                self._results[key] = result
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+_cache = VerificationCache()
+
+
+def cached_verification(check_name: str, project_root: str, run: Callable[[], Any],
+                        should_cache: Callable[[Any], bool] = lambda result: True) -> Any:
+    """Runs `run` through the shared VerificationCache (or directly if VERIFICATION_CACHE=0)."""
+    if not VERIFICATION_CACHE:
+        return run()
+    return _cache.get_or_run(check_name, project_root, run, should_cache)
+
+
+if __name__ == "__main__":
+    import time
+
+    cache = VerificationCache()
+    for i in range(3):
+        start = time.perf_counter()
+        fingerprint = cache.fingerprint("../app_template/react-app")
+        print(f"Fingerprint {i + 1}: {fingerprint[:16]} in {time.perf_counter() - start:.4f}s")
@@ -6,15 +6,48 @@ Prioritizes actual tool calls over other code blocks.
 Enhanced to support review responses and improved JSON blob extraction.
 """
 import json
+from collections import namedtuple
 from typing import Dict, Any, Tuple, Optional
 import logging
 from json_repair import repair_json
+import json_codec
 import re
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# `parsed` is the decoded blob, or None when it has not been (successfully) parsed yet
+JsonCandidate = namedtuple('JsonCandidate', ['blob', 'remaining', 'parsed'])
+
+_FENCE_PATTERN = re.compile(r"```(?:json)?\s*\n(.*?)\n```", re.DOTALL)
+# In priority order
+_ROOT_KEY_PATTERNS = [
+    re.compile(r'\{\s*"tool_name"\s*:'),
+    re.compile(r'\{\s*"plan_title"\s*:'),
+    re.compile(r'\{\s*"review_decision"\s*:'),
+]
+# A JSON string (possibly unterminated) or a brace; the regex engine skips everything else
+_BRACE_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*\\?(?:"|\Z)|[{}]', re.DOTALL)
+
+
+def _match_braces(text: str, start: int) -> int:
+    """
+    Returns the index after the brace closing the one at `start`, ignoring braces
+    inside strings, or len(text) when it is never closed.
+    """
+    level = 0
+    for token in _BRACE_TOKEN_PATTERN.finditer(text, start):
+        char = text[token.start()]
+        if char == '{':
+            level += 1
+        elif char == '}':
+            level -= 1
+            if level == 0:
+                return token.end()
+    return len(text)
+
+
 class VerificationService:
     """Enhanced service to verify model output formatting and classification."""
     
@@ -29,6 +62,7 @@ class VerificationService:
         self.required_plan_keys = ["plan_title", "overview", "steps"]
         self.required_review_keys = ["review_decision"]
         self.valid_review_decisions = {"approved", "rejected"}
+        self._decoder = json.JSONDecoder()
 
     def fix_escape_sequences(self, json_string: str) -> str:
         """Fix invalid escape sequences while preserving valid ones."""
@@ -67,7 +101,8 @@ class VerificationService:
 
         try:
             # Step 1: Extract JSON using the enhanced multi-strategy approach
-            json_blob, remaining_text = self._extract_json_blob(response_text)
+            candidate = self._scan_response(response_text)
+            json_blob = candidate.blob
             
             if not json_blob:
                 raise ValueError("No valid JSON blob found in response")
@@ -75,7 +110,7 @@ class VerificationService:
             # Step 2: Attempt to parse the blob. We no longer repair and continue.
             # We only parse to see if it's valid or not.
             try:
-                parsed_json = json.loads(json_blob)
+                parsed_json = candidate.parsed if candidate.parsed is not None else json_codec.loads(json_blob)
             except json.JSONDecodeError as e:
                 # THIS IS THE KEY CHANGE: If parsing fails, it's an immediate error.
                 # We log the attempt to repair for debugging, but we return the original error.
@@ -86,7 +121,7 @@ class VerificationService:
                 try:
                     fixed_blob = self.fix_escape_sequences(json_blob)
                     logger.info("Attempting auto JSON repair.")
-                    parsed_json = json.loads(repair_json(fixed_blob))
+                    parsed_json = json_codec.loads(repair_json(fixed_blob))
                     is_repaired = True
                     logger.info("Auto-repair succeeded.")
                 except Exception:
@@ -158,233 +193,100 @@ class VerificationService:
             raise ValueError(f"Cannot determine response type. Available keys: {list(parsed_json.keys())}")
 
     def _extract_json_blob(self, text: str) -> Tuple[str, str]:
+        """Returns the JSON blob of the response and the text around it (see _scan_response)."""
+        candidate = self._scan_response(text)
+        return candidate.blob, candidate.remaining
+
+    def _scan_response(self, text: str) -> JsonCandidate:
         """
-        Enhanced extraction using a prioritized multi-strategy approach:
-        1. Look for JSON tool calls in markdown code fences (prioritized)
-        2. Look for JSON plans in markdown code fences (prioritized)
-        3. Look for JSON reviews in markdown code fences (prioritized)
-        4. Find JSON object by its root key {"tool_name":, {"plan_title":, or {"review_decision": (prioritized)
-        5. Look for any JSON in markdown code fences (fallback)
-        6. Treat entire response as JSON blob (last resort)
+        Finds the JSON blob of a response in a single pass over its code fences, using a
+        prioritized multi-strategy approach:
+        1. A tool call in a markdown code fence
+        2. A plan in a markdown code fence
+        3. A review in a markdown code fence
+        4. A JSON object by its root key {"tool_name":, {"plan_title":, or {"review_decision":
+        5. Any tool call, plan or review JSON in the first markdown code fence (fallback)
+        6. The entire response (last resort)
+
+        Every fence is parsed at most once and the parsed object is returned with the
+        blob, so verify_response does not parse it again.
         """
-        
-        # Strategy 1: Look specifically for tool call JSON in markdown
-        tool_call_json = self._extract_tool_call_from_markdown(text)
-        if tool_call_json:
-            logger.info("Extracted tool call JSON from markdown code fence")
-            remaining = self._remove_extracted_json_from_text(text, tool_call_json)
-            return tool_call_json, remaining
-            
-        # Strategy 2: Look specifically for plan JSON in markdown
-        plan_json = self._extract_plan_from_markdown(text)
-        if plan_json:
-            logger.info("Extracted plan JSON from markdown code fence")
-            remaining = self._remove_extracted_json_from_text(text, plan_json)
-            return plan_json, remaining
-
-        # Strategy 3: Look specifically for review JSON in markdown
-        review_json = self._extract_review_from_markdown(text)
-        if review_json:
-            logger.info("Extracted review JSON from markdown code fence")
-            remaining = self._remove_extracted_json_from_text(text, review_json)
-            return review_json, remaining
-        
-        # Strategy 4: Find JSON blob by root key (most reliable for tool calls, plans, and reviews)
+        fences = [(match.start(), match.end(), match.group(1).strip()) for match in _FENCE_PATTERN.finditer(text)]
+        parsed_fences: Dict[int, Any] = {}
+
+        def parse_fence(index: int) -> Any:
+            if index not in parsed_fences:
+                try:
+                    parsed_fences[index] = json_codec.loads(fences[index][2])
+                except ValueError:
+                    parsed_fences[index] = None
+            return parsed_fences[index]
+
+        def fence_candidate(index: int) -> JsonCandidate:
+            fence_start, fence_end, content = fences[index]
+            remaining = (text[:fence_start] + text[fence_end:]).strip()
+            return JsonCandidate(content, remaining, parsed_fences[index])
+
+        # Strategies 1-3: tool call, plan, review in markdown code fences
+        for key, label in (("tool_name", "tool call"), ("plan_title", "plan"), ("review_decision", "review")):
+            marker = f'"{key}"'
+            for index, (_, _, content) in enumerate(fences):
+                # Quick substring check before parsing
+                if marker in content and self._is_root_object(key, parse_fence(index)):
+                    logger.info(f"Extracted {label} JSON from markdown code fence")
+                    return fence_candidate(index)
+
+        # Strategy 4: JSON object by its root key
         try:
-            json_blob, remaining_text = self._find_json_blob(text)
+            candidate = self._find_json_candidate(text)
             logger.info("Extracted JSON using root key pattern matching")
-            return json_blob, remaining_text
+            return candidate
         except ValueError:
             pass
-        
-        # Strategy 5: Extract any JSON from markdown (fallback)
-        markdown_json = self._extract_from_markdown(text)
-        if markdown_json:
-            # Validate this is actually a tool call, plan, or review
-            try:
-                parsed = json.loads(markdown_json)
-                if isinstance(parsed, dict) and ("tool_name" in parsed or "plan_title" in parsed or "review_decision" in parsed):
-                    logger.info("Extracted valid tool call, plan, or review JSON from generic markdown code fence")
-                    remaining = self._remove_extracted_json_from_text(text, markdown_json)
-                    return markdown_json, remaining
-            except:
-                pass
-        
-        # Strategy 6: Treat entire text as JSON (last resort)
-        logger.info("Treating entire response as JSON blob")
-        return text.strip(), ""
 
-    def _extract_tool_call_from_markdown(self, text: str) -> Optional[str]:
-        """
-        Extract JSON specifically containing tool calls from markdown code fences.
-        Prioritizes blocks that contain tool_name.
-        """
-        # Find all JSON code blocks
-        pattern = r"```(?:json)?\s*\n(.*?)\n```"
-        matches = re.finditer(pattern, text, re.DOTALL)
-        
-        tool_call_candidates = []
-        
-        for match in matches:
-            json_content = match.group(1).strip()
-            
-            # Quick check if this might be a tool call
-            if '"tool_name"' in json_content:
-                try:
-                    # Try to parse to validate it's proper JSON
-                    parsed = json.loads(json_content)
-                    if isinstance(parsed, dict) and "tool_name" in parsed:
-                        # Check if it's a valid tool name
-                        tool_name = parsed.get("tool_name")
-                        if tool_name in self.valid_tool_names:
-                            tool_call_candidates.append((json_content, tool_name))
-                except:
-                    continue
-        
-        # Return the first valid tool call found
-        if tool_call_candidates:
-            return tool_call_candidates[0][0]
-        
-        return None
+        # Strategy 5: any JSON from the first markdown code fence
+        if fences:
+            parsed = parse_fence(0)
+            if isinstance(parsed, dict) and ("tool_name" in parsed or "plan_title" in parsed or "review_decision" in parsed):
+                logger.info("Extracted valid tool call, plan, or review JSON from generic markdown code fence")
+                return fence_candidate(0)
 
-    def _extract_plan_from_markdown(self, text: str) -> Optional[str]:
-        """
-        Extract JSON specifically containing plans from markdown code fences.
-        Prioritizes blocks that contain plan_title.
-        """
-        # Find all JSON code blocks
-        pattern = r"```(?:json)?\s*\n(.*?)\n```"
-        matches = re.finditer(pattern, text, re.DOTALL)
-        
-        plan_candidates = []
-        
-        for match in matches:
-            json_content = match.group(1).strip()
-            
-            # Quick check if this might be a plan
-            if '"plan_title"' in json_content:
-                try:
-                    # Try to parse to validate it's proper JSON
-                    parsed = json.loads(json_content)
-                    if isinstance(parsed, dict) and "plan_title" in parsed:
-                        plan_candidates.append(json_content)
-                except:
-                    continue
-        
-        # Return the first valid plan found
-        if plan_candidates:
-            return plan_candidates[0]
-        
-        return None
-
-    def _extract_review_from_markdown(self, text: str) -> Optional[str]:
-        """
-        Extract JSON specifically containing reviews from markdown code fences.
-        Prioritizes blocks that contain review_decision.
-        """
-        # Find all JSON code blocks
-        pattern = r"```(?:json)?\s*\n(.*?)\n```"
-        matches = re.finditer(pattern, text, re.DOTALL)
-        
-        review_candidates = []
-        
-        for match in matches:
-            json_content = match.group(1).strip()
-            
-            # Quick check if this might be a review
-            if '"review_decision"' in json_content:
-                try:
-                    # Try to parse to validate it's proper JSON
-                    parsed = json.loads(json_content)
-                    if isinstance(parsed, dict) and "review_decision" in parsed:
-                        # Check if it's a valid review decision
-                        review_decision = parsed.get("review_decision")
-                        if review_decision in self.valid_review_decisions:
-                            review_candidates.append(json_content)
-                except:
-                    continue
-        
-        # Return the first valid review found
-        if review_candidates:
-            return review_candidates[0]
-        
-        return None
-
-    def _extract_from_markdown(self, text: str) -> Optional[str]:
-        """Extracts the first JSON string from a markdown code fence."""
-        pattern = r"```(?:json)?\s*\n(.*?)\n```"
-        match = re.search(pattern, text, re.DOTALL)
-        return match.group(1).strip() if match else None
-
-    def _remove_extracted_json_from_text(self, original_text: str, extracted_json: str) -> str:
-        """Remove the extracted JSON block from the original text."""
-        # Try to find and remove the exact markdown block
-        patterns = [
-            rf"```json\s*\n{re.escape(extracted_json)}\s*\n```",
-            rf"```\s*\n{re.escape(extracted_json)}\s*\n```"
-        ]
-        
-        for pattern in patterns:
-            if re.search(pattern, original_text, re.DOTALL):
-                return re.sub(pattern, "", original_text, flags=re.DOTALL).strip()
-        
-        # Fallback: just remove the JSON content itself
-        return original_text.replace(extracted_json, "").strip()
+        # Strategy 6: treat entire text as JSON
+        logger.info("Treating entire response as JSON blob")
+        return JsonCandidate(text.strip(), "", None)
+
+    def _is_root_object(self, key: str, parsed: Any) -> bool:
+        """Whether `parsed` is a tool call, plan or review identified by its root `key`."""
+        if not isinstance(parsed, dict) or key not in parsed:
+            return False
+        if key == "tool_name":
+            return parsed["tool_name"] in self.valid_tool_names
+        if key == "review_decision":
+            return parsed["review_decision"] in self.valid_review_decisions
+        return True
 
     def _find_json_blob(self, text: str) -> Tuple[str, str]:
         """
         Extracts the first raw JSON string object starting with `{"tool_name":`, `{"plan_title":`, or `{"review_decision":` from a larger text.
         Enhanced to be more robust with whitespace and formatting and support review responses.
         """
-        start_patterns = [
-            r'\{\s*"tool_name"\s*:',
-            r'\{\s*"plan_title"\s*:',
-            r'\{\s*"review_decision"\s*:'
-        ]
-        
-        for start_pattern in start_patterns:
-            match = re.search(start_pattern, text)
+        candidate = self._find_json_candidate(text)
+        return candidate.blob, candidate.remaining
+
+    def _find_json_candidate(self, text: str) -> JsonCandidate:
+        for start_pattern in _ROOT_KEY_PATTERNS:
+            match = start_pattern.search(text)
             if match:
                 start_index = match.start()
-                brace_level = 0
-                end_index = -1
-                search_area = text[start_index:]
-                in_string = False
-                escape_next = False
-                
-                for i, char in enumerate(search_area):
-                    if escape_next:
-                        escape_next = False
-                        continue
-                        
-                    if char == '\\' and in_string:
-                        escape_next = True
-                        continue
-                        
-                    if char == '"' and not escape_next:
-                        in_string = not in_string
-                        continue
-                        
-                    if not in_string:
-                        if char == '{': 
-                            brace_level += 1
-                        elif char == '}': 
-                            brace_level -= 1
-                            
-                        if brace_level == 0:
-                            end_index = i + 1
-                            break
-                
-                if end_index == -1:
-                    json_blob = search_area
-                    absolute_end_index = len(text)
-                else:
-                    json_blob = search_area[:end_index]
-                    absolute_end_index = start_index + end_index
-                
-                remaining_text = text[:start_index] + text[absolute_end_index:]
-                return json_blob, remaining_text.strip()
-        
+                try:
+                    # Valid JSON: the C decoder finds the end and parses in one go
+                    parsed, end_index = self._decoder.raw_decode(text, start_index)
+                except ValueError:
+                    parsed, end_index = None, _match_braces(text, start_index)
+
+                remaining_text = text[:start_index] + text[end_index:]
+                return JsonCandidate(text[start_index:end_index], remaining_text.strip(), parsed)
+
         raise ValueError("No JSON object with a 'tool_name', 'plan_title', or 'review_decision' key found.")
 
     def _validate_review_structure(self, parsed_json: Dict[str, Any]) -> None:
@@ -797,4 +699,41 @@ And here's the actual review:
         print("SUCCESS: Correctly identified raw JSON review!")
     else:
         print("Resulting Error:", data['error'])
-    print("-" * 50)
\ No newline at end of file
+    print("-" * 50)
+
+    print("\n--- Benchmark: verification of recorded responses (docs/logs) ---")
+    import glob
+    import os
+    import time
+    from mock_openrouter import load_recorded_responses
+
+    logging.disable(logging.CRITICAL)
+    log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "docs", "logs")
+    responses = [
+        recorded.content
+        for log_path in sorted(glob.glob(os.path.join(log_dir, "*", "*_logs", "full_conversation.log")))
+        for recorded in load_recorded_responses(log_path)
+    ]
+    # A large write_to_files response: 120 changes of ~1 KB each behind some prose
+    changes = [
+        {"type": "modify", "path": f"src/components/Component{i}.tsx",
+         "differences": ["<<<<<<< SEARCH\n" + "  const value = { a: 1 };\n" * 20 + "=======\n" + "  const value = { a: 2 };\n" * 20 + ">>>>>>> REPLACE"]}
+        for i in range(120)
+    ]
+    large_response = "I will update the components.\n```json\n" + json.dumps(
+        {"tool_name": "write_to_files", "parameters": {"title": "t", "summary": "s", "implementation": "i", "changes": changes}},
+        indent=2,
+    ) + "\n```"
+
+    for label, samples, rounds in (("recorded", responses, 20), ("large write_to_files", [large_response], 20)):
+        if not samples:
+            print(f"{label}: no samples found")
+            continue
+        start = time.perf_counter()
+        valid = 0
+        for _ in range(rounds):
+            valid = sum(service.verify_response(sample)[0] for sample in samples)
+        elapsed = (time.perf_counter() - start) / rounds
+        size_kb = sum(len(sample) for sample in samples) / 1024
+        print(f"{label}: {len(samples)} responses ({size_kb:.0f} KB), {valid} valid, "
+              f"{elapsed * 1000:.2f}ms per pass ({elapsed * 1000 / len(samples):.3f}ms per response)")